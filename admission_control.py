@@ -0,0 +1,123 @@
+"""
+Admission control: a concurrency limit with a bounded wait queue and per-request deadlines
+
+At most max_concurrent requests do real work at once. Up to max_queue more
+wait for a slot; anything beyond that is shed immediately, and a queued
+request whose deadline passes before it gets a slot is shed too. Admitted
+work that runs past its deadline is abandoned by the caller (it keeps its
+slot until it finishes, since the capacity really is in use). In every shed
+case the caller gets a reason instead of a result and serves a degraded
+response.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+SHED_QUEUE_FULL = 'queue_full'
+SHED_QUEUE_TIMEOUT = 'queue_timeout'
+SHED_DEADLINE = 'deadline_exceeded'
+
+
+class AdmissionController:
+    """Run admitted work on a pool of max_concurrent threads; run() returns (result, None) or (None, shed reason)"""
+
+    def __init__(self, max_concurrent, max_queue):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix='admitted')
+        self.active = 0
+        self.queued = 0
+        self.peak_queued = 0
+        self.stats = {}
+
+    def _count(self, endpoint, counter):
+        stats = self.stats.setdefault(endpoint, {'admitted': 0, SHED_QUEUE_FULL: 0, SHED_QUEUE_TIMEOUT: 0, SHED_DEADLINE: 0})
+        stats[counter] += 1
+
+    def _acquire(self, endpoint, deadline):
+        """Take a slot before the deadline (epoch seconds); returns a shed reason if none comes free"""
+        with self._cond:
+            if self.active >= self.max_concurrent and self.queued >= self.max_queue:
+                self._count(endpoint, SHED_QUEUE_FULL)
+                return SHED_QUEUE_FULL
+            self.queued += 1
+            self.peak_queued = max(self.peak_queued, self.queued)
+            try:
+                while self.active >= self.max_concurrent:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._count(endpoint, SHED_QUEUE_TIMEOUT)
+                        return SHED_QUEUE_TIMEOUT
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+            self.active += 1
+            self._count(endpoint, 'admitted')
+            return None
+
+    def _release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    def _run_admitted(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release()
+
+    def run(self, endpoint, timeout, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) within timeout seconds, counting towards endpoint's stats; fn's errors propagate"""
+        deadline = time.time() + timeout
+        reason = self._acquire(endpoint, deadline)
+        if reason:
+            return None, reason
+        future = self._executor.submit(self._run_admitted, fn, args, kwargs)
+        try:
+            return future.result(timeout=max(deadline - time.time(), 0)), None
+        except FutureTimeoutError:
+            with self._cond:
+                self._count(endpoint, SHED_DEADLINE)
+            return None, SHED_DEADLINE
+
+    def snapshot(self):
+        """Queue depth and per-endpoint admitted / shed counters for the metrics endpoint"""
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'active': self.active,
+                'queued': self.queued,
+                'peak_queued': self.peak_queued,
+                'endpoints': {endpoint: dict(counts) for endpoint, counts in self.stats.items()},
+            }
+
+
+class RecentResults:
+    """Bounded LRU of the last successful payload per request key, served (flagged degraded) when a request is shed"""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def put(self, key, payload):
+        with self._lock:
+            self._entries[key] = (payload, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        """(payload, stored_at), or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def __len__(self):
+        return len(self._entries)
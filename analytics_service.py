@@ -0,0 +1,273 @@
+"""
+Server-side analytics for the admin report screen
+
+Streams every user's bookings and food orders plus the cancellation histories
+through collection group queries in one bulk pass, folds each page into daily
+pandas rollups, and answers /analytics for any period from those rollups
+instead of re-reading the raw documents.
+"""
+
+import itertools
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from firebase_auth import service_headers
+from firestore_rest import DEFAULT_PAGE_SIZE, decode_fields, iter_collection_group, parse_timestamp
+from single_flight import SingleFlight
+
+ANALYTICS_PERIODS = {'7d': 7, '30d': 30, '1y': 365}
+CINEMA_BRANDS = ['GSC', 'LFS', 'mmCineplexes', 'TGV', 'MBO']
+
+DAILY_COLUMNS = ['movie_bookings', 'movie_revenue', 'food_orders', 'food_revenue', 'refunds', 'cancellations']
+# breakdown name -> value column summed per (day, key)
+BREAKDOWNS = {
+    'revenue_by_cinema': 'revenue',
+    'showtime_counts': 'count',
+    'movie_booking_counts': 'count',
+    'food_item_counts': 'quantity',
+}
+
+
+def local_day(value):
+    """Calendar day of a Firestore timestamp or ISO date string in server local time, or None"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str):
+        parsed = parse_timestamp(value)
+    else:
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.date()
+
+
+def cinema_brand(cinema):
+    """Extract the cinema brand from a location name (e.g. "GSC 1Utama" -> "GSC")"""
+    for brand in CINEMA_BRANDS:
+        if brand in cinema:
+            return brand
+    return cinema
+
+
+def _number(value):
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def _food_order_day(order):
+    for field in ('orderDate', 'createdAt', 'orderTime'):
+        day = local_day(order.get(field))
+        if day is not None:
+            return day
+    return None
+
+
+class AnalyticsRollups:
+    """Per-day totals and per-day breakdowns, merged page by page while the collections stream in"""
+
+    def __init__(self):
+        self.daily = pd.DataFrame(columns=DAILY_COLUMNS, dtype='float64')
+        empty = pd.MultiIndex.from_tuples([], names=['day', 'key'])
+        self.breakdowns = {name: pd.Series(index=empty, dtype='float64') for name in BREAKDOWNS}
+        self.documents = 0
+        self.built_at = 0
+
+    def _merge_daily(self, rows, columns):
+        if not rows:
+            return
+        frame = pd.DataFrame(rows, columns=['day'] + columns).groupby('day').sum()
+        self.daily = self.daily.add(frame.reindex(columns=DAILY_COLUMNS, fill_value=0.0), fill_value=0.0)
+
+    def _merge_breakdown(self, name, rows):
+        if not rows:
+            return
+        series = pd.DataFrame(rows, columns=['day', 'key', 'value']).groupby(['day', 'key'])['value'].sum()
+        self.breakdowns[name] = self.breakdowns[name].add(series, fill_value=0.0)
+
+    def add_bookings(self, bookings):
+        daily, cinemas, showtimes, movies = [], [], [], []
+        for booking in bookings:
+            day = local_day(booking.get('bookingDate'))
+            if day is None:
+                continue
+            price = _number(booking.get('totalPrice'))
+            daily.append((day, 1, price))
+            cinemas.append((day, cinema_brand(booking.get('cinema') or 'Unknown'), price))
+            showtimes.append((day, booking.get('time') or 'Unknown', 1))
+            movies.append((day, booking.get('movieTitle') or 'Unknown Movie', 1))
+        self._merge_daily(daily, ['movie_bookings', 'movie_revenue'])
+        self._merge_breakdown('revenue_by_cinema', cinemas)
+        self._merge_breakdown('showtime_counts', showtimes)
+        self._merge_breakdown('movie_booking_counts', movies)
+
+    def add_food_orders(self, orders):
+        daily, items = [], []
+        for order in orders:
+            day = _food_order_day(order)
+            if day is None:
+                continue
+            daily.append((day, 1, _number(order.get('total'))))
+            for item in order.get('items') or []:
+                if isinstance(item, dict):
+                    items.append((day, item.get('title') or 'Unknown', int(_number(item.get('quantity')))))
+        self._merge_daily(daily, ['food_orders', 'food_revenue'])
+        self._merge_breakdown('food_item_counts', items)
+
+    def add_cancellations(self, cancellations):
+        daily = []
+        for cancellation in cancellations:
+            day = local_day(cancellation.get('cancellationRequestTime'))
+            if day is not None:
+                daily.append((day, 1, _number(cancellation.get('refundAmount'))))
+        self._merge_daily(daily, ['cancellations', 'refunds'])
+
+    def monthly(self, daily=None):
+        """Calendar-month rollup of the daily totals (or of a window of them)"""
+        daily = self.daily if daily is None else daily
+        if daily.empty:
+            return daily
+        months = pd.PeriodIndex(pd.to_datetime(daily.index), freq='M')
+        return daily.groupby(months).sum()
+
+    def report(self, period='7d', now=None):
+        """The admin analytics report for the trailing period, in the shape AnalyticsReportScreen renders"""
+        now = now or datetime.now()
+        days = ANALYTICS_PERIODS[period]
+        start_day = (now - timedelta(days=days)).date()
+        today = now.date()
+
+        daily = self.daily[(self.daily.index >= start_day) & (self.daily.index <= today)] if not self.daily.empty else self.daily
+        totals = daily.sum().reindex(DAILY_COLUMNS, fill_value=0.0)
+
+        breakdowns = {}
+        for name, series in self.breakdowns.items():
+            if series.empty:
+                breakdowns[name] = {}
+                continue
+            window_days = series.index.get_level_values('day')
+            in_window = series[(window_days >= start_day) & (window_days <= today)]
+            summed = in_window.groupby(level='key').sum().sort_values(ascending=False)
+            if BREAKDOWNS[name] == 'revenue':
+                breakdowns[name] = {key: float(value) for key, value in summed.items()}
+            else:
+                breakdowns[name] = {key: int(value) for key, value in summed.items()}
+
+        if period == '1y':
+            # Monthly buckets stepping back 30 days at a time, as the screen lays out its chart
+            buckets = [now - timedelta(days=i * 30) for i in range(11, -1, -1)]
+            labels = {f"{d.month}/{d.year}": 0.0 for d in buckets}
+            monthly = self.monthly(daily)
+            revenue = monthly['movie_revenue'] + monthly['food_revenue'] if not monthly.empty else pd.Series(dtype='float64')
+            for month, value in revenue.items():
+                label = f"{month.month}/{month.year}"
+                if label in labels:
+                    labels[label] += float(value)
+        else:
+            revenue = daily['movie_revenue'] + daily['food_revenue'] if not daily.empty else pd.Series(dtype='float64')
+            buckets = [now - timedelta(days=i) for i in range(days - 1, -1, -1)]
+            labels = {f"{d.day}/{d.month}": 0.0 for d in buckets}
+            for day, value in revenue.items():
+                label = f"{day.day}/{day.month}"
+                if label in labels:
+                    labels[label] += float(value)
+
+        movie_bookings = int(totals['movie_bookings'])
+        food_orders = int(totals['food_orders'])
+        movie_revenue = float(totals['movie_revenue'])
+        food_revenue = float(totals['food_revenue'])
+        refunds = float(totals['refunds'])
+        cancellations = int(totals['cancellations'])
+        total_orders = movie_bookings + food_orders
+
+        return {
+            'period': period,
+            'totalMovieBookings': movie_bookings,
+            'totalFoodOrders': food_orders,
+            'totalMovieRevenue': movie_revenue,
+            'totalFoodRevenue': food_revenue,
+            'totalRefunds': refunds,
+            'netRevenue': movie_revenue + food_revenue - refunds,
+            'revenueByCinema': breakdowns['revenue_by_cinema'],
+            'showtimeCounts': breakdowns['showtime_counts'],
+            'foodItemCounts': breakdowns['food_item_counts'],
+            'movieBookingCounts': breakdowns['movie_booking_counts'],
+            'dailyRevenue': labels,
+            'cancellationRate': (cancellations / total_orders) * 100 if total_orders > 0 else 0.0,
+            'avgMovieOrderValue': movie_revenue / movie_bookings if movie_bookings > 0 else 0.0,
+            'avgFoodOrderValue': food_revenue / food_orders if food_orders > 0 else 0.0,
+            'totalOrders': total_orders,
+            'totalCancellations': cancellations,
+            'generatedAt': self.built_at,
+        }
+
+
+def _pages(documents, page_size):
+    """Decode a document stream in page-sized batches so rollups never hold the raw collection"""
+    documents = iter(documents)
+    while True:
+        page = [decode_fields(doc) for doc in itertools.islice(documents, page_size)]
+        if not page:
+            return
+        yield page
+
+
+def build_rollups(page_size=DEFAULT_PAGE_SIZE, session=None, base_url=None, headers=None):
+    """One streamed pass over bookings, food orders and both cancellation histories (admin-only paths,
+    so against Firestore headers must carry service credentials)"""
+    rollups = AnalyticsRollups()
+    sources = [
+        ('bookings', rollups.add_bookings),
+        ('food_orders', rollups.add_food_orders),
+        # Collection groups also pick up the admins/system fallback copies BookingService writes
+        ('cancellation_history', rollups.add_cancellations),
+        ('food_cancellation_history', rollups.add_cancellations),
+    ]
+    for collection_id, add in sources:
+        documents = iter_collection_group(collection_id, page_size=page_size, session=session, base_url=base_url,
+                                          headers=headers)
+        for page in _pages(documents, page_size):
+            add(page)
+            rollups.documents += len(page)
+    rollups.built_at = time.time()
+    return rollups
+
+
+class AnalyticsService:
+    """Caches the rollups and rebuilds them at most once per refresh interval; forced rebuilds
+    are ignored while the rollups are younger than min_refresh_seconds"""
+
+    def __init__(self, refresh_seconds=300, page_size=DEFAULT_PAGE_SIZE, single_flight=None, min_refresh_seconds=60,
+                 credentials=None):
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        # firebase_auth.ServiceToken for the admin-only collection group reads
+        self.credentials = credentials
+        self.page_size = page_size
+        self.single_flight = single_flight or SingleFlight()
+        self.rollups = None
+        self.lock = threading.Lock()
+
+    def _rebuild(self):
+        started = time.time()
+        rollups = build_rollups(page_size=self.page_size, headers=service_headers(self.credentials))
+        with self.lock:
+            self.rollups = rollups
+        print(f"[SUCCESS] Built analytics rollups from {rollups.documents} documents in {time.time() - started:.2f}s")
+        return rollups
+
+    def get_rollups(self, force=False):
+        rollups = self.rollups
+        age = time.time() - rollups.built_at if rollups is not None else None
+        if age is None or age > self.refresh_seconds or (force and age >= self.min_refresh_seconds):
+            # Concurrent report requests share a single rebuild
+            rollups = self.single_flight.do(('analytics_rollups', None), self._rebuild)
+        return rollups
+
+    def report(self, period='7d', force=False):
+        if period not in ANALYTICS_PERIODS:
+            raise ValueError(f"period must be one of {', '.join(ANALYTICS_PERIODS)}")
+        return self.get_rollups(force=force).report(period)
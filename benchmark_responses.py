@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Benchmark recommendation response payloads: bytes on the wire and encode time
+
+Compares the old full payload encoded the way jsonify did against the shaped
+payload (debug data dropped, optional fields= projection) under each JSON
+encoder and content coding:
+
+    python benchmark_responses.py --recommendations 10 --iterations 200
+    python benchmark_responses.py --fields id,title,poster_path,recommendation_reason --output bench.json
+"""
+
+import argparse
+import json
+import random
+import time
+
+import response_shaping
+from response_shaping import compress, encode_json, parse_fields, shape_payload
+
+GENRES = ['Action', 'Adventure', 'Comedy', 'Drama', 'Horror', 'Romance', 'Science Fiction', 'Thriller']
+WORDS = 'a young hero must travel across a broken city to save the people they love from an ancient threat'.split()
+
+
+def sample_payload(recommendations=10, profile_entries=200, seed=7):
+    """Payload shaped like a personalised /recommend response, with debug data and a large profile"""
+    rng = random.Random(seed)
+    movies = []
+    for i in range(recommendations):
+        genres = rng.sample(GENRES, 3)
+        movies.append({
+            'id': 1000 + i,
+            'title': f'Movie {i}',
+            'overview': ' '.join(rng.choice(WORDS) for _ in range(60)),
+            'genres': genres,
+            'genre_ids': [rng.randint(10, 10000) for _ in genres],
+            'cast': [f'Actor {rng.randint(1, 500)}' for _ in range(10)],
+            'director': f'Director {rng.randint(1, 100)}',
+            'vote_average': round(rng.uniform(5, 9), 1),
+            'runtime': rng.randint(80, 180),
+            'release_date': '2024-05-01',
+            'poster_path': f'/poster{i}.jpg',
+            'backdrop_path': f'/backdrop{i}.jpg',
+            'categories': ['now_playing', 'popular'],
+            'cinemaBrands': ['GSC', 'TGV'],
+            'popularity': rng.uniform(0, 50),
+            'preference_score': rng.random(),
+            'confidence_percentage': rng.randint(40, 100),
+            'recommendation_reason': 'Good match based on your viewing history',
+            'match_explanation': f'Matches your interests in {genres[0]}, {genres[1]}',
+            'debug_info': {'genre_score': rng.random(), 'actor_score': 0.2, 'matched_genres': genres[:2],
+                           'genre_explanation': 'Exact genre match'},
+        })
+    profile = {
+        'preferred_genres': {genre: rng.uniform(0, 5) for genre in GENRES},
+        'preferred_actors': {f'Actor {i}': rng.uniform(0, 3) for i in range(profile_entries)},
+        'preferred_directors': {f'Director {i}': rng.uniform(0, 3) for i in range(profile_entries // 4)},
+        'avg_rating_preference': 7.2,
+        'avg_runtime_preference': 124.0,
+        'total_bookings': 40,
+        'total_weight': 21.7,
+    }
+    return {'type': 'personalized', 'recommendations': movies, 'user_profile': profile, 'excluded_watched': 40}
+
+
+def jsonify_encode(payload):
+    """What Flask's jsonify produced: stdlib json with default separators"""
+    return json.dumps(payload).encode('utf-8')
+
+
+def stdlib_encode(payload):
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def timed(fn, iterations):
+    """(result of the last call, mean milliseconds per call)"""
+    start = time.perf_counter()
+    for _ in range(iterations):
+        result = fn()
+    return result, (time.perf_counter() - start) * 1000 / iterations
+
+
+def run_benchmark(payload, fields=None, iterations=200):
+    encoders = {'jsonify': jsonify_encode, 'stdlib-compact': stdlib_encode}
+    if response_shaping.orjson is not None:
+        encoders['orjson'] = encode_json
+    codings = ['identity', 'gzip'] + (['br'] if response_shaping.brotli is not None else [])
+    variants = {'full': lambda: payload, 'shaped': lambda: shape_payload(payload, fields)}
+
+    results = []
+    for variant, build in variants.items():
+        for encoder_name, encoder in encoders.items():
+            body, encode_ms = timed(lambda: encoder(build()), iterations)
+            for coding in codings:
+                if coding == 'identity':
+                    wire, compress_ms = body, 0.0
+                else:
+                    wire, compress_ms = timed(lambda: compress(body, coding), iterations)
+                results.append({
+                    'payload': variant,
+                    'encoder': encoder_name,
+                    'coding': coding,
+                    'bytes': len(wire),
+                    'encode_ms': round(encode_ms, 4),
+                    'compress_ms': round(compress_ms, 4),
+                })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recommendation response size and encoding time")
+    parser.add_argument('--recommendations', type=int, default=10)
+    parser.add_argument('--profile-entries', type=int, default=200, help="Actors in the sample user profile")
+    parser.add_argument('--fields', help="fields= projection applied to the shaped payload")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    payload = sample_payload(args.recommendations, args.profile_entries)
+    results = run_benchmark(payload, parse_fields(args.fields), args.iterations)
+
+    baseline = next(r['bytes'] for r in results if r['payload'] == 'full' and r['encoder'] == 'jsonify' and r['coding'] == 'identity')
+    print(f"{'payload':<8} {'encoder':<15} {'coding':<9} {'bytes':>8} {'vs jsonify':>10} {'encode ms':>10} {'compress ms':>12}")
+    for r in results:
+        print(f"{r['payload']:<8} {r['encoder']:<15} {r['coding']:<9} {r['bytes']:>8} {r['bytes'] / baseline:>9.1%} "
+              f"{r['encode_ms']:>10.3f} {r['compress_ms']:>12.3f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'recommendations': args.recommendations, 'fields': args.fields, 'results': results}, f, indent=2)
+        print(f"[SUCCESS] Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress benchmark for seat booking: double bookings, throughput and query latency
+
+Many simulated checkouts race for contiguous seat blocks in a few showtimes,
+against an in-process Firestore stand-in:
+- 'service': hold -> confirm through SeatAvailabilityService (bitmap holds,
+  batched write-back)
+- 'naive': read the seat document, check the seats are free, then append
+  them, the check-then-write flow SeatService uses without a hold
+
+Every seat confirmed by more than one checkout is a double booking. The
+service run also checks that Firestore ends up with exactly the confirmed
+seats, and times availability queries:
+
+    python benchmark_seats.py --clients 32 --showtimes 4 --block 3
+    python benchmark_seats.py --strategy service --output seats-bench.json
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+import numpy as np
+import requests
+
+from firebase_auth import ServiceToken
+from firestore_rest import commit_writes, decode_fields, document_name
+from firestore_stub_server import FirestoreStub, start_stub_server
+from seat_availability import SeatAvailabilityService, SeatConflict, showtime_id
+
+STRATEGIES = ('service', 'naive')
+
+
+def seat_block(rng, rows, columns, size):
+    row = chr(65 + rng.randrange(rows))
+    start = rng.randrange(columns - size + 1)
+    return [f"{row}{start + i + 1}" for i in range(size)]
+
+
+def run_clients(book, showtimes, clients, attempts, rows, columns, block, seed):
+    """Each client tries attempts times to book a random block; returns the confirmed (showtime, seats) list and timing"""
+    confirmed = []
+    lock = threading.Lock()
+    conflicts = Counter()
+    start_gate = threading.Barrier(clients)
+
+    def client(index):
+        rng = random.Random(seed + index)
+        start_gate.wait()
+        for _ in range(attempts):
+            doc_id = rng.choice(showtimes)
+            seats = seat_block(rng, rows, columns, block)
+            try:
+                book(doc_id, seats, rng)
+            except SeatConflict:
+                with lock:
+                    conflicts['seat'] += 1
+                continue
+            except LookupError:
+                with lock:
+                    conflicts['hold_expired'] += 1
+                continue
+            with lock:
+                confirmed.append((doc_id, seats))
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return confirmed, dict(conflicts), time.perf_counter() - started
+
+
+def double_bookings(confirmed):
+    counts = Counter((doc_id, seat) for doc_id, seats in confirmed for seat in seats)
+    return sum(count - 1 for count in counts.values() if count > 1)
+
+
+def stored_seats(base_url, doc_id):
+    response = requests.get(f"{base_url}/seats/{quote(doc_id, safe='')}", timeout=10)
+    if response.status_code == 404:
+        return []
+    return decode_fields(response.json()).get('bookedSeats') or []
+
+
+def naive_booker(base_url, think):
+    """Read, check, then append without a hold, as the app does today"""
+    session = requests.Session()
+
+    def book(doc_id, seats, rng):
+        if set(seats) & set(stored_seats(base_url, doc_id)):
+            raise SeatConflict(seats)
+        time.sleep(rng.uniform(0, think))
+        commit_writes([{
+            'update': {'name': document_name(f"seats/{doc_id}"), 'fields': {}},
+            'updateMask': {'fieldPaths': []},
+            'updateTransforms': [{'fieldPath': 'bookedSeats', 'appendMissingElements': {'values': [{'stringValue': s} for s in seats]}}],
+        }], session, base_url)
+
+    return book
+
+
+def service_booker(service, think):
+    def book(doc_id, seats, rng):
+        hold = service.hold(doc_id, seats)
+        time.sleep(rng.uniform(0, think))
+        service.confirm(doc_id, hold['hold_id'])
+
+    return book
+
+
+def query_latency(service, showtimes, queries):
+    """Availability query latency in microseconds"""
+    timings = []
+    for i in range(queries):
+        started = time.perf_counter()
+        service.availability(showtimes[i % len(showtimes)])
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings = np.array(timings)
+    return {f'p{p}_us': round(float(np.percentile(timings, p)), 2) for p in (50, 99)}
+
+
+def run_benchmark(strategy, args):
+    store = FirestoreStub()
+    server, base_url = start_stub_server(store)
+    showtimes = [showtime_id(f"{100 + i}", '2024-06-01', '7:30 PM', 'GSC Mid Valley') for i in range(args.showtimes)]
+    service = None
+    try:
+        if strategy == 'service':
+            # The stub accepts any bearer token
+            service = SeatAvailabilityService(args.rows, args.columns, hold_ttl=60, refresh_seconds=3600, base_url=base_url,
+                                              credentials=ServiceToken('benchmark'))
+            flusher = threading.Thread(target=service.run_flush_loop, args=(args.flush_seconds,), daemon=True)
+            flusher.start()
+            book = service_booker(service, args.think)
+        else:
+            book = naive_booker(base_url, args.think)
+
+        confirmed, conflicts, elapsed = run_clients(book, showtimes, args.clients, args.attempts,
+                                                    args.rows, args.columns, args.block, args.seed)
+        result = {
+            'strategy': strategy,
+            'bookings': len(confirmed),
+            'rejected': conflicts,
+            'double_booked_seats': double_bookings(confirmed),
+            'elapsed_seconds': round(elapsed, 3),
+            'bookings_per_second': round(len(confirmed) / elapsed, 1) if elapsed else None,
+        }
+        if service is not None:
+            service.flush()
+            expected = Counter((doc_id, seat) for doc_id, seats in confirmed for seat in seats)
+            stored = Counter((doc_id, seat) for doc_id in showtimes for seat in stored_seats(base_url, doc_id))
+            result['firestore_matches'] = stored == expected
+            result['firestore_commits'] = service.stats['flushes']
+            result.update(query_latency(service, showtimes, args.queries))
+        return result
+    finally:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress seat booking under concurrency and count double bookings")
+    parser.add_argument('--strategy', choices=STRATEGIES + ('both',), default='both')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--attempts', type=int, default=20, help="Booking attempts per client")
+    parser.add_argument('--showtimes', type=int, default=4)
+    parser.add_argument('--rows', type=int, default=8)
+    parser.add_argument('--columns', type=int, default=10)
+    parser.add_argument('--block', type=int, default=2, help="Contiguous seats per booking")
+    parser.add_argument('--think', type=float, default=0.005, help="Max seconds between check/hold and booking")
+    parser.add_argument('--flush-seconds', type=float, default=0.2)
+    parser.add_argument('--queries', type=int, default=20000, help="Availability queries to time")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--output', help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    strategies = STRATEGIES if args.strategy == 'both' else (args.strategy,)
+    results = [run_benchmark(strategy, args) for strategy in strategies]
+
+    print(f"{'strategy':<9} {'bookings':>9} {'rejected':>9} {'double':>7} {'booked/s':>9} {'query p50':>10} {'query p99':>10}")
+    for r in results:
+        print(f"{r['strategy']:<9} {r['bookings']:>9} {sum(r['rejected'].values()):>9} {r['double_booked_seats']:>7} "
+              f"{r['bookings_per_second']:>9} {str(r.get('p50_us', '-')) + 'us':>10} {str(r.get('p99_us', '-')) + 'us':>10}")
+        if 'firestore_matches' in r:
+            status = 'SUCCESS' if r['firestore_matches'] else 'ERROR'
+            print(f"[{status}] Firestore holds exactly the confirmed seats: {r['firestore_matches']} ({r['firestore_commits']} commits)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'results': results}, f, indent=2)
+        print(f"[SUCCESS] Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Compact booking-history request formats for /recommend
+
+Besides the full booking_history list, a client may send:
+- booking_history_compact: [[movieId, bookingDate, status], ...] tuples
+  (status optional), the only booking fields recommendations use
+- history_hash: the hash the server returned for a history it has already
+  processed, instead of the history itself; the server answers 409 when it no
+  longer has that history cached and the client resends it
+
+Request bodies may be msgpack-encoded (Content-Type: application/msgpack)
+when the msgpack package is installed.
+"""
+
+import hashlib
+import json
+from datetime import datetime
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def read_request_body(request):
+    """Decoded JSON or msgpack request body as a dict; raises ValueError for an unreadable body"""
+    if request.mimetype in MSGPACK_CONTENT_TYPES:
+        if msgpack is None:
+            raise ValueError("msgpack request bodies are not supported on this server")
+        try:
+            data = msgpack.unpackb(request.get_data(), raw=False)
+        except Exception as e:
+            raise ValueError(f"Invalid msgpack body: {e}")
+    else:
+        data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON or msgpack object")
+    return data
+
+
+def booking_day_string(value):
+    """Normalise a bookingDate (ISO string) to YYYY-MM-DD the way full histories are processed; '' if unparseable"""
+    if not isinstance(value, str) or not value:
+        return ''
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).strftime('%Y-%m-%d')
+    except ValueError:
+        return value[:10] if len(value) >= 10 else ''
+
+
+def expand_compact_history(rows):
+    """Processed booking records from [[movieId, bookingDate, status], ...] tuples"""
+    if not isinstance(rows, list):
+        raise ValueError("booking_history_compact must be a list of [movieId, bookingDate, status] entries")
+    bookings = []
+    for row in rows:
+        if not isinstance(row, (list, tuple)) or not row:
+            raise ValueError(f"Invalid booking_history_compact entry: {row!r}")
+        booking_date = booking_day_string(row[1]) if len(row) > 1 else ''
+        bookings.append({
+            'movieId': str(row[0]),
+            'bookingDate': booking_date,
+            'date': booking_date,
+            'status': (row[2] if len(row) > 2 else None) or 'active',
+        })
+    return bookings
+
+
+def history_hash(bookings):
+    """Stable hash of a processed history over the fields recommendations use"""
+    rows = [[str(b.get('movieId', '')), b.get('bookingDate') or '', b.get('status') or 'active'] for b in bookings]
+    return hashlib.sha256(json.dumps(rows, separators=(',', ':')).encode('utf-8')).hexdigest()[:32]
@@ -0,0 +1,78 @@
+"""
+Incremental catalog sync driven by the movies collection's updatedAt field
+
+Admin screens stamp every movie write with updatedAt and record deletions as
+movie_tombstones/{movieId} documents, so polling both collections ordered by
+updatedAt yields exactly the documents that changed since the last poll.
+"""
+
+from datetime import datetime, timezone
+
+from firestore_rest import decode_fields, decode_movie_document, document_path, parse_timestamp, run_query
+
+MOVIES_COLLECTION = 'movies'
+MOVIE_TOMBSTONES_COLLECTION = 'movie_tombstones'
+
+
+class CatalogChangeFeed:
+    """Polls movies and movie_tombstones with a (updatedAt, document name) cursor per collection"""
+
+    def __init__(self, since=None, page_size=100, session=None, base_url=None):
+        self.page_size = page_size
+        self.session = session
+        self.base_url = base_url
+        # (timestamp, document name, inclusive); the first poll re-reads documents stamped exactly at `since`
+        self.cursors = {
+            MOVIES_COLLECTION: (since, None, True),
+            MOVIE_TOMBSTONES_COLLECTION: (since, None, True),
+        }
+        self.stats = {'polls': 0, 'upserts': 0, 'deletes': 0}
+
+    def iter_changed_documents(self, collection):
+        """Stream the documents of a collection written after its cursor, oldest first, advancing the cursor per page"""
+        while True:
+            timestamp, name, inclusive = self.cursors[collection]
+            query = {
+                'from': [{'collectionId': collection}],
+                'orderBy': [
+                    {'field': {'fieldPath': 'updatedAt'}, 'direction': 'ASCENDING'},
+                    {'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'},
+                ],
+                'limit': self.page_size,
+            }
+            if timestamp:
+                values = [{'timestampValue': timestamp}]
+                if name:
+                    values.append({'referenceValue': name})
+                query['startAt'] = {'values': values, 'before': inclusive}
+
+            page = run_query(query, session=self.session, base_url=self.base_url)
+            yield from page
+            if page:
+                last = page[-1]
+                updated_at = last.get('fields', {}).get('updatedAt', {}).get('timestampValue')
+                self.cursors[collection] = (updated_at, last['name'], False)
+            if len(page) < self.page_size:
+                return
+
+    def _changed_documents(self, collection):
+        """All documents of a collection written after its cursor, oldest first"""
+        return list(self.iter_changed_documents(collection))
+
+    def poll(self):
+        """Return [('upsert', movie) | ('delete', movie_id)] changes since the last poll, in write order"""
+        changes = []
+        for doc in self._changed_documents(MOVIES_COLLECTION):
+            movie = decode_movie_document(doc, fallback_id=document_path(doc)[-1])
+            changes.append((movie['updated_at'], 'upsert', movie))
+        for doc in self._changed_documents(MOVIE_TOMBSTONES_COLLECTION):
+            tombstone = decode_fields(doc)
+            changes.append((tombstone.get('updatedAt'), 'delete', str(tombstone.get('movieId') or document_path(doc)[-1])))
+
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        changes.sort(key=lambda change: parse_timestamp(change[0]) or oldest)
+
+        self.stats['polls'] += 1
+        for _, kind, _ in changes:
+            self.stats['upserts' if kind == 'upsert' else 'deletes'] += 1
+        return [(kind, payload) for _, kind, payload in changes]
@@ -1,13 +1,23 @@
 #!/usr/bin/env python3
 """
 Debug script to check movie fields in Firebase
+
+    python debug_movie_fields.py                                  # dump the first movie's fields
+    python debug_movie_fields.py --profile --output schema.json   # profile every movie document
 """
 
+import argparse
 import requests
 import json
+import sys
+
+from firestore_rest import DEFAULT_PAGE_SIZE, FIREBASE_REST_API_BASE, MOVIE_DOCUMENT_FIELDS, iter_collection
 
-FIREBASE_PROJECT_ID = "fyp-cinema"
-FIREBASE_REST_API_BASE = f"https://firestore.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+VALUE_TYPES = {
+    'stringValue': 'string', 'integerValue': 'integer', 'doubleValue': 'double', 'booleanValue': 'boolean',
+    'timestampValue': 'timestamp', 'arrayValue': 'array', 'mapValue': 'map', 'nullValue': 'null',
+    'referenceValue': 'reference', 'geoPointValue': 'geopoint', 'bytesValue': 'bytes',
+}
 
 def debug_movie_fields():
     """Debug movie fields in Firebase"""
@@ -83,5 +93,139 @@ def debug_movie_fields():
         print(f"❌ Error: {e}")
         return False
 
+def _value_type(field_data):
+    for key, name in VALUE_TYPES.items():
+        if key in field_data:
+            return name
+    return 'unknown'
+
+
+def _value_size(field_data, value_type):
+    """Characters of a string, items of an array, keys of a map; None for scalars"""
+    if value_type in ('string', 'reference', 'bytes'):
+        return len(field_data[next(key for key, name in VALUE_TYPES.items() if name == value_type)])
+    if value_type == 'array':
+        return len(field_data['arrayValue'].get('values', []))
+    if value_type == 'map':
+        return len(field_data['mapValue'].get('fields', {}))
+    return None
+
+
+def _spelling_key(name):
+    # poster_path, posterPath and PosterPath all normalise to "posterpath"
+    return name.replace('_', '').lower()
+
+
+class SchemaProfile:
+    """Per-field counters accumulated one document at a time, so memory depends on the schema, not the collection"""
+
+    def __init__(self):
+        self.documents = 0
+        self.fields = {}
+
+    def add(self, doc):
+        self.documents += 1
+        for name, field_data in doc.get('fields', {}).items():
+            stats = self.fields.setdefault(name, {'present': 0, 'types': {}, 'size': None, 'element_types': {}})
+            stats['present'] += 1
+            value_type = _value_type(field_data)
+            stats['types'][value_type] = stats['types'].get(value_type, 0) + 1
+
+            size = _value_size(field_data, value_type)
+            if size is not None:
+                if stats['size'] is None:
+                    stats['size'] = {'min': size, 'max': size, 'total': 0, 'count': 0}
+                size_stats = stats['size']
+                size_stats['min'] = min(size_stats['min'], size)
+                size_stats['max'] = max(size_stats['max'], size)
+                size_stats['total'] += size
+                size_stats['count'] += 1
+
+            if value_type == 'array':
+                for item in field_data['arrayValue'].get('values', []):
+                    item_type = _value_type(item)
+                    stats['element_types'][item_type] = stats['element_types'].get(item_type, 0) + 1
+
+    def report(self):
+        """Machine-readable report: per-field stats plus the decoder's expected fields that documents lack"""
+        fields = {}
+        for name, stats in sorted(self.fields.items()):
+            entry = {
+                'present': stats['present'],
+                'presence_rate': round(stats['present'] / self.documents, 4),
+                'types': stats['types'],
+            }
+            if stats['size'] is not None:
+                size_stats = stats['size']
+                entry['size'] = {
+                    'min': size_stats['min'],
+                    'max': size_stats['max'],
+                    'mean': round(size_stats['total'] / size_stats['count'], 2),
+                }
+            if stats['element_types']:
+                entry['element_types'] = stats['element_types']
+            if len(stats['types']) > 1:
+                entry['mixed_types'] = True
+            fields[name] = entry
+
+        spellings = {}
+        for name in self.fields:
+            spellings.setdefault(_spelling_key(name), []).append(name)
+
+        expected = {}
+        for name in MOVIE_DOCUMENT_FIELDS:
+            present = self.fields.get(name, {}).get('present', 0)
+            if present == self.documents:
+                continue
+            entry = {'missing': self.documents - present, 'presence_rate': round(present / self.documents, 4) if self.documents else 0.0}
+            variants = [variant for variant in spellings.get(_spelling_key(name), []) if variant != name]
+            if variants:
+                # Documents store the value under a spelling the decoder does not read
+                entry['spelling_variants'] = {variant: self.fields[variant]['present'] for variant in variants}
+            expected[name] = entry
+
+        return {
+            'collection': 'movies',
+            'documents': self.documents,
+            'fields': fields,
+            'expected_fields_missing': expected,
+            'unread_fields': sorted(name for name in self.fields if name not in MOVIE_DOCUMENT_FIELDS),
+        }
+
+
+def profile_movie_schema(page_size=DEFAULT_PAGE_SIZE):
+    """Stream the whole movies collection through a SchemaProfile"""
+    profile = SchemaProfile()
+    for doc in iter_collection('movies', page_size=page_size):
+        profile.add(doc)
+    return profile.report()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect movie document fields in Firebase")
+    parser.add_argument('--profile', action='store_true', help="Profile every movie document and print a JSON report")
+    parser.add_argument('--output', '-o', default='-', help="Report file for --profile, or '-' for stdout")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    if not args.profile:
+        debug_movie_fields()
+        return
+
+    try:
+        report = profile_movie_schema(args.page_size)
+    except requests.RequestException as e:
+        print(f"❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Profiled {report['documents']} movies, report written to {args.output}", file=sys.stderr)
+
+
 if __name__ == "__main__":
-    debug_movie_fields()
+    main()
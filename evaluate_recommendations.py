@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Offline leave-one-out evaluation of the recommendation scoring
+
+Replays historical bookings in time order: each user's latest booking is
+hidden, their profile is built from the bookings before it (decayed as of
+the day it was made), and the engine's scoring is asked for the top k.
+Every case is replayed in three modes:
+- 'personal': the preference score of a profile-based request
+- 'similar': calculate_movie_similarity against the user's previous booking,
+  once per similarity weight configuration
+- 'new_user': genre-based recommendations from the profile's top genres and
+  actors, once per confidence threshold (below it, the most booked movies as
+  of that day are shown instead)
+
+Hit rate and NDCG@k of the hidden booking, and per-request scoring latency,
+are reported per mode and configuration. Cases are scored in chunks on a
+process pool, each worker holding the catalog snapshot memory-mapped, and
+the score components of a case are computed once for all weight
+configurations:
+
+    python evaluate_recommendations.py --workers 8
+    python evaluate_recommendations.py --bookings bookings.ndjson --vary content=0.4,0.5,0.6,0.7 --vary genre=0.2,0.4,0.6
+    python evaluate_recommendations.py --weights content=0.5,preference=0.5 --thresholds 40,50,60,70 --output eval.json
+
+Bookings come from the Firestore bookings collection group (an admin-only
+read, so set FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE, see
+firebase_auth.py), or from a JSON list / NDJSON file of {userId, movieId, bookingDate, status}. Only scoring
+is replayed: the booking-velocity nudge and re-ranking applied on top of it
+are not.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from functools import lru_cache
+from itertools import groupby, product
+
+import numpy as np
+
+from genre_matching import ACTOR_CONFIDENCE_BONUS, GENRE_CONFIDENCE_WEIGHT, genre_score
+from movie_catalog import MovieCatalog
+from popularity import BookingVelocity, booking_timestamp
+from recommendation_export import iter_user_booking_histories
+from reranking import top_k_indices
+from sharded_scoring import DEFAULT_SIMILARITY_WEIGHTS, combine_components, make_query, parse_similarity_weights, query_rows, score_catalog, score_components
+from user_profiles import booking_day, build_user_profile, movie_weights
+
+EVALUATION_MODES = ('personal', 'similar', 'new_user')
+DEFAULT_K = 10
+DEFAULT_THRESHOLDS = (40.0, 50.0, 60.0, 70.0, 80.0)
+DEFAULT_CHUNK_SIZE = 500
+# How many of the profile's strongest genres / actors stand in for a new user's picks
+NEW_USER_GENRES = 3
+NEW_USER_ACTORS = 3
+LATENCY_PERCENTILES = (50, 99)
+
+
+def format_weights(weights):
+    return ','.join(f"{name}={weights[name]:g}" for name in DEFAULT_SIMILARITY_WEIGHTS)
+
+
+def weight_configs(base, explicit=(), vary=()):
+    """The base weights, each explicit spec, and every combination of the --vary values over the base; deduplicated"""
+    configs = [base] + [parse_similarity_weights(spec) for spec in explicit]
+    if vary:
+        names = []
+        values = []
+        for item in vary:
+            name, _, raw = item.partition('=')
+            name = name.strip()
+            if name not in DEFAULT_SIMILARITY_WEIGHTS:
+                raise ValueError(f"Unknown similarity weight: {name}")
+            names.append(name)
+            values.append([float(value) for value in raw.split(',') if value])
+        for combination in product(*values):
+            configs.append({**base, **dict(zip(names, combination))})
+    unique = {}
+    for weights in configs:
+        unique.setdefault(format_weights(weights), weights)
+    return unique
+
+
+def load_booking_file(path):
+    """(user id, bookings) per user from a JSON list or NDJSON file, cancelled bookings dropped"""
+    with open(path, encoding='utf-8') as f:
+        head = f.read(1)
+        f.seek(0)
+        bookings = json.load(f) if head == '[' else [json.loads(line) for line in f if line.strip()]
+    bookings = [b for b in bookings if b.get('status') != 'cancelled' and b.get('userId')]
+    bookings.sort(key=lambda b: str(b['userId']))
+    for user_id, items in groupby(bookings, key=lambda b: str(b['userId'])):
+        yield user_id, list(items)
+
+
+def leave_one_out(histories, min_history, max_users=None):
+    """
+    One case per user: bookings in time order with the latest held out
+    Returns (cases, dated bookings of every user, skip counts); undated bookings cannot be ordered and are dropped
+    """
+    cases = []
+    dated = []
+    skipped = {'too_few_bookings': 0, 'repeat_booking': 0, 'undated_bookings': 0}
+    for user_id, bookings in histories:
+        timed = []
+        for booking in bookings:
+            timestamp = booking_timestamp(booking)
+            if timestamp is None or not booking.get('movieId'):
+                skipped['undated_bookings'] += 1
+                continue
+            timed.append((timestamp, {'movieId': str(booking['movieId']), 'bookingDate': booking['bookingDate'],
+                                      'status': booking.get('status')}))
+        timed.sort(key=lambda item: item[0])
+        dated.extend(timed)
+        if max_users is not None and len(cases) >= max_users:
+            continue
+        if len(timed) < min_history:
+            skipped['too_few_bookings'] += 1
+            continue
+        history = [booking for _, booking in timed[:-1]]
+        held_out = timed[-1][1]
+        # The engine never recommends a movie the user has already booked
+        if any(booking['movieId'] == held_out['movieId'] for booking in history):
+            skipped['repeat_booking'] += 1
+            continue
+        cases.append({'user': user_id, 'history': history, 'held_out': held_out})
+    return cases, dated, skipped
+
+
+def most_booked_by_day(dated, days, half_life_hours, limit):
+    """{day: movie ids with the highest booking velocity at the start of that day}, replaying bookings in time order"""
+    dated = sorted(dated, key=lambda item: item[0])
+    velocity = BookingVelocity(half_life_hours)
+    velocity.as_of = dated[0][0] if dated else time.time()
+    ranked = {}
+    position = 0
+    for day in sorted(days):
+        start = datetime.strptime(day, '%Y-%m-%d').timestamp()
+        batch = []
+        while position < len(dated) and dated[position][0] < start:
+            batch.append(dated[position][1])
+            position += 1
+        if batch:
+            velocity.add_bookings(batch, now=max(start, velocity.as_of))
+        scores = velocity.current_scores(max(start, velocity.as_of))
+        ranked[day] = [movie_id for movie_id, _ in sorted(scores.items(), key=lambda item: -item[1])[:limit * 2]]
+    return ranked
+
+
+# Worker-process state: the catalog snapshot and its rows grouped by genre list
+_catalog = None
+_genre_groups = None
+
+
+def _init_worker(snapshot_path):
+    global _catalog, _genre_groups
+    _catalog = MovieCatalog.load_snapshot(snapshot_path)
+    groups = {}
+    for row in np.flatnonzero(_catalog.live):
+        groups.setdefault(tuple(_catalog.movies[row].get('genres') or ()), []).append(row)
+    _genre_groups = {genres: np.array(rows, dtype=np.int64) for genres, rows in groups.items()}
+
+
+@lru_cache(maxsize=4096)
+def _genre_scores(preferred_genres):
+    """Fuzzy genre match score of every catalog row, computed once per distinct genre list"""
+    scores = np.zeros(len(_catalog.movies), dtype=np.float64)
+    for genres, rows in _genre_groups.items():
+        scores[rows] = genre_score(list(preferred_genres), list(genres))
+    return scores
+
+
+def _actor_match(preferred_actors):
+    vector = np.zeros(len(_catalog.attribute_names), dtype=np.float32)
+    for actor in preferred_actors:
+        column = _catalog.attribute_columns.get(('actor', actor))
+        if column is not None:
+            vector[column] = 1
+    return np.asarray(_catalog.attribute_matrix @ vector).ravel() > 0
+
+
+def _ranked_rows(scores, rows, k):
+    best = rows[top_k_indices(scores[rows], k)]
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+def _rank_of(row_ids, movie_id):
+    ids = [str(_catalog.movies[row].get('id')) for row in row_ids]
+    return ids.index(movie_id) if movie_id in ids else None
+
+
+def _strongest(preferences, count):
+    return tuple(name for name, _ in sorted(preferences.items(), key=lambda item: (-item[1], item[0]))[:count])
+
+
+def evaluate_case(case, weight_configs, thresholds, modes, half_life_days, k, popular):
+    """{(mode, config label): (rank or None, latency seconds)} for one case, or a skip reason"""
+    catalog = _catalog
+    held_out = case['held_out']['movieId']
+    if held_out not in catalog.row_by_id:
+        return 'held_out_not_in_catalog'
+
+    started = time.perf_counter()
+    now = booking_day(case['held_out']) or datetime.now()
+    weights = movie_weights(case['history'], now=now, half_life_days=half_life_days)
+    catalog_weights = {movie_id: weight for movie_id, weight in weights.items() if movie_id in catalog.row_by_id}
+    user_profile = build_user_profile(catalog, catalog_weights) if catalog_weights else None
+    if not user_profile:
+        return 'no_catalog_history'
+    watched = set(weights)
+    profile_seconds = time.perf_counter() - started
+
+    outcomes = {}
+    if 'personal' in modes:
+        started = time.perf_counter()
+        ranked = score_catalog(catalog, make_query('personal', k, user_profile=user_profile, exclude_ids=watched))
+        elapsed = profile_seconds + time.perf_counter() - started
+        ids = [movie_id for movie_id, _ in ranked]
+        outcomes[('personal', 'preference')] = (ids.index(held_out) if held_out in ids else None, elapsed)
+
+    if 'similar' in modes:
+        # The user's previous booking is the "because you booked" target
+        target_id = next((booking['movieId'] for booking in reversed(case['history']) if booking['movieId'] in catalog.row_by_id), None)
+        started = time.perf_counter()
+        target_movie = catalog.get(target_id)
+        query = make_query('similar', k, catalog.text_vector(target_movie), user_profile, watched | {target_id})
+        components = score_components(catalog, query)
+        rows = query_rows(catalog, query)
+        shared_seconds = profile_seconds + time.perf_counter() - started
+        for label, config in weight_configs.items():
+            started = time.perf_counter()
+            best = _ranked_rows(combine_components(components, config), rows, k) if len(rows) else rows
+            elapsed = shared_seconds + time.perf_counter() - started
+            outcomes[('similar', label)] = (_rank_of(best, held_out), elapsed)
+
+    if 'new_user' in modes:
+        started = time.perf_counter()
+        genre_scores = _genre_scores(_strongest(user_profile['preferred_genres'], NEW_USER_GENRES))
+        actor_match = _actor_match(_strongest(user_profile['preferred_actors'], NEW_USER_ACTORS))
+        confidence = genre_scores * GENRE_CONFIDENCE_WEIGHT + actor_match * ACTOR_CONFIDENCE_BONUS
+        percentage = np.round(np.clip(confidence, 0, 1) * 100, 1)
+        rows = np.flatnonzero(genre_scores > 0)
+        best_percentage = float(percentage[rows].max()) if len(rows) else 0.0
+        # Sorted by confidence, then vote average, as get_genre_based_recommendations does
+        order = np.lexsort((-catalog.numeric['vote_average'][rows], -percentage[rows]))[:k]
+        genre_ids = [str(catalog.movies[row].get('id')) for row in rows[order]]
+        popular_ids = [movie_id for movie_id in popular if movie_id in catalog.row_by_id][:k]
+        elapsed = profile_seconds + time.perf_counter() - started
+        for threshold in thresholds:
+            ids = genre_ids if best_percentage >= threshold else popular_ids
+            outcomes[('new_user', f"threshold={threshold:g}")] = (ids.index(held_out) if held_out in ids else None, elapsed)
+    return outcomes
+
+
+def evaluate_chunk(cases, weight_configs, thresholds, modes, half_life_days, k, popular_by_day):
+    """Per (mode, label) hit count, NDCG sum and latencies over a chunk of cases, plus skip counts"""
+    totals = {}
+    skipped = {}
+    for case in cases:
+        popular = popular_by_day.get(case['held_out']['bookingDate'][:10], [])
+        outcome = evaluate_case(case, weight_configs, thresholds, modes, half_life_days, k, popular)
+        if isinstance(outcome, str):
+            skipped[outcome] = skipped.get(outcome, 0) + 1
+            continue
+        for key, (rank, elapsed) in outcome.items():
+            entry = totals.setdefault(key, {'cases': 0, 'hits': 0, 'ndcg': 0.0, 'latencies': []})
+            entry['cases'] += 1
+            entry['latencies'].append(elapsed)
+            if rank is not None:
+                entry['hits'] += 1
+                entry['ndcg'] += 1 / math.log2(rank + 2)
+    return totals, skipped
+
+
+def summarise(totals, k):
+    results = []
+    for (mode, label), entry in totals.items():
+        latencies = np.array(entry['latencies']) * 1000
+        result = {
+            'mode': mode,
+            'config': label,
+            'cases': entry['cases'],
+            f'hit_rate@{k}': round(entry['hits'] / entry['cases'], 4),
+            f'ndcg@{k}': round(entry['ndcg'] / entry['cases'], 4),
+        }
+        result.update({f'p{p}_ms': round(float(np.percentile(latencies, p)), 3) for p in LATENCY_PERCENTILES})
+        results.append(result)
+    results.sort(key=lambda r: (EVALUATION_MODES.index(r['mode']), -r[f'ndcg@{k}']))
+    return results
+
+
+def run_evaluation(cases, weight_configs, thresholds, modes, args, popular_by_day):
+    chunks = [cases[i:i + args.chunk_size] for i in range(0, len(cases), args.chunk_size)]
+    totals = {}
+    skipped = {}
+    done = 0
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker, initargs=(args.snapshot,)) as executor:
+        futures = [executor.submit(evaluate_chunk, chunk, weight_configs, thresholds, modes, args.half_life_days, args.k,
+                                   {day: popular_by_day[day] for day in {case['held_out']['bookingDate'][:10] for case in chunk}})
+                   for chunk in chunks]
+        for future in as_completed(futures):
+            chunk_totals, chunk_skipped = future.result()
+            for key, entry in chunk_totals.items():
+                merged = totals.setdefault(key, {'cases': 0, 'hits': 0, 'ndcg': 0.0, 'latencies': []})
+                merged['cases'] += entry['cases']
+                merged['hits'] += entry['hits']
+                merged['ndcg'] += entry['ndcg']
+                merged['latencies'].extend(entry['latencies'])
+            for reason, count in chunk_skipped.items():
+                skipped[reason] = skipped.get(reason, 0) + count
+            done += 1
+            if done % 20 == 0 or done == len(chunks):
+                print(f"[INFO] Evaluated {done}/{len(chunks)} chunks")
+    return totals, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Leave-one-out evaluation of recommendation scoring over historical bookings")
+    parser.add_argument('--snapshot', default=os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot'))
+    parser.add_argument('--bookings', help="JSON list or NDJSON file of bookings (default: read Firestore)")
+    parser.add_argument('--modes', default=','.join(EVALUATION_MODES), help="Comma-separated subset of " + ', '.join(EVALUATION_MODES))
+    parser.add_argument('--weights', action='append', default=[], help="Extra similarity weight configuration, e.g. content=0.5,preference=0.5")
+    parser.add_argument('--vary', action='append', default=[], help="Sweep one weight over values, e.g. content=0.4,0.6,0.8 (repeat to sweep a grid)")
+    parser.add_argument('--thresholds', default=','.join(f"{t:g}" for t in DEFAULT_THRESHOLDS), help="New-user confidence thresholds (%%)")
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--min-history', type=int, default=2, help="Bookings a user needs, including the held-out one")
+    parser.add_argument('--max-users', type=int, help="Evaluate only the first N eligible users")
+    parser.add_argument('--half-life-days', type=float, default=float(os.getenv('PROFILE_HALF_LIFE_DAYS', '180')))
+    parser.add_argument('--popularity-half-life-hours', type=float, default=float(os.getenv('POPULARITY_HALF_LIFE_HOURS', '72')))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="Cases per pool task")
+    parser.add_argument('--output', help="Also write the results as JSON to this path")
+    args = parser.parse_args()
+
+    modes = [mode.strip() for mode in args.modes.split(',') if mode.strip()]
+    unknown = set(modes) - set(EVALUATION_MODES)
+    if unknown:
+        parser.error(f"Unknown modes: {', '.join(sorted(unknown))}")
+    thresholds = [float(value) for value in args.thresholds.split(',') if value]
+    configs = weight_configs(parse_similarity_weights(os.getenv('SIMILARITY_WEIGHTS')), args.weights, args.vary)
+
+    if MovieCatalog.load_snapshot(args.snapshot) is None:
+        print(f"[ERROR] No usable catalog snapshot at {args.snapshot}; start the engine once or run tmdb_enrichment.py to build one")
+        sys.exit(1)
+
+    started = time.time()
+    histories = load_booking_file(args.bookings) if args.bookings else iter_user_booking_histories()
+    cases, dated, skipped = leave_one_out(histories, args.min_history, args.max_users)
+    print(f"[INFO] {len(cases)} leave-one-out cases from {len(dated)} dated bookings ({time.time() - started:.1f}s)")
+    if not cases:
+        print("[ERROR] No users with enough dated bookings to evaluate")
+        sys.exit(1)
+    popular_by_day = most_booked_by_day(dated, {case['held_out']['bookingDate'][:10] for case in cases},
+                                        args.popularity_half_life_hours, args.k)
+
+    print(f"[INFO] Scoring {len(configs)} weight configurations and {len(thresholds)} thresholds on {args.workers} workers")
+    totals, worker_skipped = run_evaluation(cases, configs, thresholds, modes, args, popular_by_day)
+    for reason, count in worker_skipped.items():
+        skipped[reason] = skipped.get(reason, 0) + count
+    results = summarise(totals, args.k)
+    elapsed = time.time() - started
+
+    print(f"{'mode':<9} {'cases':>7} {f'hit@{args.k}':>7} {f'ndcg@{args.k}':>8} {'p50 ms':>8} {'p99 ms':>8}  config")
+    for r in results:
+        print(f"{r['mode']:<9} {r['cases']:>7} {r[f'hit_rate@{args.k}']:>7} {r[f'ndcg@{args.k}']:>8} "
+              f"{r['p50_ms']:>8} {r['p99_ms']:>8}  {r['config']}")
+    print(f"[INFO] Skipped: {skipped}")
+    for mode in ('similar', 'new_user'):
+        best = next((r for r in results if r['mode'] == mode), None)
+        if best:
+            print(f"[SUCCESS] Best {mode} configuration by NDCG@{args.k}: {best['config']}")
+    print(f"[SUCCESS] Evaluated {len(cases)} users in {elapsed:.1f}s")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'settings': vars(args), 'cases': len(cases), 'skipped': skipped, 'results': results}, f, indent=2)
+        print(f"[SUCCESS] Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
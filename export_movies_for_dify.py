@@ -1,72 +1,454 @@
 #!/usr/bin/env python3
 """
-Export Firebase movies to CSV format for Dify Knowledge Base
+Export Firebase movies to CSV and JSON-lines for Dify Knowledge Base
+
+Streams the movies collection page by page through the Firestore REST API and
+writes each movie as it arrives, so memory stays flat however large the
+catalog grows:
+
+    python export_movies_for_dify.py                         # full export
+    python export_movies_for_dify.py --incremental           # only movies changed since the last run
+    python export_movies_for_dify.py --delta --workers 4     # only added/changed/deleted records, as chunk files
+
+The checkpoint file remembers the change-feed cursors (see catalog_sync.py)
+from the previous run; incremental exports pick up from there and merge the
+changed and deleted movies into the previous <prefix>.jsonl/.csv. The manifest
+keeps a content hash per exported movie, so delta exports skip movies whose
+knowledge-base record did not actually change and the downstream re-embedding
+cost follows the size of the change rather than the size of the catalog.
 """
 
-import firebase_admin
-from firebase_admin import credentials, firestore
+import argparse
 import csv
+import hashlib
 import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+
+import requests
+
+from catalog_sync import MOVIES_COLLECTION, MOVIE_TOMBSTONES_COLLECTION, CatalogChangeFeed
+from firestore_rest import DEFAULT_PAGE_SIZE, decode_fields, decode_movie_document, document_path, iter_collection, parse_timestamp
+
+DIFY_FIELDS = ['id', 'title', 'year', 'genres', 'rating', 'overview', 'director', 'cast']
+DEFAULT_CHECKPOINT = 'movies_for_dify.checkpoint.json'
+DEFAULT_MANIFEST = 'movies_for_dify.manifest.json'
+DEFAULT_CHUNK_BYTES = 5 * 1024 * 1024  # keeps each delta chunk under typical bulk-upload limits
+DEFAULT_EXPORT_WORKERS = 4
+
+
+def dify_record(movie):
+    """Flatten the engine's movie dict into the knowledge-base record"""
+    return {
+        'id': str(movie['id']),
+        'title': movie['title'],
+        'year': (movie.get('release_date') or '')[:4],
+        'genres': movie.get('genres') or [],
+        'rating': movie.get('vote_average') or 0,
+        'overview': movie.get('overview') or '',
+        'director': movie.get('director') or '',
+        'cast': movie.get('cast') or [],
+    }
+
+
+def record_hash(record):
+    """Stable content hash of a knowledge-base record"""
+    canonical = json.dumps(record, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def csv_row(record):
+    # Convert lists to strings for CSV
+    return dict(record, **{field: ', '.join(record[field]) for field in ('genres', 'cast') if field in record})
+
+
+def decode_movies(documents):
+    for doc in documents:
+        yield decode_movie_document(doc, fallback_id=document_path(doc)[-1])
+
+
+def newest_position(position, updated_at, name):
+    """The later of a (updatedAt, document name) position and a document's, in change-feed order"""
+    parsed = parse_timestamp(updated_at)
+    if parsed is None:
+        return position
+    if position is None or (parsed, name) > (parse_timestamp(position[0]), position[1]):
+        return (updated_at, name)
+    return position
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class DifyWriter:
+    """Writes records to CSV and JSON-lines side by side; files only replace the previous export once complete"""
+
+    def __init__(self, csv_path, jsonl_path):
+        self.paths = [csv_path, jsonl_path]
+        self.csv_file = open(csv_path + '.tmp', 'w', newline='', encoding='utf-8')
+        self.jsonl_file = open(jsonl_path + '.tmp', 'w', encoding='utf-8')
+        self.csv_writer = csv.DictWriter(self.csv_file, fieldnames=DIFY_FIELDS)
+        self.csv_writer.writeheader()
+        self.count = 0
+
+    def write(self, record):
+        self.csv_writer.writerow(csv_row(record))
+        self.jsonl_file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self.count += 1
+
+    def close(self, commit=True):
+        self.csv_file.close()
+        self.jsonl_file.close()
+        for path in self.paths:
+            if commit:
+                os.replace(path + '.tmp', path)
+            else:
+                os.remove(path + '.tmp')
+
+
+class ChunkWriter:
+    """Writes records of one kind as numbered CSV/JSON-lines chunk pairs, starting a new pair once max_bytes is reached"""
+
+    def __init__(self, directory, name, fields=DIFY_FIELDS, max_bytes=DEFAULT_CHUNK_BYTES):
+        self.directory = directory
+        self.name = name
+        self.fields = fields
+        self.max_bytes = max_bytes
+        self.files = []
+        self.count = 0
+        self._chunk = -1
+        self._csv_file = self._jsonl_file = None
+        self._bytes = 0
+
+    def _open_next(self):
+        self._close_current()
+        self._chunk += 1
+        base = os.path.join(self.directory, f"{self.name}-{self._chunk:03d}")
+        self._csv_file = open(base + '.csv', 'w', newline='', encoding='utf-8')
+        self._jsonl_file = open(base + '.jsonl', 'w', encoding='utf-8')
+        self._csv_writer = csv.DictWriter(self._csv_file, fieldnames=self.fields)
+        self._csv_writer.writeheader()
+        self._bytes = 0
+        self.files.extend([base + '.csv', base + '.jsonl'])
+
+    def _close_current(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._jsonl_file.close()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+        size = len(line.encode('utf-8'))
+        if self._csv_file is None or (self._bytes and self._bytes + size > self.max_bytes):
+            self._open_next()
+        self._jsonl_file.write(line)
+        self._csv_writer.writerow(csv_row(record))
+        self._bytes += size
+        self.count += 1
+
+    def close(self):
+        self._close_current()
+        self._csv_file = self._jsonl_file = None
+
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, cursors):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'cursors': {collection: list(cursor) for collection, cursor in cursors.items()}}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(path):
+    """{movie id: content hash} of everything the knowledge base currently holds"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['hashes']
+
+
+def save_manifest(path, hashes):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'hashes': hashes}, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def full_export_cursors(newest):
+    """Change-feed cursors after a full export whose newest movie sat at `newest` (updatedAt, document name)"""
+    if newest is None:
+        return {collection: (None, None, True) for collection in (MOVIES_COLLECTION, MOVIE_TOMBSTONES_COLLECTION)}
+    updated_at, name = newest
+    return {
+        # Exclusive of the newest exported movie itself, so the next run does not export it again
+        MOVIES_COLLECTION: (updated_at, name, False),
+        # Inclusive, so a movie deleted in the same instant as the newest write is picked up next time
+        MOVIE_TOMBSTONES_COLLECTION: (updated_at, None, True),
+    }
+
+
+def iter_tombstones(feed):
+    """(movie id, deletion time) for each tombstone written since the feed's cursor"""
+    for doc in feed.iter_changed_documents(MOVIE_TOMBSTONES_COLLECTION):
+        tombstone = decode_fields(doc)
+        yield str(tombstone.get('movieId') or document_path(doc)[-1]), tombstone.get('updatedAt')
+
+
+def export_full(writer, session, page_size, hashes):
+    """Export every movie, recording content hashes; returns change-feed cursors just past the newest movie seen"""
+    newest = None
+    hashes.clear()
+    for doc in iter_collection(MOVIES_COLLECTION, page_size=page_size, session=session):
+        movie = decode_movie_document(doc, fallback_id=document_path(doc)[-1])
+        record = dify_record(movie)
+        writer.write(record)
+        hashes[record['id']] = record_hash(record)
+        newest = newest_position(newest, movie.get('updated_at'), doc.get('name'))
+    return full_export_cursors(newest)
+
+
+def fetch_changes(session, page_size, cursors):
+    """Movies written and deleted since the checkpoint; returns (advanced cursors, {id: record}, deleted movie ids)"""
+    feed = CatalogChangeFeed(page_size=page_size, session=session)
+    feed.cursors = {collection: tuple(cursor) for collection, cursor in cursors.items()}
+    changed = {}
+    for movie in decode_movies(feed.iter_changed_documents(MOVIES_COLLECTION)):
+        record = dify_record(movie)
+        changed[record['id']] = record
+    deleted = [movie_id for movie_id, _ in iter_tombstones(feed)]
+    return feed.cursors, changed, deleted
+
+
+def merge_changes(writer, previous_jsonl, changed, deleted, hashes):
+    """Rewrite the previous export with changed records replaced in place, new ones appended and deleted ones dropped"""
+    deleted = set(deleted)
+    pending = dict(changed)
+    for record in read_jsonl(previous_jsonl):
+        if record['id'] in deleted:
+            continue
+        writer.write(pending.pop(record['id'], record))
+    for record in pending.values():
+        writer.write(record)
+    for movie_id, record in changed.items():
+        hashes[movie_id] = record_hash(record)
+    for movie_id in deleted:
+        hashes.pop(movie_id, None)
+
+
+def export_movies(output_prefix='movies_for_dify', checkpoint_path=DEFAULT_CHECKPOINT, incremental=False,
+                  page_size=DEFAULT_PAGE_SIZE, manifest_path=DEFAULT_MANIFEST):
+    """Export movies from Firebase to <prefix>.csv and <prefix>.jsonl for Dify; incremental runs merge the
+    changes since the checkpoint into the previous export, so the files always hold the whole catalog"""
+    csv_path, jsonl_path = f"{output_prefix}.csv", f"{output_prefix}.jsonl"
+    checkpoint = load_checkpoint(checkpoint_path) if incremental else None
+    if incremental and checkpoint is None:
+        print(f"[WARNING] No checkpoint at {checkpoint_path}, running a full export")
+    elif checkpoint is not None and not os.path.exists(jsonl_path):
+        print(f"[WARNING] No previous export at {jsonl_path}, running a full export")
+        checkpoint = None
+
+    session = requests.Session()
+    hashes = load_manifest(manifest_path)
+    changed, deleted = {}, []
+    if checkpoint is not None:
+        cursors, changed, deleted = fetch_changes(session, page_size, checkpoint['cursors'])
+        if not changed and not deleted:
+            save_checkpoint(checkpoint_path, cursors)
+            print(f"[SUCCESS] No movies changed since the last export, {csv_path} and {jsonl_path} left as they are")
+            return 0, deleted
+
+    writer = DifyWriter(csv_path, jsonl_path)
+    try:
+        if checkpoint is not None:
+            merge_changes(writer, jsonl_path, changed, deleted, hashes)
+        else:
+            cursors = export_full(writer, session, page_size, hashes)
+    except Exception:
+        writer.close(commit=False)
+        raise
+    writer.close()
+    # Only advance the checkpoint and manifest once the export files are in place
+    save_manifest(manifest_path, hashes)
+    save_checkpoint(checkpoint_path, cursors)
+
+    if checkpoint is not None:
+        print(f"[SUCCESS] Merged {len(changed)} changed movies into {csv_path} and {jsonl_path} ({writer.count} movies)")
+        if deleted:
+            print(f"[INFO] {len(deleted)} movies deleted since the last export: {', '.join(deleted)}")
+        return len(changed), deleted
+    print(f"[SUCCESS] Exported {writer.count} movies to {csv_path} and {jsonl_path}")
+    return writer.count, deleted
+
+
+# Manifest of the previous export, installed once per worker process
+_worker_manifest = {}
+
+
+def _init_shard_worker(manifest):
+    global _worker_manifest
+    _worker_manifest = manifest
+
+
+def export_shard(shard, documents, directory, max_bytes):
+    """Decode and hash one shard of movie documents in a worker process, writing its added/changed records as chunks"""
+    added = ChunkWriter(directory, f"added-{shard:05d}", max_bytes=max_bytes)
+    changed = ChunkWriter(directory, f"changed-{shard:05d}", max_bytes=max_bytes)
+    hashes, updated_at, unchanged, newest = {}, {}, 0, None
+    try:
+        for doc in documents:
+            movie = decode_movie_document(doc, fallback_id=document_path(doc)[-1])
+            record = dify_record(movie)
+            digest = record_hash(record)
+            previous = _worker_manifest.get(record['id'])
+            if previous == digest:
+                unchanged += 1
+            else:
+                (added if previous is None else changed).write(record)
+            hashes[record['id']] = digest
+            updated_at[record['id']] = movie.get('updated_at')
+            newest = newest_position(newest, movie.get('updated_at'), doc.get('name'))
+    finally:
+        added.close()
+        changed.close()
+    return {
+        'hashes': hashes,
+        'updated_at': updated_at,
+        'newest': newest,
+        'added': added.count,
+        'changed': changed.count,
+        'unchanged': unchanged,
+        'files': added.files + changed.files,
+    }
+
+
+def _shards(documents, shard_size):
+    documents = iter(documents)
+    while True:
+        shard = list(islice(documents, shard_size))
+        if not shard:
+            return
+        yield shard
+
+
+def export_delta(delta_dir='movies_for_dify_delta', checkpoint_path=DEFAULT_CHECKPOINT, incremental=False,
+                 page_size=DEFAULT_PAGE_SIZE, manifest_path=DEFAULT_MANIFEST, workers=DEFAULT_EXPORT_WORKERS,
+                 max_chunk_bytes=DEFAULT_CHUNK_BYTES):
+    """Write only added, changed and deleted records since the last export into a new run directory"""
+    manifest = load_manifest(manifest_path)
+    checkpoint = load_checkpoint(checkpoint_path) if incremental else None
+    if incremental and checkpoint is None:
+        print(f"[WARNING] No checkpoint at {checkpoint_path}, comparing the whole catalog against the manifest")
+
+    run_dir = os.path.join(delta_dir, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ'))
+    os.makedirs(run_dir)
+
+    session = requests.Session()
+    feed = None
+    if checkpoint is not None:
+        feed = CatalogChangeFeed(page_size=page_size, session=session)
+        feed.cursors = {collection: tuple(cursor) for collection, cursor in checkpoint['cursors'].items()}
+        documents = feed.iter_changed_documents(MOVIES_COLLECTION)
+    else:
+        documents = iter_collection(MOVIES_COLLECTION, page_size=page_size, session=session)
+
+    hashes = dict(manifest)
+    seen = {}
+    totals = {'added': 0, 'changed': 0, 'unchanged': 0}
+    files = []
+    newest = None
+
+    def collect(result):
+        nonlocal newest
+        hashes.update(result['hashes'])
+        seen.update(result['updated_at'])
+        files.extend(result['files'])
+        for key in totals:
+            totals[key] += result[key]
+        if result['newest'] is not None:
+            newest = newest_position(newest, *result['newest'])
+
+    # Shards are page-sized; at most 2 * workers are in flight so memory stays bounded
+    max_in_flight = max(1, workers) * 2
+    with ProcessPoolExecutor(max_workers=max(1, workers), initializer=_init_shard_worker, initargs=(manifest,)) as executor:
+        in_flight = deque()
+        for shard, shard_documents in enumerate(_shards(documents, page_size)):
+            in_flight.append(executor.submit(export_shard, shard, shard_documents, run_dir, max_chunk_bytes))
+            if len(in_flight) >= max_in_flight:
+                collect(in_flight.popleft().result())
+        while in_flight:
+            collect(in_flight.popleft().result())
+
+    if feed is not None:
+        # A tombstone only counts if it is newer than any write to the same movie in this run
+        oldest = datetime.min.replace(tzinfo=timezone.utc)
+        deleted = []
+        for movie_id, deleted_at in iter_tombstones(feed):
+            if movie_id not in hashes:
+                continue
+            written_at = seen.get(movie_id)
+            if written_at is None or (parse_timestamp(deleted_at) or oldest) >= (parse_timestamp(written_at) or oldest):
+                deleted.append(movie_id)
+        cursors = feed.cursors
+    else:
+        deleted = [movie_id for movie_id in manifest if movie_id not in seen]
+        cursors = full_export_cursors(newest)
+
+    removed = ChunkWriter(run_dir, 'deleted', fields=['id'], max_bytes=max_chunk_bytes)
+    for movie_id in deleted:
+        hashes.pop(movie_id, None)
+        removed.write({'id': movie_id})
+    removed.close()
+    files.extend(removed.files)
+
+    save_manifest(manifest_path, hashes)
+    save_checkpoint(checkpoint_path, cursors)
+
+    if not files:
+        # Nothing to upload for this run
+        os.rmdir(run_dir)
+        run_dir = None
+    print(f"[SUCCESS] Delta export to {run_dir}: {totals['added']} added, {totals['changed']} changed, "
+          f"{len(deleted)} deleted, {totals['unchanged']} unchanged skipped ({len(files)} files)")
+    return {**totals, 'deleted': len(deleted), 'directory': run_dir, 'files': sorted(files)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export Firebase movies for the Dify knowledge base")
+    parser.add_argument('--output-prefix', default='movies_for_dify', help="Writes <prefix>.csv and <prefix>.jsonl")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Change-feed checkpoint file")
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST, help="Per-movie content hash manifest")
+    parser.add_argument('--incremental', action='store_true', help="Only read movies changed since the last run")
+    parser.add_argument('--delta', action='store_true', help="Write only added/changed/deleted records as chunk files")
+    parser.add_argument('--delta-dir', default='movies_for_dify_delta', help="Parent directory of delta runs")
+    parser.add_argument('--workers', type=int, default=DEFAULT_EXPORT_WORKERS, help="Delta export worker processes")
+    parser.add_argument('--chunk-bytes', type=int, default=DEFAULT_CHUNK_BYTES, help="Maximum size of a delta chunk")
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    try:
+        if args.delta:
+            export_delta(args.delta_dir, args.checkpoint, args.incremental, args.page_size, args.manifest,
+                         args.workers, args.chunk_bytes)
+        else:
+            export_movies(args.output_prefix, args.checkpoint, args.incremental, args.page_size, args.manifest)
+    except requests.RequestException as e:
+        print(f"[ERROR] Could not read movies from Firestore: {e}", file=sys.stderr)
+        sys.exit(1)
 
-# Initialize Firebase (you'll need to add your service account key)
-# cred = credentials.Certificate('path/to/your/service-account-key.json')
-# firebase_admin.initialize_app(cred)
-
-# For now, we'll create a sample export script
-def export_movies_to_csv():
-    """Export movies from Firebase to CSV for Dify"""
-    
-    # Sample movie data structure (replace with actual Firebase data)
-    movies = [
-        {
-            "title": "Nobody 2",
-            "year": "2025",
-            "genres": ["Action", "Thriller"],
-            "rating": 7.2,
-            "overview": "Former assassin Hutch Mansell takes his family on a nostalgic vacation to a small-town theme park, only to find himself in a deadly game of cat and mouse with a ruthless crime syndicate.",
-            "director": "Ilya Naishuller",
-            "cast": ["Bob Odenkirk", "Connie Nielsen", "Christopher Lloyd"]
-        },
-        {
-            "title": "The Naked Gun",
-            "year": "2025", 
-            "genres": ["Action", "Comedy", "Crime"],
-            "rating": 6.8,
-            "overview": "Only one man has the particular set of skills... to lead Police Squad and save the world: Lt. Frank Drebin.",
-            "director": "Akiva Schaffer",
-            "cast": ["Liam Neeson", "Pamela Anderson", "Kevin Durand"]
-        },
-        {
-            "title": "The Conjuring: Last Rites",
-            "year": "2025",
-            "genres": ["Horror"],
-            "rating": 6.9,
-            "overview": "Paranormal investigators Ed and Lorraine Warren take on one last terrifying case involving mysterious disappearances and supernatural entities.",
-            "director": "Michael Chaves",
-            "cast": ["Patrick Wilson", "Vera Farmiga", "Sterling Jerins"]
-        }
-    ]
-    
-    # Export to CSV
-    with open('movies_for_dify.csv', 'w', newline='', encoding='utf-8') as csvfile:
-        fieldnames = ['title', 'year', 'genres', 'rating', 'overview', 'director', 'cast']
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        
-        writer.writeheader()
-        for movie in movies:
-            # Convert lists to strings for CSV
-            movie_copy = movie.copy()
-            movie_copy['genres'] = ', '.join(movie['genres'])
-            movie_copy['cast'] = ', '.join(movie['cast'])
-            writer.writerow(movie_copy)
-    
-    print("✅ Movies exported to movies_for_dify.csv")
-    
-    # Also export to JSON for reference
-    with open('movies_for_dify.json', 'w', encoding='utf-8') as jsonfile:
-        json.dump(movies, jsonfile, indent=2, ensure_ascii=False)
-    
-    print("✅ Movies also exported to movies_for_dify.json")
 
 if __name__ == "__main__":
-    export_movies_to_csv()
+    main()
@@ -0,0 +1,134 @@
+"""
+Credentials for talking to Firebase on behalf of the backend and its users
+
+ServiceToken is the OAuth 2.0 bearer token the backend reads and writes
+Firestore with; service credentials are not bound by firestore.rules, which
+deny unauthenticated clients the seat writes and the admin-only reads
+(every user's bookings, orders and cancellation histories).
+It is either fixed (FIRESTORE_ACCESS_TOKEN, e.g. from
+`gcloud auth print-access-token`, or any value against firestore_stub_server.py)
+or fetched from the GCE / Cloud Run metadata server
+(FIRESTORE_TOKEN_SOURCE=metadata) and refreshed before it expires.
+
+IdTokenVerifier resolves the Firebase ID token a client sends as
+`Authorization: Bearer <token>` to its user id through the Identity Toolkit
+REST API (accounts:lookup with the project's web API key), caching each
+answer for a few minutes. AdminDirectory then tells whether that user is an
+admin the way firestore.rules does, by the existence of admins/{uid}.
+"""
+
+import os
+import threading
+import time
+from urllib.parse import quote
+
+import requests
+
+from firestore_rest import FIREBASE_REST_API_BASE
+
+METADATA_TOKEN_URL = 'http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/token'
+# Refresh metadata tokens this long before they expire
+TOKEN_EXPIRY_MARGIN = 60
+# FIREBASE_AUTH_API_BASE points ID token checks at a local stand-in
+FIREBASE_AUTH_API_BASE = os.getenv('FIREBASE_AUTH_API_BASE', 'https://identitytoolkit.googleapis.com/v1')
+DEFAULT_ID_TOKEN_CACHE_SECONDS = 300
+DEFAULT_ADMIN_CACHE_SECONDS = 60
+
+
+class ServiceToken:
+    """Bearer token for backend requests; a fixed token, or one refreshed from the metadata server"""
+
+    def __init__(self, token=None, metadata_url=None):
+        self.token = token
+        self.metadata_url = metadata_url
+        self.expires_at = float('inf') if token else 0.0
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Token configured through FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE=metadata; None if neither is set"""
+        if os.getenv('FIRESTORE_ACCESS_TOKEN'):
+            return cls(token=os.getenv('FIRESTORE_ACCESS_TOKEN'))
+        if os.getenv('FIRESTORE_TOKEN_SOURCE') == 'metadata':
+            return cls(metadata_url=METADATA_TOKEN_URL)
+        return None
+
+    def headers(self):
+        with self.lock:
+            if time.time() >= self.expires_at - TOKEN_EXPIRY_MARGIN:
+                response = requests.get(self.metadata_url, headers={'Metadata-Flavor': 'Google'}, timeout=10)
+                response.raise_for_status()
+                data = response.json()
+                self.token = data['access_token']
+                self.expires_at = time.time() + int(data.get('expires_in', 3600))
+            return {'Authorization': f"Bearer {self.token}"}
+
+
+def service_headers(credentials):
+    """Authorization header for a ServiceToken, or None to send requests unauthenticated"""
+    return credentials.headers() if credentials is not None else None
+
+
+class IdTokenVerifier:
+    """Maps Firebase ID tokens to user ids; raises PermissionError for a token Firebase does not accept"""
+
+    def __init__(self, api_key, base_url=None, cache_seconds=DEFAULT_ID_TOKEN_CACHE_SECONDS):
+        self.api_key = api_key
+        self.base_url = base_url or FIREBASE_AUTH_API_BASE
+        self.cache_seconds = cache_seconds
+        self.session = requests.Session()
+        # token -> (user id, checked until)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def user_id(self, id_token):
+        now = time.time()
+        with self.lock:
+            cached = self.cache.get(id_token)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        response = self.session.post(f"{self.base_url}/accounts:lookup", params={'key': self.api_key},
+                                     json={'idToken': id_token}, timeout=10)
+        if response.status_code == 400:
+            raise PermissionError("Invalid or expired ID token")
+        response.raise_for_status()
+        users = response.json().get('users') or []
+        if not users:
+            raise PermissionError("Invalid or expired ID token")
+        user_id = users[0]['localId']
+        with self.lock:
+            # Drop lapsed entries so the cache stays bounded by the tokens seen within cache_seconds
+            self.cache = {token: entry for token, entry in self.cache.items() if entry[1] > now}
+            self.cache[id_token] = (user_id, now + self.cache_seconds)
+        return user_id
+
+
+class AdminDirectory:
+    """Whether a user id has an admins/{uid} document, read with service credentials and cached briefly"""
+
+    def __init__(self, credentials, base_url=None, cache_seconds=DEFAULT_ADMIN_CACHE_SECONDS):
+        self.credentials = credentials
+        self.base_url = base_url or FIREBASE_REST_API_BASE
+        self.cache_seconds = cache_seconds
+        self.session = requests.Session()
+        # user id -> (is admin, checked until)
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def is_admin(self, user_id):
+        now = time.time()
+        with self.lock:
+            cached = self.cache.get(user_id)
+        if cached and cached[1] > now:
+            return cached[0]
+
+        response = self.session.get(f"{self.base_url}/admins/{quote(user_id, safe='')}",
+                                    headers=self.credentials.headers(), timeout=10)
+        if response.status_code != 404:
+            response.raise_for_status()
+        is_admin = response.status_code == 200
+        with self.lock:
+            self.cache = {other: entry for other, entry in self.cache.items() if entry[1] > now}
+            self.cache[user_id] = (is_admin, now + self.cache_seconds)
+        return is_admin
@@ -0,0 +1,186 @@
+"""
+Shared helpers for reading Firestore through the REST API
+"""
+
+import os
+from datetime import datetime, timezone
+
+import requests
+
+# Firebase configuration - using REST API instead of Admin SDK
+FIREBASE_PROJECT_ID = "fyp-cinema"
+# FIRESTORE_REST_API_BASE points the backend at a local stand-in (see firestore_stub_server.py)
+FIREBASE_REST_API_BASE = os.getenv(
+    'FIRESTORE_REST_API_BASE',
+    f"https://firestore.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+)
+
+DEFAULT_PAGE_SIZE = 300
+
+
+def get_field_value(field_data, default=None):
+    """Extract a plain Python value from Firestore's typed REST format"""
+    if not field_data:
+        return default
+    if 'stringValue' in field_data:
+        return field_data['stringValue']
+    elif 'integerValue' in field_data:
+        return int(field_data['integerValue'])
+    elif 'doubleValue' in field_data:
+        return float(field_data['doubleValue'])
+    elif 'booleanValue' in field_data:
+        return field_data['booleanValue']
+    elif 'timestampValue' in field_data:
+        return field_data['timestampValue']
+    elif 'arrayValue' in field_data:
+        return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
+    elif 'mapValue' in field_data:
+        return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
+    return default
+
+
+def encode_value(value):
+    """Encode a plain Python value into Firestore's typed REST format"""
+    if value is None:
+        return {'nullValue': None}
+    if isinstance(value, bool):
+        return {'booleanValue': value}
+    if isinstance(value, int):
+        return {'integerValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, datetime):
+        return {'timestampValue': value.astimezone(timezone.utc).isoformat().replace('+00:00', 'Z')}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [encode_value(item) for item in value]}}
+    if isinstance(value, dict):
+        return {'mapValue': {'fields': {k: encode_value(v) for k, v in value.items()}}}
+    return {'stringValue': str(value)}
+
+
+def encode_fields(data):
+    """Encode a plain dict as the 'fields' of a Firestore REST document"""
+    return {name: encode_value(value) for name, value in data.items()}
+
+
+def parse_timestamp(value):
+    """Parse a Firestore RFC 3339 timestamp (up to nanosecond precision) into an aware datetime"""
+    if not value:
+        return None
+    value = value.replace('Z', '+00:00')
+    if '.' in value:
+        # datetime only keeps microseconds
+        head, rest = value.split('.', 1)
+        digits = len(rest) - len(rest.lstrip('0123456789'))
+        value = f"{head}.{rest[:min(digits, 6)].ljust(6, '0')}{rest[digits:]}"
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def decode_fields(doc):
+    """Decode every field of a Firestore REST document"""
+    return {name: get_field_value(value) for name, value in doc.get('fields', {}).items()}
+
+
+# Firestore field names decode_movie_document reads; keep in sync when the decoder changes
+MOVIE_DOCUMENT_FIELDS = (
+    'id', 'title', 'overview', 'poster_path', 'backdrop_path', 'imageUrl', 'backdropPath', 'genres', 'genreIds',
+    'cast', 'releaseDate', 'voteAverage', 'runtime', 'originalLanguage', 'isFromTMDB', 'categories', 'cinemaBrands',
+    'updatedAt',
+)
+
+
+def cast_names(fields):
+    """Names of the first five cast members of a movie document's fields"""
+    cast = get_field_value(fields.get('cast'), [])
+    return [actor.get('name', '') for actor in cast[:5] if isinstance(actor, dict)]
+
+
+def decode_movie_document(doc, fallback_id=None):
+    """Decode a movies/{id} document into the engine's movie dict"""
+    fields = doc.get('fields', {})
+    return {
+        'id': get_field_value(fields.get('id'), fallback_id),
+        'title': get_field_value(fields.get('title'), 'Unknown'),
+        'overview': get_field_value(fields.get('overview'), ''),
+        'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
+        'imageUrl': get_field_value(fields.get('imageUrl')),
+        'backdrop_path': get_field_value(fields.get('backdropPath')),
+        'genres': get_field_value(fields.get('genres'), []),
+        'genre_ids': get_field_value(fields.get('genreIds'), []),
+        'keywords': [],  # Not stored in database
+        'cast': cast_names(fields),
+        'director': '',  # Not stored in database
+        'release_date': get_field_value(fields.get('releaseDate'), ''),
+        'vote_average': get_field_value(fields.get('voteAverage'), 0),
+        'popularity': 0,  # Not stored in database
+        'runtime': get_field_value(fields.get('runtime'), 0),
+        'original_language': get_field_value(fields.get('originalLanguage'), ''),
+        'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
+        'categories': get_field_value(fields.get('categories'), []),
+        'cinemaBrands': get_field_value(fields.get('cinemaBrands'), []),
+        'updated_at': get_field_value(fields.get('updatedAt'))
+    }
+
+
+def document_path(doc):
+    """Path segments of a document relative to the database root, e.g. ['users', 'uid', 'bookings', 'id']"""
+    name = doc.get('name', '')
+    if '/documents/' not in name:
+        return []
+    return name.split('/documents/', 1)[1].split('/')
+
+
+def document_name(path):
+    """Full resource name of a document, e.g. 'seats/abc' -> 'projects/.../documents/seats/abc' (used in :commit writes)"""
+    return f"projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents/{path.strip('/')}"
+
+
+def commit_writes(writes, session=None, base_url=None, headers=None):
+    """Apply a batch of writes atomically with one :commit request; returns the commit response"""
+    http = session or requests
+    url = f"{base_url or FIREBASE_REST_API_BASE}:commit"
+    response = http.post(url, json={'writes': writes}, headers=headers, timeout=30)
+    response.raise_for_status()
+    return response.json()
+
+
+def run_query(structured_query, session=None, base_url=None, headers=None):
+    """Run a structured query against the database root and return the matched documents"""
+    http = session or requests
+    url = f"{base_url or FIREBASE_REST_API_BASE}:runQuery"
+    response = http.post(url, json={'structuredQuery': structured_query}, headers=headers, timeout=30)
+    response.raise_for_status()
+    return [result['document'] for result in response.json() if 'document' in result]
+
+
+def _iter_ordered_by_name(source, page_size, session, base_url, headers=None):
+    cursor = None
+    while True:
+        query = {
+            'from': [source],
+            'orderBy': [{'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'}],
+            'limit': page_size,
+        }
+        if cursor:
+            query['startAt'] = {'values': [{'referenceValue': cursor}], 'before': False}
+
+        documents = run_query(query, session=session, base_url=base_url, headers=headers)
+        yield from documents
+
+        if len(documents) < page_size:
+            return
+        cursor = documents[-1]['name']
+
+
+def iter_collection_group(collection_id, page_size=DEFAULT_PAGE_SIZE, session=None, base_url=None, headers=None):
+    """Yield every document of a collection group (e.g. all users' bookings) page by page, ordered by path"""
+    source = {'collectionId': collection_id, 'allDescendants': True}
+    return _iter_ordered_by_name(source, page_size, session, base_url, headers)
+
+
+def iter_collection(collection_id, page_size=DEFAULT_PAGE_SIZE, session=None, base_url=None, headers=None):
+    """Yield every document of a top-level collection (e.g. movies) page by page, ordered by path"""
+    return _iter_ordered_by_name({'collectionId': collection_id}, page_size, session, base_url, headers)
@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+"""
+Local in-memory stand-in for the subset of the Firestore REST API the backend uses
+
+Supports document get/list/patch/delete, structured queries (:runQuery) with
+field filters, ordering, cursors and limits, including collection group
+queries, and batched writes (:commit) with update masks and array transforms. Point the backend at it with:
+
+    python firestore_stub_server.py --port 8085 --seed fixtures.json
+    FIRESTORE_REST_API_BASE=http://127.0.0.1:8085/v1/projects/fyp-cinema/databases/(default)/documents python recommendation_engine.py
+
+The seed file maps collection paths to {document id: plain fields}, e.g.
+{"movies": {"1": {"title": "Inception", "updatedAt": {"$timestamp": "2024-05-01T10:00:00Z"}}},
+ "users/u1/bookings": {"b1": {"movieId": "1"}}}
+where {"$timestamp": ...} marks a Firestore timestamp rather than a string.
+"""
+
+import argparse
+import functools
+import json
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+from firestore_rest import FIREBASE_PROJECT_ID, encode_fields, get_field_value, parse_timestamp
+
+DOCUMENTS_PREFIX = f"/v1/projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+DOCUMENT_NAME_PREFIX = f"projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+
+
+def _seed_value(value):
+    """Turn {"$timestamp": "..."} markers in seed fixtures into datetimes"""
+    if isinstance(value, dict):
+        if set(value) == {'$timestamp'}:
+            return parse_timestamp(value['$timestamp'])
+        return {k: _seed_value(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_seed_value(item) for item in value]
+    return value
+
+
+def _comparable(value):
+    """Decode a typed value into something Python can order"""
+    if value is None:
+        return None
+    if 'timestampValue' in value:
+        return parse_timestamp(value['timestampValue'])
+    if 'referenceValue' in value:
+        return value['referenceValue']
+    return get_field_value(value)
+
+
+def _get_field(fields, parts):
+    """Typed value at a dotted field path inside document fields, or None"""
+    value = {'mapValue': {'fields': fields}}
+    for part in parts:
+        value = value.get('mapValue', {}).get('fields', {}).get(part) if value else None
+    return value
+
+
+def _set_field(fields, parts, value):
+    """Set (or with value None, remove) a typed value at a dotted field path, creating maps on the way"""
+    for part in parts[:-1]:
+        child = fields.get(part)
+        if not child or 'mapValue' not in child:
+            child = fields[part] = {'mapValue': {'fields': {}}}
+        fields = child['mapValue'].setdefault('fields', {})
+    if value is None:
+        fields.pop(parts[-1], None)
+    else:
+        fields[parts[-1]] = value
+
+
+class FirestoreStub:
+    """Thread-safe in-memory document store keyed by path ('movies/1', 'users/u1/bookings/b1')"""
+
+    def __init__(self):
+        self.documents = {}
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    def put(self, path, data=None, fields=None):
+        """Create or replace a document from plain data or already-typed fields"""
+        path = path.strip('/')
+        now = _now()
+        with self.lock:
+            existing = self.documents.get(path)
+            self.documents[path] = {
+                'name': f"{DOCUMENT_NAME_PREFIX}/{path}",
+                'fields': fields if fields is not None else encode_fields(data or {}),
+                'createTime': existing['createTime'] if existing else now,
+                'updateTime': now,
+            }
+            return self.documents[path]
+
+    def delete(self, path):
+        with self.lock:
+            return self.documents.pop(path.strip('/'), None) is not None
+
+    def get(self, path):
+        with self.lock:
+            return self.documents.get(path.strip('/'))
+
+    def seed(self, fixture):
+        """Load {collection path: {document id: plain fields}}"""
+        for collection, docs in fixture.items():
+            for doc_id, data in docs.items():
+                self.put(f"{collection.strip('/')}/{doc_id}", _seed_value(data))
+
+    def list_collection(self, collection, page_size=None, page_token=None):
+        collection = collection.strip('/')
+        depth = collection.count('/') + 2
+        with self.lock:
+            docs = [doc for path, doc in sorted(self.documents.items())
+                    if path.startswith(collection + '/') and path.count('/') + 1 == depth]
+        start = int(page_token or 0)
+        end = start + page_size if page_size else len(docs)
+        result = {'documents': docs[start:end]} if docs[start:end] else {}
+        if end < len(docs):
+            result['nextPageToken'] = str(end)
+        return result
+
+    def run_query(self, query, parent=''):
+        """Evaluate a structuredQuery the way Firestore does for the features the backend relies on"""
+        source = query['from'][0]
+        collection_id = source['collectionId']
+        parent = parent.strip('/')
+        with self.lock:
+            candidates = list(self.documents.items())
+
+        docs = []
+        for path, doc in candidates:
+            segments = path.split('/')
+            if segments[-2] != collection_id:
+                continue
+            doc_parent = '/'.join(segments[:-2])
+            if source.get('allDescendants'):
+                if parent and not (doc_parent == parent or doc_parent.startswith(parent + '/')):
+                    continue
+            elif doc_parent != parent:
+                continue
+            if 'where' in query and not self._matches(doc, query['where']):
+                continue
+            docs.append(doc)
+
+        order_by = list(query.get('orderBy', []))
+        if not any(order['field']['fieldPath'] == '__name__' for order in order_by):
+            order_by.append({'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'})
+        # Firestore drops documents that lack an ordered field
+        docs = [doc for doc in docs if all(self._value(doc, order['field']['fieldPath']) is not None for order in order_by)]
+
+        def compare(left, right):
+            for order in order_by:
+                a, b = left[order['field']['fieldPath']], right[order['field']['fieldPath']]
+                if a != b:
+                    result = -1 if a < b else 1
+                    return -result if order.get('direction') == 'DESCENDING' else result
+            return 0
+
+        keyed = [({order['field']['fieldPath']: self._value(doc, order['field']['fieldPath']) for order in order_by}, doc) for doc in docs]
+        keyed.sort(key=functools.cmp_to_key(lambda a, b: compare(a[0], b[0])))
+
+        if 'startAt' in query:
+            cursor = query['startAt']
+            cursor_key = {}
+            for order, value in zip(order_by, cursor['values']):
+                cursor_key[order['field']['fieldPath']] = _comparable(value)
+            prefix = [order for order in order_by if order['field']['fieldPath'] in cursor_key]
+
+            def after_cursor(key):
+                for order in prefix:
+                    path = order['field']['fieldPath']
+                    if key[path] != cursor_key[path]:
+                        greater = key[path] > cursor_key[path]
+                        return greater if order.get('direction') != 'DESCENDING' else not greater
+                return cursor.get('before', False)
+
+            keyed = [item for item in keyed if after_cursor(item[0])]
+
+        docs = [doc for _, doc in keyed][query.get('offset', 0):]
+        if 'limit' in query:
+            docs = docs[:query['limit']]
+        return docs
+
+    def commit(self, writes):
+        """Apply :commit writes atomically: update (with updateMask / updateTransforms) and delete"""
+        now = _now()
+        with self.lock:
+            for write in writes:
+                if 'delete' in write:
+                    self.documents.pop(write['delete'].split('/documents/', 1)[1], None)
+                    continue
+                update = write['update']
+                path = update['name'].split('/documents/', 1)[1]
+                existing = self.documents.get(path)
+                fields = json.loads(json.dumps(existing['fields'])) if existing else {}
+                if 'updateMask' in write:
+                    for field_path in write['updateMask'].get('fieldPaths', []):
+                        _set_field(fields, field_path.split('.'), _get_field(update.get('fields', {}), field_path.split('.')))
+                else:
+                    fields = update.get('fields', {})
+                for transform in write.get('updateTransforms', []):
+                    parts = transform['fieldPath'].split('.')
+                    current = _get_field(fields, parts)
+                    values = current['arrayValue'].get('values', []) if current and 'arrayValue' in current else []
+                    if 'appendMissingElements' in transform:
+                        values = values + [v for v in transform['appendMissingElements'].get('values', []) if v not in values]
+                    elif 'removeAllFromArray' in transform:
+                        removed = transform['removeAllFromArray'].get('values', [])
+                        values = [v for v in values if v not in removed]
+                    _set_field(fields, parts, {'arrayValue': {'values': values}})
+                self.documents[path] = {
+                    'name': f"{DOCUMENT_NAME_PREFIX}/{path}",
+                    'fields': fields,
+                    'createTime': existing['createTime'] if existing else now,
+                    'updateTime': now,
+                }
+        return {'writeResults': [{'updateTime': now} for _ in writes], 'commitTime': now}
+
+    def _value(self, doc, field_path):
+        if field_path == '__name__':
+            return doc['name']
+        value = doc['fields']
+        for part in field_path.split('.'):
+            if value is None:
+                return None
+            if 'mapValue' in value and 'fields' not in value:
+                value = value['mapValue'].get('fields', {})
+            value = value.get(part)
+        return _comparable(value)
+
+    def _matches(self, doc, condition):
+        if 'compositeFilter' in condition:
+            return all(self._matches(doc, sub) for sub in condition['compositeFilter']['filters'])
+        field_filter = condition['fieldFilter']
+        actual = self._value(doc, field_filter['field']['fieldPath'])
+        expected = _comparable(field_filter['value'])
+        op = field_filter['op']
+        if actual is None:
+            return False
+        if op == 'EQUAL':
+            return actual == expected
+        if op == 'NOT_EQUAL':
+            return actual != expected
+        if op == 'IN':
+            return actual in expected
+        if op == 'ARRAY_CONTAINS':
+            return isinstance(actual, list) and expected in actual
+        try:
+            return {
+                'LESS_THAN': actual < expected,
+                'LESS_THAN_OR_EQUAL': actual <= expected,
+                'GREATER_THAN': actual > expected,
+                'GREATER_THAN_OR_EQUAL': actual >= expected,
+            }[op]
+        except TypeError:
+            return False
+
+
+def make_handler(store):
+    class FirestoreStubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def _path(self):
+            parsed = urlparse(self.path)
+            path = unquote(parsed.path)
+            if not path.startswith(DOCUMENTS_PREFIX):
+                return None, parse_qs(parsed.query)
+            return path[len(DOCUMENTS_PREFIX):].strip('/'), parse_qs(parsed.query)
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            return json.loads(self.rfile.read(length) or b'{}')
+
+        def do_GET(self):
+            store.request_count += 1
+            path, params = self._path()
+            if path is None:
+                return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            if path.count('/') % 2 == 0:
+                page_size = int(params['pageSize'][0]) if 'pageSize' in params else None
+                page_token = params.get('pageToken', [None])[0]
+                return self._send(200, store.list_collection(path, page_size, page_token))
+            doc = store.get(path)
+            if doc is None:
+                return self._send(404, {'error': {'code': 404, 'message': f'Document {path} not found', 'status': 'NOT_FOUND'}})
+            return self._send(200, doc)
+
+        def do_POST(self):
+            store.request_count += 1
+            path, _ = self._path()
+            if path == ':commit':
+                return self._send(200, store.commit(self._body().get('writes', [])))
+            if path is None or not path.endswith(':runQuery'):
+                return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            parent = path[:-len(':runQuery')]
+            docs = store.run_query(self._body()['structuredQuery'], parent)
+            read_time = _now()
+            if not docs:
+                return self._send(200, [{'readTime': read_time}])
+            return self._send(200, [{'document': doc, 'readTime': read_time} for doc in docs])
+
+        def do_PATCH(self):
+            store.request_count += 1
+            path, _ = self._path()
+            if path is None:
+                return self._send(404, {'error': {'code': 404, 'message': 'Not found'}})
+            return self._send(200, store.put(path, fields=self._body().get('fields', {})))
+
+        def do_DELETE(self):
+            store.request_count += 1
+            path, _ = self._path()
+            if path is not None:
+                store.delete(path)
+            return self._send(200, {})
+
+    return FirestoreStubHandler
+
+
+def start_stub_server(store=None, host='127.0.0.1', port=0):
+    """Serve a FirestoreStub on a background thread; returns (server, documents base URL)"""
+    store = store or FirestoreStub()
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    server.store = store
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{DOCUMENTS_PREFIX}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local Firestore REST stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8085)
+    parser.add_argument('--seed', help="JSON fixture of {collection path: {document id: fields}}")
+    args = parser.parse_args()
+
+    store = FirestoreStub()
+    if args.seed:
+        with open(args.seed, encoding='utf-8') as f:
+            store.seed(json.load(f))
+        print(f"[INFO] Seeded {len(store.documents)} documents from {args.seed}")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(store))
+    print(f"[SUCCESS] Firestore stand-in listening on http://{args.host}:{args.port}{DOCUMENTS_PREFIX}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
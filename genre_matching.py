@@ -0,0 +1,103 @@
+"""
+Fuzzy genre matching for new-user (preference-based) recommendations
+
+A movie scores 1.0 per preferred genre it has (Sci-Fi and Science Fiction
+count as the same genre), 0.7 per preferred genre it only has a related genre
+for, averaged over the preferred genres. The confidence shown to users is the
+genre score worth up to 80%, plus 20% when a preferred actor is in the cast.
+"""
+
+GENRE_SIMILARITY = {
+    "Action": ["Adventure", "Thriller", "Crime", "War"],
+    "Adventure": ["Action", "Fantasy", "Thriller"],
+    "Animation": ["Family", "Comedy", "Fantasy"],
+    "Comedy": ["Animation", "Family", "Romance"],
+    "Crime": ["Action", "Thriller", "Mystery", "Drama"],
+    "Documentary": ["History", "Drama"],
+    "Drama": ["Romance", "Crime", "History", "War"],
+    "Family": ["Animation", "Comedy", "Adventure"],
+    "Fantasy": ["Adventure", "Animation", "Sci-Fi"],
+    "History": ["Drama", "War", "Documentary"],
+    "Horror": ["Thriller", "Mystery"],
+    "Music": ["Drama", "Comedy"],
+    "Mystery": ["Thriller", "Crime", "Horror"],
+    "Romance": ["Drama", "Comedy"],
+    "Science Fiction": ["Fantasy", "Action", "Adventure", "Thriller"],
+    "Sci-Fi": ["Fantasy", "Action", "Adventure", "Thriller"],  # Alternative name
+    "Thriller": ["Action", "Crime", "Mystery", "Horror"],
+    "War": ["Action", "Drama", "History"],
+    "Western": ["Action", "Adventure", "Drama"]
+}
+
+EXACT_MATCH_SCORE = 1.0
+SIMILAR_MATCH_SCORE = 0.7
+GENRE_CONFIDENCE_WEIGHT = 0.8
+ACTOR_CONFIDENCE_BONUS = 0.2
+
+
+def _best_matches(user_genres, movie_genres, genre_similarity):
+    """(user genre, matched movie genre, score, match type) for each user genre the movie matches"""
+    matches = []
+    for user_genre in user_genres:
+        best_match_score = 0.0
+        best_match_genre = None
+        match_type = ""
+
+        # Check for exact matches first
+        for movie_genre in movie_genres:
+            if user_genre.lower() == movie_genre.lower():
+                best_match_score = EXACT_MATCH_SCORE
+                best_match_genre = movie_genre
+                match_type = "exact"
+                break
+            # Handle common variations
+            elif (user_genre == "Sci-Fi" and movie_genre == "Science Fiction") or \
+                 (user_genre == "Science Fiction" and movie_genre == "Sci-Fi"):
+                best_match_score = EXACT_MATCH_SCORE
+                best_match_genre = movie_genre
+                match_type = "exact"
+                break
+
+        # If no exact match, check for similar genres
+        if best_match_score == 0.0 and user_genre in genre_similarity:
+            similar_genres = genre_similarity[user_genre]
+            for movie_genre in movie_genres:
+                if movie_genre in similar_genres and SIMILAR_MATCH_SCORE > best_match_score:
+                    best_match_score = SIMILAR_MATCH_SCORE
+                    best_match_genre = movie_genre
+                    match_type = "similar"
+
+        if best_match_score > 0:
+            matches.append((user_genre, best_match_genre, best_match_score, match_type))
+    return matches
+
+
+def genre_score(user_genres, movie_genres, genre_similarity=GENRE_SIMILARITY):
+    """Genre match score alone (average over the user genres), without building explanations"""
+    if not user_genres or not movie_genres:
+        return 0.0
+    return sum(score for _, _, score, _ in _best_matches(user_genres, movie_genres, genre_similarity)) / len(user_genres)
+
+
+def genre_match_score(user_genres, movie_genres, genre_similarity=GENRE_SIMILARITY):
+    """
+    Calculate genre match score with fuzzy matching
+    Returns (score, matched_genres, explanation)
+    """
+    if not user_genres or not movie_genres:
+        return 0.0, [], "No genres to match"
+
+    matches = _best_matches(user_genres, movie_genres, genre_similarity)
+    matched_genres = [movie_genre for _, movie_genre, _, _ in matches]
+    explanations = [f"{user_genre} -> {movie_genre} ({match_type})" for user_genre, movie_genre, _, match_type in matches]
+
+    # Normalize score (average of all user genres)
+    final_score = sum(score for _, _, score, _ in matches) / len(user_genres)
+    explanation = "; ".join(explanations) if explanations else "No genre matches found"
+
+    return final_score, matched_genres, explanation
+
+
+def genre_confidence(score, actor_match=False):
+    """Confidence (0-1) of a genre-based recommendation from its genre score"""
+    return score * GENRE_CONFIDENCE_WEIGHT + (ACTOR_CONFIDENCE_BONUS if actor_match else 0.0)
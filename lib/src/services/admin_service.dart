@@ -17,7 +17,10 @@ class AdminService {
   // Movie Management
   Future<void> addMovie(BannerMovie movie) async {
     try {
-      await _firestore.collection(movieCollection).doc(movie.id.toString()).set(movie.toJson());
+      await _firestore.collection(movieCollection).doc(movie.id.toString()).set({
+        ...movie.toJson(),
+        'updatedAt': FieldValue.serverTimestamp(),
+      });
       
       // Send notification to all users about the new coming soon movie
       await _notificationService.broadcastSystemNotification(
@@ -41,7 +44,10 @@ class AdminService {
 
   Future<void> updateMovie(BannerMovie movie) async {
     try {
-      await _firestore.collection(movieCollection).doc(movie.id.toString()).update(movie.toJson());
+      await _firestore.collection(movieCollection).doc(movie.id.toString()).update({
+        ...movie.toJson(),
+        'updatedAt': FieldValue.serverTimestamp(),
+      });
     } catch (e) {
       print('Error updating movie: $e');
       rethrow;
@@ -50,7 +56,15 @@ class AdminService {
 
   Future<void> deleteMovie(String movieId) async {
     try {
-      await _firestore.collection(movieCollection).doc(movieId).delete();
+      // Delete the movie and leave a tombstone so the recommendation engine's
+      // incremental catalog sync can see the deletion
+      final batch = _firestore.batch();
+      batch.delete(_firestore.collection(movieCollection).doc(movieId));
+      batch.set(_firestore.collection('movie_tombstones').doc(movieId), {
+        'movieId': movieId,
+        'updatedAt': FieldValue.serverTimestamp(),
+      });
+      await batch.commit();
     } catch (e) {
       print('Error deleting movie: $e');
       rethrow;
@@ -18,6 +18,11 @@ class RecommendationService {
     'http://10.10.29.156:5000'   // Try another common port
   ];
   
+  // Hash the server returned for the last booking history it processed, and the local
+  // fingerprint of that history; while the history is unchanged only the hash is sent
+  static String? _historyHash;
+  static int? _historyFingerprint;
+  
   // Try multiple URLs to connect to the recommendation server
   Future<http.Response?> _tryConnectToServer(String endpoint, Map<String, dynamic> body) async {
     for (String url in fallbackUrls) {
@@ -33,6 +38,10 @@ class RecommendationService {
           print('[SUCCESS] Connected to: $url$endpoint');
           return response;
         }
+        if (response.statusCode == 409) {
+          // Server reached but it needs the full request (e.g. it no longer has our history_hash)
+          return response;
+        }
       } catch (e) {
         print('[DEBUG] Failed to connect to $url$endpoint: $e');
         continue;
@@ -56,16 +65,37 @@ class RecommendationService {
       // Try connecting to Python ML server first
       print('🔗 Attempting to connect to ML recommendation server...');
       
-      final response = await _tryConnectToServer('/recommend', {
+      // Compact [movieId, bookingDate, status] tuples carry everything the server uses
+      final compactHistory = bookingHistory
+          .map((booking) => [booking['movieId'], booking['bookingDate']?.toString(), booking['status']])
+          .toList();
+      final fingerprint = jsonEncode(compactHistory).hashCode;
+      final historyUnchanged = _historyHash != null && _historyFingerprint == fingerprint;
+      
+      var response = await _tryConnectToServer('/recommend', {
         'user_id': user.uid,
-        'booking_history': bookingHistory,
+        if (historyUnchanged) 'history_hash': _historyHash else 'booking_history_compact': compactHistory,
         if (movieId != null) 'movie_id': movieId,
       });
       
+      if (response != null && response.statusCode == 409) {
+        print('🔁 Server no longer has our booking history, resending it');
+        _historyHash = null;
+        response = await _tryConnectToServer('/recommend', {
+          'user_id': user.uid,
+          'booking_history_compact': compactHistory,
+          if (movieId != null) 'movie_id': movieId,
+        });
+      }
+      
       if (response != null && response.statusCode == 200) {
         print('✅ Connected to ML server successfully!');
         print('📦 Server response: ${response.body}');
         final result = jsonDecode(response.body);
+        if (result['history_hash'] != null) {
+          _historyHash = result['history_hash'];
+          _historyFingerprint = fingerprint;
+        }
         print('🎬 Parsed result: $result');
         return result;
       }
@@ -225,6 +255,38 @@ class RecommendationService {
     };
   }
   
+  // Get the admin analytics report aggregated server-side; null when the server is unavailable
+  // or the signed-in user is not an admin (the server checks their Firebase ID token against admins/)
+  Future<Map<String, dynamic>?> getAnalyticsReport(String period) async {
+    final user = FirebaseAuth.instance.currentUser;
+    if (user == null) {
+      print('[ERROR] Analytics report needs a signed-in admin');
+      return null;
+    }
+    final idToken = await user.getIdToken();
+    for (String url in fallbackUrls) {
+      try {
+        final response = await http.get(
+          Uri.parse('$url/analytics?period=$period'),
+          headers: {'Content-Type': 'application/json', 'Authorization': 'Bearer $idToken'},
+        ).timeout(Duration(seconds: 30));
+        
+        if (response.statusCode == 200) {
+          print('[SUCCESS] Analytics report received from: $url');
+          return jsonDecode(response.body);
+        }
+        if (response.statusCode == 401 || response.statusCode == 403) {
+          print('[ERROR] Analytics report rejected by $url: ${response.body}');
+          return null;
+        }
+      } catch (e) {
+        print('[DEBUG] Failed to get analytics from $url: $e');
+        continue;
+      }
+    }
+    return null;
+  }
+  
   // Get available genres from server
   Future<List<String>> getAvailableGenres() async {
     try {
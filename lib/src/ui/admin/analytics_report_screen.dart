@@ -2,6 +2,7 @@ import 'package:flutter/material.dart';
 import 'package:cloud_firestore/cloud_firestore.dart';
 import 'package:fl_chart/fl_chart.dart';
 import 'package:fyp_cinema_app/res/color_app.dart';
+import 'package:fyp_cinema_app/src/services/recommendation_service.dart';
 
 class AnalyticsReportScreen extends StatefulWidget {
   const AnalyticsReportScreen({super.key});
@@ -26,6 +27,28 @@ class _AnalyticsReportScreenState extends State<AnalyticsReportScreen> {
     try {
       setState(() => _isLoading = true);
 
+      // Prefer the server's pre-aggregated rollups over reading every user's subcollections
+      final report = await RecommendationService().getAnalyticsReport(_selectedPeriod);
+      if (report != null) {
+        Map<String, double> doubles(dynamic map) => (map as Map? ?? {})
+            .map((key, value) => MapEntry(key as String, (value as num).toDouble()));
+        Map<String, int> ints(dynamic map) => (map as Map? ?? {})
+            .map((key, value) => MapEntry(key as String, (value as num).toInt()));
+
+        setState(() {
+          _analytics = {
+            ...report,
+            'revenueByCinema': doubles(report['revenueByCinema']),
+            'showtimeCounts': ints(report['showtimeCounts']),
+            'foodItemCounts': ints(report['foodItemCounts']),
+            'movieBookingCounts': ints(report['movieBookingCounts']),
+            'dailyRevenue': doubles(report['dailyRevenue']),
+          };
+          _isLoading = false;
+        });
+        return;
+      }
+
       final now = DateTime.now();
       DateTime startDate;
       
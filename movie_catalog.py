@@ -0,0 +1,473 @@
+"""
+In-memory movie catalog with bitmap indexes for candidate generation,
+catalog-wide text features and on-disk snapshots for warm restarts
+"""
+
+import copy
+import json
+import os
+import shutil
+import time
+import zlib
+
+import numpy as np
+from scipy import sparse
+
+from firestore_rest import parse_timestamp
+from text_features import TextFeaturePipeline
+
+SNAPSHOT_FORMAT = "cinelook-catalog"
+SNAPSHOT_VERSION = 6
+
+# Request filter keys -> catalog field they index
+INDEXED_FIELDS = {
+    'categories': 'categories',
+    'cinema_brands': 'cinemaBrands',
+    'languages': 'original_language',
+}
+
+
+# Profile attribute kind -> catalog field; each (kind, value) pair is one column of the attribute matrix
+ATTRIBUTE_FIELDS = {
+    'genre': 'genres',
+    'actor': 'cast',
+    'director': 'director',
+}
+# Per-movie numbers kept as float32 columns; 'popularity' is overwritten with booking velocity (see popularity.py),
+# 'tmdb_popularity' comes from TMDB enrichment (see tmdb_enrichment.py)
+NUMERIC_FIELDS = ('vote_average', 'runtime', 'popularity', 'tmdb_popularity')
+
+
+def movie_attributes(movie):
+    """(kind, value) pairs a movie contributes to user profiles, e.g. ('genre', 'Action')"""
+    for kind, field in ATTRIBUTE_FIELDS.items():
+        values = movie.get(field) or []
+        if isinstance(values, str):
+            values = [values]
+        for value in values:
+            if value:
+                yield kind, value
+
+
+def numeric_value(movie, field):
+    value = movie.get(field)
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else 0.0
+
+
+def release_key(release_date):
+    """Convert a 'YYYY-MM-DD' release date into a sortable integer (YYYYMMDD), 0 if unknown"""
+    if not release_date:
+        return 0
+    digits = str(release_date)[:10].replace('-', '')
+    if len(digits) != 8 or not digits.isdigit():
+        return 0
+    return int(digits)
+
+
+def shard_of(movie_id, shard_count):
+    """Shard a movie belongs to; a stable hash, so every process and node agrees"""
+    return zlib.crc32(str(movie_id).encode('utf-8')) % shard_count
+
+
+def parse_candidate_filter(raw_filter):
+    """Validate a request-level candidate filter such as {"categories": "now_playing", "cinema_brands": ["GSC"]}"""
+    if not raw_filter:
+        return None
+    if not isinstance(raw_filter, dict):
+        raise ValueError("filters must be an object")
+
+    criteria = {}
+    for key in INDEXED_FIELDS:
+        values = raw_filter.get(key)
+        if values is None or values == []:
+            continue
+        if isinstance(values, str):
+            values = [values]
+        if not isinstance(values, list) or not all(isinstance(v, str) for v in values):
+            raise ValueError(f"filters.{key} must be a string or a list of strings")
+        criteria[key] = values
+
+    for key in ('released_from', 'released_to'):
+        value = raw_filter.get(key)
+        if value is None:
+            continue
+        if not release_key(value):
+            raise ValueError(f"filters.{key} must be a date in YYYY-MM-DD format")
+        criteria[key] = release_key(value)
+
+    unknown = set(raw_filter) - set(INDEXED_FIELDS) - {'released_from', 'released_to'}
+    if unknown:
+        raise ValueError(f"Unsupported filter keys: {sorted(unknown)}")
+
+    return criteria or None
+
+
+class MovieCatalog:
+    """Row-oriented movie catalog with one boolean bitmap per indexed field value"""
+
+    def __init__(self, text_features=None):
+        self.movies = []
+        self.row_by_id = {}
+        self.bitmaps = {key: {} for key in INDEXED_FIELDS}
+        self.release_keys = np.zeros(0, dtype=np.int32)
+        self.numeric = {field: np.zeros(0, dtype=np.float32) for field in NUMERIC_FIELDS}
+        # Movie x (kind, value) incidence matrix, so a user profile is one weighted sum over booked rows
+        self.attribute_names = []
+        self.attribute_columns = {}
+        self.attribute_matrix = sparse.csr_matrix((0, 0), dtype=np.float32)
+        # Deleted rows stay in place (masked out) until the next full rebuild
+        self.live = np.ones(0, dtype=bool)
+        # Unfitted template until fit_text_features; a fitted pipeline is never refitted in place
+        self.text_features = text_features or TextFeaturePipeline()
+        self.feature_matrix = None
+
+    def __len__(self):
+        return int(np.count_nonzero(self.live))
+
+    def get(self, movie_id):
+        """Live movie dict by id, or None"""
+        row = self.row_by_id.get(str(movie_id))
+        return self.movies[row] if row is not None else None
+
+    def load(self, movies):
+        """Replace the catalog contents and rebuild the indexes; returns False if nothing changed"""
+        if movies == self.movies:
+            return False
+
+        self.movies = list(movies)
+        self.row_by_id = {str(movie.get('id')): row for row, movie in enumerate(self.movies)}
+        self.live = np.ones(len(self.movies), dtype=bool)
+        self._build_indexes()
+        self.fit_text_features()
+        return True
+
+    def apply_changes(self, changes):
+        """Return a new catalog with ('upsert', movie) / ('delete', movie_id) changes patched in, in order
+
+        Only the touched rows are re-indexed and re-vectorised with the existing vocabulary; the
+        current catalog is left untouched so concurrent readers never see a half-applied change.
+        """
+        catalog = copy.copy(self)
+        catalog.movies = list(self.movies)
+        catalog.row_by_id = dict(self.row_by_id)
+
+        # Assign rows first so every array grows exactly once
+        touched_rows = set()
+        for kind, payload in changes:
+            if kind == 'delete':
+                catalog.row_by_id.pop(str(payload), None)
+                continue
+            movie_id = str(payload.get('id'))
+            row = catalog.row_by_id.get(movie_id)
+            if row is None:
+                row = len(catalog.movies)
+                catalog.movies.append(payload)
+                catalog.row_by_id[movie_id] = row
+            else:
+                catalog.movies[row] = payload
+            touched_rows.add(row)
+
+        grown = len(catalog.movies) - len(self.movies)
+        catalog.live = np.zeros(len(catalog.movies), dtype=bool)
+        catalog.live[list(catalog.row_by_id.values())] = True
+        catalog.release_keys = np.concatenate([self.release_keys, np.zeros(grown, dtype=np.int32)])
+        catalog.numeric = {field: np.concatenate([values, np.zeros(grown, dtype=np.float32)]) for field, values in self.numeric.items()}
+        catalog.bitmaps = {
+            key: {value: np.concatenate([bitmap, np.zeros(grown, dtype=bool)]) for value, bitmap in field_bitmaps.items()}
+            for key, field_bitmaps in self.bitmaps.items()
+        }
+
+        touched_rows = sorted(row for row in touched_rows if catalog.live[row])
+        for row in touched_rows:
+            catalog._index_row(row, catalog.movies[row])
+        catalog._patch_text_rows(touched_rows, len(self.movies))
+        catalog._patch_attribute_rows(touched_rows, len(self.movies))
+        return catalog
+
+    def _index_row(self, row, movie):
+        """Point one row's bitmap bits and release key at the movie's current values"""
+        size = len(self.movies)
+        for key, field in INDEXED_FIELDS.items():
+            field_bitmaps = self.bitmaps[key]
+            for bitmap in field_bitmaps.values():
+                bitmap[row] = False
+            values = movie.get(field) or []
+            if isinstance(values, str):
+                values = [values]
+            for value in values:
+                value = value.lower()
+                if value not in field_bitmaps:
+                    field_bitmaps[value] = np.zeros(size, dtype=bool)
+                field_bitmaps[value][row] = True
+        self.release_keys[row] = release_key(movie.get('release_date'))
+        for field in NUMERIC_FIELDS:
+            self.numeric[field][row] = numeric_value(movie, field)
+
+    def _patch_text_rows(self, rows, previous_size):
+        """Re-vectorise only the given rows against the fitted vocabulary instead of refitting"""
+        if self.feature_matrix is None:
+            self.fit_text_features()
+            return
+        if not rows:
+            return
+        vectors = self.text_features.transform([self.movies[row] for row in rows])
+        stacked = sparse.vstack([self.feature_matrix, vectors], format='csr')
+        # Row selection: untouched rows keep their old vector, touched rows take the fresh one
+        order = np.arange(len(self.movies))
+        order[rows] = previous_size + np.arange(len(rows))
+        self.feature_matrix = stacked[order]
+
+    def set_numeric(self, field, values):
+        """Swap in a whole numeric column; readers holding the old dict keep a consistent view"""
+        self.numeric = dict(self.numeric, **{field: np.asarray(values, dtype=np.float32)})
+
+    def _attribute_block(self, movies):
+        """Attribute rows for movies, adding columns for values the catalog has not seen yet"""
+        indptr, indices = [0], []
+        for movie in movies:
+            columns = set()
+            for attribute in movie_attributes(movie):
+                column = self.attribute_columns.get(attribute)
+                if column is None:
+                    column = self.attribute_columns[attribute] = len(self.attribute_names)
+                    self.attribute_names.append(attribute)
+                columns.add(column)
+            indices.extend(sorted(columns))
+            indptr.append(len(indices))
+        return sparse.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+            shape=(len(movies), len(self.attribute_names))
+        )
+
+    def _patch_attribute_rows(self, rows, previous_size):
+        """Rebuild only the given attribute rows; new values append columns instead of renumbering"""
+        if not rows:
+            return
+        # Copy-on-write: the previous catalog keeps its own column mapping
+        self.attribute_names = list(self.attribute_names)
+        self.attribute_columns = dict(self.attribute_columns)
+        block = self._attribute_block([self.movies[row] for row in rows])
+        old = self.attribute_matrix
+        widened = sparse.csr_matrix((old.data, old.indices, old.indptr), shape=(old.shape[0], len(self.attribute_names)))
+        stacked = sparse.vstack([widened, block], format='csr')
+        order = np.arange(len(self.movies))
+        order[rows] = previous_size + np.arange(len(rows))
+        self.attribute_matrix = stacked[order]
+
+    def aggregate_attributes(self, rows, weights):
+        """Weighted sum of the given rows' attributes: {(kind, value): weight}, in one sparse product"""
+        if not len(rows):
+            return {}
+        totals = sparse.csr_matrix(np.asarray(weights, dtype=np.float32)[None, :]) @ self.attribute_matrix[rows]
+        totals = totals.tocoo()
+        return {self.attribute_names[column]: float(value) for column, value in zip(totals.col, totals.data) if value}
+
+    def shard(self, index, count):
+        """Catalog of the live movies in shard index of count, sharing this catalog's vocabularies and attribute columns"""
+        rows = np.array([row for row in np.flatnonzero(self.live) if shard_of(self.movies[row].get('id'), count) == index], dtype=np.int64)
+        shard = MovieCatalog(self.text_features)
+        shard.movies = [self.movies[row] for row in rows]
+        shard.row_by_id = {str(movie.get('id')): row for row, movie in enumerate(shard.movies)}
+        shard.live = np.ones(len(rows), dtype=bool)
+        shard.bitmaps = {key: {value: np.asarray(bitmap)[rows] for value, bitmap in field_bitmaps.items()}
+                         for key, field_bitmaps in self.bitmaps.items()}
+        shard.release_keys = np.asarray(self.release_keys)[rows]
+        shard.numeric = {field: np.asarray(values)[rows] for field, values in self.numeric.items()}
+        shard.attribute_names = self.attribute_names
+        shard.attribute_columns = self.attribute_columns
+        shard.attribute_matrix = self.attribute_matrix[rows]
+        shard.feature_matrix = self.feature_matrix[rows] if self.feature_matrix is not None else None
+        return shard
+
+    def latest_update(self):
+        """Most recent updatedAt timestamp among live movies, used to resume the change feed"""
+        latest, latest_raw = None, None
+        for row in np.flatnonzero(self.live):
+            raw = self.movies[row].get('updated_at')
+            parsed = parse_timestamp(raw)
+            if parsed and (latest is None or parsed > latest):
+                latest, latest_raw = parsed, raw
+        return latest_raw
+
+    def _build_indexes(self):
+        """Build bitmaps for categories, cinema brands and language plus the release date column"""
+        size = len(self.movies)
+        self.bitmaps = {key: {} for key in INDEXED_FIELDS}
+        for key, field in INDEXED_FIELDS.items():
+            field_bitmaps = self.bitmaps[key]
+            for row, movie in enumerate(self.movies):
+                values = movie.get(field) or []
+                if isinstance(values, str):
+                    values = [values]
+                for value in values:
+                    value = value.lower()
+                    if value not in field_bitmaps:
+                        field_bitmaps[value] = np.zeros(size, dtype=bool)
+                    field_bitmaps[value][row] = True
+
+        # Release window is a range query, so a sorted-comparable column serves it better than bitmaps
+        self.release_keys = np.array([release_key(movie.get('release_date')) for movie in self.movies], dtype=np.int32)
+        self.numeric = {
+            field: np.array([numeric_value(movie, field) for movie in self.movies], dtype=np.float32)
+            for field in NUMERIC_FIELDS
+        }
+
+        self.attribute_names = []
+        self.attribute_columns = {}
+        self.attribute_matrix = self._attribute_block(self.movies)
+
+    def fit_text_features(self):
+        """Fit the text feature vocabularies once per catalog version so requests only look up rows"""
+        # A fresh pipeline, because catalogs derived with apply_changes share the fitted one
+        self.text_features = self.text_features.clone()
+        self.feature_matrix = None
+        if not self.movies:
+            return
+        self.feature_matrix = self.text_features.fit_transform(self.movies)
+
+    def text_vector(self, movie):
+        """Feature row for a movie, transforming it on the fly if it is not in the catalog"""
+        if self.feature_matrix is None:
+            return None
+        row = self.row_by_id.get(str(movie.get('id')))
+        if row is not None:
+            return self.feature_matrix[row]
+        return self.text_features.transform([movie])
+
+    def candidate_mask(self, criteria=None):
+        """Combine bitmaps: values within one field are OR-ed, fields are AND-ed"""
+        mask = np.array(self.live, dtype=bool)
+        if not criteria:
+            return mask
+
+        for key in INDEXED_FIELDS:
+            if key not in criteria:
+                continue
+            field_mask = np.zeros(len(self.movies), dtype=bool)
+            for value in criteria[key]:
+                bitmap = self.bitmaps[key].get(value.lower())
+                if bitmap is not None:
+                    field_mask |= bitmap
+            mask &= field_mask
+
+        if 'released_from' in criteria:
+            mask &= self.release_keys >= criteria['released_from']
+        if 'released_to' in criteria:
+            mask &= (self.release_keys > 0) & (self.release_keys <= criteria['released_to'])
+
+        return mask
+
+    def candidate_rows(self, criteria=None):
+        """Row numbers of movies matching the filter"""
+        return np.flatnonzero(self.candidate_mask(criteria))
+
+    def candidates(self, criteria=None):
+        """Movies matching the filter, in catalog order"""
+        if not criteria and self.live.all():
+            return list(self.movies)
+        return [self.movies[row] for row in self.candidate_rows(criteria)]
+
+    def save_snapshot(self, path):
+        """Persist rows, feature and attribute matrices, vocabularies and indexes as .npy files plus a manifest, atomically"""
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        bitmap_keys = [[key, value] for key in INDEXED_FIELDS for value in sorted(self.bitmaps[key])]
+        bitmap_matrix = np.zeros((len(bitmap_keys), len(self.movies)), dtype=bool)
+        for i, (key, value) in enumerate(bitmap_keys):
+            bitmap_matrix[i] = self.bitmaps[key][value]
+
+        with open(os.path.join(tmp_path, 'movies.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.movies, f, ensure_ascii=False, separators=(',', ':'))
+        np.save(os.path.join(tmp_path, 'bitmaps.npy'), bitmap_matrix)
+        np.save(os.path.join(tmp_path, 'release_keys.npy'), self.release_keys)
+        np.save(os.path.join(tmp_path, 'live.npy'), self.live)
+        for field, values in self.numeric.items():
+            np.save(os.path.join(tmp_path, f'numeric_{field}.npy'), values)
+        attributes = self.attribute_matrix
+        np.save(os.path.join(tmp_path, 'attributes_data.npy'), attributes.data.astype(np.float32))
+        np.save(os.path.join(tmp_path, 'attributes_indices.npy'), attributes.indices.astype(np.int32))
+        np.save(os.path.join(tmp_path, 'attributes_indptr.npy'), attributes.indptr.astype(np.int64))
+        with open(os.path.join(tmp_path, 'attribute_names.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.attribute_names, f, ensure_ascii=False)
+
+        has_text_features = self.feature_matrix is not None
+        if has_text_features:
+            matrix = self.feature_matrix
+            np.save(os.path.join(tmp_path, 'features_data.npy'), matrix.data.astype(np.float32))
+            np.save(os.path.join(tmp_path, 'features_indices.npy'), matrix.indices.astype(np.int32))
+            np.save(os.path.join(tmp_path, 'features_indptr.npy'), matrix.indptr.astype(np.int64))
+            self.text_features.save(tmp_path)
+
+        manifest = {
+            'format': SNAPSHOT_FORMAT,
+            'version': SNAPSHOT_VERSION,
+            'created_at': time.time(),
+            'movie_count': len(self.movies),
+            'bitmap_keys': bitmap_keys,
+            'has_text_features': has_text_features,
+            'text_features': self.text_features.config(),
+            'features_shape': list(self.feature_matrix.shape) if has_text_features else None,
+        }
+        # The manifest is written last so a half-written directory is never mistaken for a snapshot
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        old_path = f"{path}.old-{os.getpid()}"
+        if os.path.exists(path):
+            os.rename(path, old_path)
+        os.rename(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+    @classmethod
+    def load_snapshot(cls, path, mmap=True, text_features=None):
+        """Boot a catalog from a snapshot directory; numeric arrays are memory-mapped. Returns None if unusable
+
+        When text_features is given, a snapshot built with a different feature configuration is rejected.
+        """
+        manifest_path = os.path.join(path, 'manifest.json')
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('format') != SNAPSHOT_FORMAT or manifest.get('version') != SNAPSHOT_VERSION:
+            print(f"[WARNING] Ignoring catalog snapshot with format {manifest.get('format')} v{manifest.get('version')}")
+            return None
+        if text_features is not None and manifest.get('text_features') != text_features.config():
+            print("[WARNING] Ignoring catalog snapshot built with a different text feature configuration")
+            return None
+
+        mmap_mode = 'r' if mmap else None
+        catalog = cls(text_features)
+        with open(os.path.join(path, 'movies.json'), encoding='utf-8') as f:
+            catalog.movies = json.load(f)
+        catalog.row_by_id = {str(movie.get('id')): row for row, movie in enumerate(catalog.movies)}
+
+        bitmap_matrix = np.load(os.path.join(path, 'bitmaps.npy'), mmap_mode=mmap_mode)
+        for i, (key, value) in enumerate(manifest['bitmap_keys']):
+            catalog.bitmaps[key][value] = bitmap_matrix[i]
+        catalog.release_keys = np.load(os.path.join(path, 'release_keys.npy'), mmap_mode=mmap_mode)
+        catalog.live = np.load(os.path.join(path, 'live.npy'), mmap_mode=mmap_mode)
+        catalog.row_by_id = {movie_id: row for movie_id, row in catalog.row_by_id.items() if catalog.live[row]}
+        catalog.numeric = {
+            field: np.load(os.path.join(path, f'numeric_{field}.npy'), mmap_mode=mmap_mode) for field in NUMERIC_FIELDS
+        }
+        with open(os.path.join(path, 'attribute_names.json'), encoding='utf-8') as f:
+            catalog.attribute_names = [tuple(name) for name in json.load(f)]
+        catalog.attribute_columns = {name: column for column, name in enumerate(catalog.attribute_names)}
+        catalog.attribute_matrix = sparse.csr_matrix((
+            np.load(os.path.join(path, 'attributes_data.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'attributes_indices.npy'), mmap_mode=mmap_mode),
+            np.load(os.path.join(path, 'attributes_indptr.npy'), mmap_mode=mmap_mode)
+        ), shape=(len(catalog.movies), len(catalog.attribute_names)), copy=False)
+
+        if manifest.get('has_text_features'):
+            catalog.feature_matrix = sparse.csr_matrix((
+                np.load(os.path.join(path, 'features_data.npy'), mmap_mode=mmap_mode),
+                np.load(os.path.join(path, 'features_indices.npy'), mmap_mode=mmap_mode),
+                np.load(os.path.join(path, 'features_indptr.npy'), mmap_mode=mmap_mode)
+            ), shape=tuple(manifest['features_shape']), copy=False)
+            catalog.text_features = TextFeaturePipeline.load(path)
+
+        return catalog
@@ -0,0 +1,147 @@
+"""
+Booking-velocity popularity
+
+Every booking adds 1 to its movie's score and scores decay exponentially
+with a configurable half-life, so a movie's score is roughly "bookings in
+the last half-life", weighted towards the most recent ones. Scores are
+updated incrementally from the bookings collection group, ordered by
+bookingDate, and pushed into the catalog's 'popularity' column for ranking.
+Reading every user's bookings is admin-only under firestore.rules, so polls
+carry service credentials (see firebase_auth.py); a denied poll raises
+PermissionError rather than looking like a quiet catalog.
+"""
+
+import threading
+import time
+
+import numpy as np
+import requests
+
+from firebase_auth import service_headers
+from firestore_rest import DEFAULT_PAGE_SIZE, decode_fields, parse_timestamp, run_query
+
+DEFAULT_HALF_LIFE_HOURS = 72.0
+# Scores that have decayed below this are dropped so the table only holds recently booked movies
+MIN_SCORE = 1e-3
+
+
+def booking_timestamp(booking):
+    """Epoch seconds of a booking's bookingDate (ISO string, naive values are local time), or None"""
+    parsed = parse_timestamp(booking.get('bookingDate')) if isinstance(booking.get('bookingDate'), str) else None
+    return parsed.timestamp() if parsed else None
+
+
+class BookingVelocity:
+    """Exponentially decayed booking counts per movie, advanced by polling new bookings"""
+
+    def __init__(self, half_life_hours=DEFAULT_HALF_LIFE_HOURS, page_size=DEFAULT_PAGE_SIZE, session=None, base_url=None,
+                 credentials=None):
+        self.half_life = half_life_hours * 3600
+        self.page_size = page_size
+        self.session = session
+        self.base_url = base_url
+        # firebase_auth.ServiceToken for the bookings collection group
+        self.credentials = credentials
+        # Why the last poll failed, None once a poll succeeds
+        self.last_error = None
+        self.lock = threading.Lock()
+        # movie id -> decayed score as of self.as_of
+        self.scores = {}
+        # movie id -> bookings seen in total
+        self.counts = {}
+        self.as_of = time.time()
+        # (bookingDate, document name) of the last booking read
+        self.cursor = None
+        self.stats = {'polls': 0, 'bookings': 0, 'denied': 0}
+
+    def _decay_to(self, now):
+        """Bring every score forward to `now`; caller holds the lock"""
+        if now <= self.as_of:
+            return
+        factor = 0.5 ** ((now - self.as_of) / self.half_life)
+        self.scores = {movie_id: score * factor for movie_id, score in self.scores.items() if score * factor >= MIN_SCORE}
+        self.as_of = now
+
+    def add_bookings(self, bookings, now=None):
+        """Count bookings (plain dicts with movieId, bookingDate and status) into the scores"""
+        now = now or time.time()
+        with self.lock:
+            self._decay_to(now)
+            for booking in bookings:
+                movie_id = str(booking.get('movieId') or '')
+                if not movie_id or booking.get('status') == 'cancelled':
+                    continue
+                booked_at = booking_timestamp(booking) or now
+                weight = 0.5 ** (max(now - booked_at, 0) / self.half_life)
+                if weight >= MIN_SCORE:
+                    self.scores[movie_id] = self.scores.get(movie_id, 0.0) + weight
+                self.counts[movie_id] = self.counts.get(movie_id, 0) + 1
+                self.stats['bookings'] += 1
+
+    def poll(self):
+        """
+        Read bookings made since the last poll (the first poll reads them all); returns how many were counted
+        Raises PermissionError when Firestore refuses the read (missing or rejected credentials)
+        """
+        try:
+            counted = self._poll()
+        except requests.HTTPError as e:
+            status = getattr(e.response, 'status_code', None)
+            self.last_error = str(e)
+            if status in (401, 403):
+                self.stats['denied'] += 1
+                self.last_error = (f"Firestore denied the bookings read ({status}); set FIRESTORE_ACCESS_TOKEN "
+                                   f"or FIRESTORE_TOKEN_SOURCE so the poll runs with service credentials")
+                raise PermissionError(self.last_error) from e
+            raise
+        self.last_error = None
+        return counted
+
+    def _poll(self):
+        before = self.stats['bookings']
+        while True:
+            query = {
+                'from': [{'collectionId': 'bookings', 'allDescendants': True}],
+                'orderBy': [
+                    {'field': {'fieldPath': 'bookingDate'}, 'direction': 'ASCENDING'},
+                    {'field': {'fieldPath': '__name__'}, 'direction': 'ASCENDING'},
+                ],
+                'limit': self.page_size,
+            }
+            if self.cursor:
+                booking_date, name = self.cursor
+                query['startAt'] = {'values': [{'stringValue': booking_date}, {'referenceValue': name}], 'before': False}
+
+            page = run_query(query, session=self.session, base_url=self.base_url, headers=service_headers(self.credentials))
+            self.add_bookings([decode_fields(doc) for doc in page])
+            if page:
+                last = page[-1]
+                self.cursor = (last['fields']['bookingDate'].get('stringValue', ''), last['name'])
+            if len(page) < self.page_size:
+                break
+        self.stats['polls'] += 1
+        return self.stats['bookings'] - before
+
+    def current_scores(self, now=None):
+        with self.lock:
+            self._decay_to(now or time.time())
+            return dict(self.scores)
+
+    def catalog_column(self, catalog, now=None):
+        """Scores aligned to the catalog's rows, for its 'popularity' column"""
+        return self._column(catalog, self.current_scores(now))
+
+    def count_column(self, catalog):
+        """All-time booking counts aligned to the catalog's rows"""
+        with self.lock:
+            counts = dict(self.counts)
+        return self._column(catalog, counts)
+
+    @staticmethod
+    def _column(catalog, scores):
+        column = np.zeros(len(catalog.movies), dtype=np.float32)
+        for movie_id, score in scores.items():
+            row = catalog.row_by_id.get(movie_id)
+            if row is not None:
+                column[row] = score
+        return column
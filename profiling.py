@@ -0,0 +1,238 @@
+"""
+On-demand profiling of a live recommendation worker
+
+Three capture modes, all idle (no hooks installed) until started:
+- SamplingProfiler: a background thread samples every other thread's stack
+  every few milliseconds for a bounded number of seconds
+- RequestProfiler: cProfile around the next N requests' work; request
+  handlers pass their work through wrap(), which is a plain function call
+  while nothing is armed
+- MemoryProfiler: tracemalloc snapshots, optionally diffed against the
+  snapshot taken when tracing started
+
+Every mode can be exported as collapsed stacks ("frame;frame;frame count"
+lines), which flamegraph.pl, speedscope and inferno read directly.
+"""
+
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+MAX_SAMPLE_SECONDS = 120
+# cProfile's call graph is expanded into stacks no deeper than this
+MAX_STACK_DEPTH = 64
+
+
+def frame_label(filename, lineno, name=None):
+    """'module.py:function:line' ('module.py:line' without a function name), short enough for flamegraph labels"""
+    if name is None:
+        return f"{os.path.basename(filename)}:{lineno}"
+    return f"{os.path.basename(filename)}:{name}:{lineno}"
+
+
+def collapsed(counts):
+    """Collapsed-stack text from {(frame, ...): count}, heaviest first"""
+    lines = [f"{';'.join(stack)} {int(count)}" for stack, count in counts.most_common() if int(count) > 0]
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Time-bounded stack sampling of every thread in the process except the sampler itself"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+        self.stacks = Counter()
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+
+    def _sample_stacks(self, interval, duration):
+        me = threading.get_ident()
+        deadline = time.time() + duration
+        while time.time() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(frame_label(code.co_filename, frame.f_lineno, code.co_name))
+                    frame = frame.f_back
+                self.stacks[tuple(reversed(stack))] += 1
+            self.samples += 1
+            time.sleep(interval)
+
+    def run(self, duration, interval=DEFAULT_SAMPLE_INTERVAL):
+        """Sample for duration seconds (blocking) and return the collapsed stacks; raises RuntimeError if already running"""
+        duration = min(float(duration), MAX_SAMPLE_SECONDS)
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A sampling profile is already being captured")
+            self.running = True
+            self.stacks = Counter()
+            self.samples = 0
+            self.started_at = time.time()
+            self.duration = duration
+        try:
+            self._sample_stacks(interval, duration)
+        finally:
+            self.running = False
+        return collapsed(self.stacks)
+
+    def status(self):
+        return {'running': self.running, 'samples': self.samples, 'started_at': self.started_at, 'duration': self.duration}
+
+
+def expand_call_graph(stats, unit=1e6):
+    """
+    Collapsed stacks from cProfile stats, in microseconds
+    cProfile only records caller -> callee edges, so each function's time is split across the paths
+    reaching it in proportion to the time spent on each edge (the flameprof approach)
+    """
+    callees = {}
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, (_, _, _, edge_cumulative) in callers.items():
+            callees.setdefault(caller, []).append((func, edge_cumulative))
+
+    counts = Counter()
+
+    def visit(func, path, budget):
+        _, _, own, cumulative, _ = stats.stats[func]
+        # Paths worth under a microsecond are dropped, which also keeps the expansion from exploding
+        if cumulative <= 0 or budget * unit < 1 or len(path) > MAX_STACK_DEPTH:
+            return
+        share = min(budget / cumulative, 1.0)
+        counts[path] += own * share * unit
+        for callee, edge_cumulative in callees.get(func, []):
+            label = frame_label(*callee)
+            if label not in path:
+                visit(callee, path + (label,), edge_cumulative * share)
+
+    for func, (_, _, _, cumulative, callers) in stats.stats.items():
+        if not callers:
+            visit(func, (frame_label(*func),), cumulative)
+    return counts
+
+
+class RequestProfiler:
+    """cProfile of the next N wrapped calls, merged into one set of stats"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.profiled = 0
+        self.stats = None
+
+    def arm(self, count):
+        """Profile the next count calls, discarding any earlier capture"""
+        with self._lock:
+            self.remaining = int(count)
+            self.profiled = 0
+            self.stats = None
+
+    def wrap(self, fn):
+        """fn itself while disarmed (a single attribute read); otherwise fn run under cProfile if a slot is left"""
+        if not self.remaining:
+            return fn
+
+        def profiled(*args, **kwargs):
+            with self._lock:
+                if self.remaining <= 0:
+                    take = False
+                else:
+                    self.remaining -= 1
+                    take = True
+            if not take:
+                return fn(*args, **kwargs)
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(fn, *args, **kwargs)
+            finally:
+                with self._lock:
+                    if self.stats is None:
+                        self.stats = pstats.Stats(profile)
+                    else:
+                        self.stats.add(profile)
+                    self.profiled += 1
+
+        return profiled
+
+    def status(self):
+        return {'remaining': self.remaining, 'profiled': self.profiled}
+
+    def export(self, fmt='collapsed', sort='cumulative', limit=50):
+        """Captured stats as 'collapsed' stacks (microseconds), a 'text' pstats report or raw 'prof' bytes; None if nothing was captured"""
+        with self._lock:
+            stats = self.stats
+            if stats is None:
+                return None
+            if fmt == 'prof':
+                # Same format as cProfile's dump_stats, loadable by pstats / snakeviz
+                return marshal.dumps(stats.stats)
+            if fmt == 'text':
+                stream = io.StringIO()
+                report = pstats.Stats(stream=stream)
+                report.add(stats)
+                report.sort_stats(sort).print_stats(limit)
+                return stream.getvalue()
+            return collapsed(expand_call_graph(stats))
+
+
+class MemoryProfiler:
+    """tracemalloc start/stop plus snapshots, optionally diffed against the snapshot taken at start"""
+
+    def __init__(self):
+        self.baseline = None
+
+    @property
+    def running(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, frames=25):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(int(frames))
+        self.baseline = tracemalloc.take_snapshot()
+
+    def stop(self):
+        self.baseline = None
+        tracemalloc.stop()
+
+    def _snapshot(self):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("Memory tracing is not running")
+        # Leave out tracemalloc's and this module's own allocations
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+
+    def top(self, limit=30, key_type='lineno', diff=False):
+        """Largest allocation sites (or growth since start when diff) as JSON-ready dicts"""
+        snapshot = self._snapshot()
+        if diff and self.baseline is not None:
+            stats = snapshot.compare_to(self.baseline, key_type)
+            return [{'location': str(stat.traceback[0]), 'size': stat.size, 'size_diff': stat.size_diff,
+                     'count': stat.count, 'count_diff': stat.count_diff} for stat in stats[:limit]]
+        return [{'location': str(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                for stat in snapshot.statistics(key_type)[:limit]]
+
+    def export(self):
+        """Live allocations as collapsed stacks weighted by bytes"""
+        counts = Counter()
+        for stat in self._snapshot().statistics('traceback'):
+            stack = tuple(frame_label(frame.filename, frame.lineno) for frame in stat.traceback)
+            counts[stack] += stat.size
+        return collapsed(counts)
+
+    def status(self):
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {'running': self.running, 'current_bytes': current, 'peak_bytes': peak}
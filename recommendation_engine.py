@@ -1,21 +1,40 @@
-from flask import Flask, request, jsonify
-import pandas as pd
+from flask import Flask, request, jsonify, Response, stream_with_context
 import requests
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+import functools
+import heapq
+import hmac
 import json
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from movie_catalog import MovieCatalog, parse_candidate_filter
+from text_features import TextFeaturePipeline, parse_field_weights
+from user_profiles import build_user_profile, counted_bookings, movie_weights
+from reranking import make_reranker, top_k_indices
+from popularity import BookingVelocity
+from firestore_rest import FIREBASE_REST_API_BASE, cast_names, decode_movie_document, get_field_value
+from recommendation_export import DEFAULT_EXPORT_WORKERS, iter_ndjson_export
+from catalog_sync import CatalogChangeFeed
+from single_flight import SingleFlight
+from analytics_service import ANALYTICS_PERIODS, AnalyticsService
+from admission_control import AdmissionController, RecentResults
+from response_shaping import json_response
+from booking_history import expand_compact_history, history_hash, read_request_body
+from profiling import MemoryProfiler, RequestProfiler, SamplingProfiler
+from traffic_capture import TrafficRecorder
+from sharded_scoring import HttpShards, ProcessShards, ShardedScorer, make_query, parse_similarity_weights
+from shared_cache import make_cache
+from seat_availability import HoldLimitExceeded, SeatAvailabilityService, SeatConflict, SeatPersistenceError, seat_document_path, showtime_id
+from firebase_auth import AdminDirectory, IdTokenVerifier, ServiceToken
+from tmdb_enrichment import EnrichmentStore
+from genre_matching import ACTOR_CONFIDENCE_BONUS, GENRE_SIMILARITY, genre_confidence, genre_match_score, genre_score
 
 # Load environment variables
 load_dotenv('movie_api.env')
 
-# Firebase configuration - using REST API instead of Admin SDK
-FIREBASE_PROJECT_ID = "fyp-cinema"
-FIREBASE_REST_API_BASE = f"https://firestore.googleapis.com/v1/projects/{FIREBASE_PROJECT_ID}/databases/(default)/documents"
-
 # Try to initialize Firebase REST API
 try:
     # Test Firebase connection with a simple request
@@ -32,16 +51,121 @@ except Exception as e:
     print(f"[ERROR] Firebase REST API initialization failed: {e}")
     FIREBASE_ENABLED = False
 
+# Service credentials for admin-only reads and seat write-back (FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE=metadata)
+firestore_credentials = ServiceToken.from_env()
+if FIREBASE_ENABLED and firestore_credentials is None:
+    print("[WARNING] No Firestore service credentials (FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE), admin-only reads will be denied")
+
 API_KEY = os.getenv('TMDB_API_KEY')
 if not API_KEY:
     print("[WARNING] TMDB_API_KEY not found in environment variables or movie_api.env")
 TMDB_BASE = 'https://api.themoviedb.org/3'
+# Keywords, director and TMDB popularity fetched offline by tmdb_enrichment.py, overlaid on Firestore movies
+TMDB_ENRICHMENT_PATH = os.getenv('TMDB_ENRICHMENT_PATH', 'tmdb_enrichment.json')
+
+# Catalog snapshot used for warm restarts, and how long a loaded catalog is trusted before re-reading Firestore
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot')
+CATALOG_REFRESH_SECONDS = int(os.getenv('CATALOG_REFRESH_SECONDS', '300'))
+# 'reload' re-reads the whole movies collection every CATALOG_REFRESH_SECONDS;
+# 'incremental' polls the updatedAt change feed every CATALOG_SYNC_SECONDS instead
+CATALOG_SYNC_MODE = os.getenv('CATALOG_SYNC_MODE', 'reload')
+CATALOG_SYNC_SECONDS = int(os.getenv('CATALOG_SYNC_SECONDS', '30'))
+# Content similarity features: 'tfidf' (fitted per-field vocabularies) or 'hashing' (no fitting),
+# and per-field weights such as "overview=1,genres=0.6,cast=0.4"
+TEXT_FEATURE_MODE = os.getenv('TEXT_FEATURE_MODE', 'tfidf')
+TEXT_FEATURE_WEIGHTS = parse_field_weights(os.getenv('TEXT_FEATURE_WEIGHTS'))
+# Age at which a booking counts half as much towards the user profile
+PROFILE_HALF_LIFE_DAYS = float(os.getenv('PROFILE_HALF_LIFE_DAYS', '180'))
+# Re-ranking after scoring: 'mmr' (diversified, per-genre capped) or 'score' (plain score order),
+# applied to the RERANK_POOL best-scoring candidates only
+RERANK_STRATEGY = os.getenv('RERANK_STRATEGY', 'mmr')
+RERANK_POOL = int(os.getenv('RERANK_POOL', '50'))
+RERANK_LAMBDA = float(os.getenv('RERANK_LAMBDA', '0.7'))
+RERANK_GENRE_CAP = int(os.getenv('RERANK_GENRE_CAP', '3'))
+# Similarity blend, e.g. "content=0.6,preference=0.4,genre=0.4,actor=0.3,director=0.2,rating=0.1"
+# (unlisted weights keep these defaults), and the confidence (%) a new user's best genre match needs
+# before genre-based results are shown instead of the most booked movies; tune both with
+# evaluate_recommendations.py
+SIMILARITY_WEIGHTS = parse_similarity_weights(os.getenv('SIMILARITY_WEIGHTS'))
+GENRE_CONFIDENCE_THRESHOLD = float(os.getenv('GENRE_CONFIDENCE_THRESHOLD', '60'))
+# Booking velocity: half-life of a booking's contribution, how often new bookings are read,
+# and how strongly (relative to the best-selling movie) velocity nudges ranking scores
+POPULARITY_HALF_LIFE_HOURS = float(os.getenv('POPULARITY_HALF_LIFE_HOURS', '72'))
+POPULARITY_POLL_SECONDS = int(os.getenv('POPULARITY_POLL_SECONDS', '60'))
+POPULARITY_WEIGHT = float(os.getenv('POPULARITY_WEIGHT', '0.1'))
+# Admission control: requests doing real work at once, how many more may wait for a slot,
+# per-endpoint deadlines (queue wait included) and how many recent results are kept to serve
+# (flagged degraded) when a request is shed
+ADMISSION_MAX_CONCURRENT = int(os.getenv('ADMISSION_MAX_CONCURRENT', '8'))
+ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))
+RECOMMEND_DEADLINE_SECONDS = float(os.getenv('RECOMMEND_DEADLINE_SECONDS', '10'))
+NEW_USER_DEADLINE_SECONDS = float(os.getenv('NEW_USER_DEADLINE_SECONDS', '10'))
+DEGRADED_CACHE_SIZE = int(os.getenv('DEGRADED_CACHE_SIZE', '1000'))
+# Processed booking histories kept per (user, history_hash) so returning clients can send just the hash
+HISTORY_CACHE_SIZE = int(os.getenv('HISTORY_CACHE_SIZE', '10000'))
+# Similar-movie requests stop fetching and scoring candidates after this budget (counted from request
+# arrival, so keep it below RECOMMEND_DEADLINE_SECONDS) and return the best found so far as partial;
+# candidates are fetched and scored in chunks of SIMILAR_SCORING_CHUNK, and no single metadata fetch
+# may take longer than MOVIE_FETCH_TIMEOUT_SECONDS
+SIMILAR_BUDGET_SECONDS = float(os.getenv('SIMILAR_BUDGET_SECONDS', '6'))
+SIMILAR_SCORING_CHUNK = int(os.getenv('SIMILAR_SCORING_CHUNK', '25'))
+MOVIE_FETCH_TIMEOUT_SECONDS = float(os.getenv('MOVIE_FETCH_TIMEOUT_SECONDS', '3'))
+# Admin endpoints take a signed-in admin's Firebase ID token (Authorization: Bearer, user listed in admins/),
+# or this shared secret as X-Admin-Token for server-to-server callers; never ship it in the app
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+# Opt-in sampled capture of recommendation requests (user ids anonymised) for replay_traffic.py;
+# set TRAFFIC_CAPTURE_SALT to link a user's requests across restarts
+TRAFFIC_CAPTURE_PATH = os.getenv('TRAFFIC_CAPTURE_PATH')
+TRAFFIC_CAPTURE_RATE = float(os.getenv('TRAFFIC_CAPTURE_RATE', '0.01'))
+TRAFFIC_CAPTURE_MAX_BYTES = int(os.getenv('TRAFFIC_CAPTURE_MAX_BYTES', str(50 * 1024 * 1024)))
+TRAFFIC_CAPTURE_SALT = os.getenv('TRAFFIC_CAPTURE_SALT')
+# Scatter-gather scoring: SCORING_SHARDS > 1 partitions the catalog over that many worker processes;
+# SCORING_SHARD_MODE=http sends queries to shard nodes (sharded_scoring.py) at SCORING_SHARD_URLS instead
+SCORING_SHARDS = int(os.getenv('SCORING_SHARDS', '0'))
+SCORING_SHARD_MODE = os.getenv('SCORING_SHARD_MODE', 'process')
+SCORING_SHARD_URLS = [url for url in os.getenv('SCORING_SHARD_URLS', '').split(',') if url]
+SCORING_SHARD_TIMEOUT = float(os.getenv('SCORING_SHARD_TIMEOUT', '5'))
+# Movie metadata cache: an in-process LRU plus an optional tier shared by all workers
+# (MOVIE_CACHE_BACKEND=redis with MOVIE_CACHE_URL, or =file with MOVIE_CACHE_DIR, e.g. under /dev/shm)
+MOVIE_CACHE_BACKEND = os.getenv('MOVIE_CACHE_BACKEND', 'memory')
+MOVIE_CACHE_URL = os.getenv('MOVIE_CACHE_URL', 'redis://127.0.0.1:6379/0')
+MOVIE_CACHE_DIR = os.getenv('MOVIE_CACHE_DIR')
+MOVIE_CACHE_TTL_SECONDS = int(os.getenv('MOVIE_CACHE_TTL_SECONDS', '3600'))
+MOVIE_CACHE_LOCAL_SIZE = int(os.getenv('MOVIE_CACHE_LOCAL_SIZE', '5000'))
+# Seat maps: layout of every hall (matches the app's seat grid), how long a checkout may hold seats,
+# how often showtimes are re-read from Firestore, and the write-back interval for confirmed seats
+SEAT_ROWS = int(os.getenv('SEAT_ROWS', '8'))
+SEAT_COLUMNS = int(os.getenv('SEAT_COLUMNS', '10'))
+SEAT_HOLD_TTL_SECONDS = int(os.getenv('SEAT_HOLD_TTL_SECONDS', '300'))
+SEAT_REFRESH_SECONDS = int(os.getenv('SEAT_REFRESH_SECONDS', '30'))
+SEAT_FLUSH_SECONDS = float(os.getenv('SEAT_FLUSH_SECONDS', '1'))
+# Seat actions need the user's Firebase ID token (checked with the project's web API key), and each user
+# may hold seats for this many checkouts at once; confirmed seats are only written back (and confirm only
+# succeeds) with service credentials, FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE=metadata
+FIREBASE_WEB_API_KEY = os.getenv('FIREBASE_WEB_API_KEY')
+SEAT_MAX_HOLDS_PER_USER = int(os.getenv('SEAT_MAX_HOLDS_PER_USER', '3'))
+# How long the admin analytics rollups are served before the next bulk pass over bookings and orders,
+# and the minimum age before an admin's ?refresh=1 may force one early
+ANALYTICS_REFRESH_SECONDS = int(os.getenv('ANALYTICS_REFRESH_SECONDS', '300'))
+ANALYTICS_MIN_REFRESH_SECONDS = int(os.getenv('ANALYTICS_MIN_REFRESH_SECONDS', '60'))
 
 app = Flask(__name__)
 
 class MovieRecommendationEngine:
     def __init__(self):
-        self.movie_cache = {}
+        self.movie_cache = make_cache(MOVIE_CACHE_BACKEND, MOVIE_CACHE_URL, MOVIE_CACHE_DIR,
+                                      MOVIE_CACHE_TTL_SECONDS, MOVIE_CACHE_LOCAL_SIZE, namespace='movie')
+        self.text_features = TextFeaturePipeline(TEXT_FEATURE_WEIGHTS, TEXT_FEATURE_MODE)
+        if RERANK_STRATEGY == 'mmr':
+            self.reranker = make_reranker('mmr', mmr_lambda=RERANK_LAMBDA, genre_cap=RERANK_GENRE_CAP)
+        else:
+            self.reranker = make_reranker(RERANK_STRATEGY)
+        self.catalog = MovieCatalog(self.text_features)
+        self.catalog_refreshed_at = 0
+        self.change_feed = None
+        # Coalesces concurrent identical Firestore fetches (thundering herd on cold or expired caches)
+        self.single_flight = SingleFlight()
+        self.booking_velocity = BookingVelocity(POPULARITY_HALF_LIFE_HOURS, credentials=firestore_credentials)
         self.genre_mapping = {
             28: "Action", 12: "Adventure", 16: "Animation", 35: "Comedy",
             80: "Crime", 99: "Documentary", 18: "Drama", 10751: "Family",
@@ -51,141 +175,56 @@ class MovieRecommendationEngine:
         }
         
         # Genre similarity mapping for fuzzy matching
-        self.genre_similarity = {
-            "Action": ["Adventure", "Thriller", "Crime", "War"],
-            "Adventure": ["Action", "Fantasy", "Thriller"],
-            "Animation": ["Family", "Comedy", "Fantasy"],
-            "Comedy": ["Animation", "Family", "Romance"],
-            "Crime": ["Action", "Thriller", "Mystery", "Drama"],
-            "Documentary": ["History", "Drama"],
-            "Drama": ["Romance", "Crime", "History", "War"],
-            "Family": ["Animation", "Comedy", "Adventure"],
-            "Fantasy": ["Adventure", "Animation", "Sci-Fi"],
-            "History": ["Drama", "War", "Documentary"],
-            "Horror": ["Thriller", "Mystery"],
-            "Music": ["Drama", "Comedy"],
-            "Mystery": ["Thriller", "Crime", "Horror"],
-            "Romance": ["Drama", "Comedy"],
-            "Science Fiction": ["Fantasy", "Action", "Adventure", "Thriller"],
-            "Sci-Fi": ["Fantasy", "Action", "Adventure", "Thriller"],  # Alternative name
-            "Thriller": ["Action", "Crime", "Mystery", "Horror"],
-            "War": ["Action", "Drama", "History"],
-            "Western": ["Action", "Adventure", "Drama"]
-        }
+        self.genre_similarity = GENRE_SIMILARITY
+        
+        # Shard workers are forked here, before any background thread exists
+        self.sharded_scorer = None
+        if SCORING_SHARD_MODE == 'http' and SCORING_SHARD_URLS:
+            self.sharded_scorer = ShardedScorer(HttpShards(SCORING_SHARD_URLS, SCORING_SHARD_TIMEOUT), SCORING_SHARD_TIMEOUT)
+        elif SCORING_SHARD_MODE == 'process' and SCORING_SHARDS > 1:
+            self.sharded_scorer = ShardedScorer(ProcessShards(SCORING_SHARDS), SCORING_SHARD_TIMEOUT)
+        
+        self.enrichment = EnrichmentStore(TMDB_ENRICHMENT_PATH)
+        self.enrichment.reload()
+        self.load_catalog_snapshot()
+        if CATALOG_SYNC_MODE == 'incremental' and FIREBASE_ENABLED:
+            threading.Thread(target=self._catalog_sync_loop, daemon=True).start()
+        if FIREBASE_ENABLED:
+            threading.Thread(target=self._popularity_loop, daemon=True).start()
     
     def calculate_genre_match_score(self, user_genres, movie_genres):
         """
         Calculate genre match score with fuzzy matching
         Returns (score, matched_genres, explanation)
         """
-        if not user_genres or not movie_genres:
-            return 0.0, [], "No genres to match"
-        
-        total_score = 0.0
-        matched_genres = []
-        explanations = []
-        
-        for user_genre in user_genres:
-            best_match_score = 0.0
-            best_match_genre = None
-            match_type = ""
-            
-            # Check for exact matches first
-            for movie_genre in movie_genres:
-                if user_genre.lower() == movie_genre.lower():
-                    best_match_score = 1.0  # Perfect match
-                    best_match_genre = movie_genre
-                    match_type = "exact"
-                    break
-                # Handle common variations
-                elif (user_genre == "Sci-Fi" and movie_genre == "Science Fiction") or \
-                     (user_genre == "Science Fiction" and movie_genre == "Sci-Fi"):
-                    best_match_score = 1.0  # Perfect match
-                    best_match_genre = movie_genre
-                    match_type = "exact"
-                    break
-            
-            # If no exact match, check for similar genres
-            if best_match_score == 0.0 and user_genre in self.genre_similarity:
-                similar_genres = self.genre_similarity[user_genre]
-                for movie_genre in movie_genres:
-                    if movie_genre in similar_genres:
-                        # Similar genre gets 0.7 score
-                        if 0.7 > best_match_score:
-                            best_match_score = 0.7
-                            best_match_genre = movie_genre
-                            match_type = "similar"
-            
-            if best_match_score > 0:
-                total_score += best_match_score
-                matched_genres.append(best_match_genre)
-                explanations.append(f"{user_genre} -> {best_match_genre} ({match_type})")
-        
-        # Normalize score (average of all user genres)
-        final_score = total_score / len(user_genres)
-        explanation = "; ".join(explanations) if explanations else "No genre matches found"
-        
-        return final_score, matched_genres, explanation
+        return genre_match_score(user_genres, movie_genres, self.genre_similarity)
     
     def fetch_movie_metadata(self, movie_id):
+        """Fetch movie metadata, sharing one in-flight database read between concurrent callers"""
+        movie_data = self.movie_cache.get(movie_id)
+        if movie_data is not None:
+            return movie_data
+        return self.single_flight.do(('fetch_movie_metadata', str(movie_id)), self._fetch_movie_metadata, movie_id)
+    
+    def _fetch_movie_metadata(self, movie_id):
         """Fetch movie metadata from database using REST API"""
-        if movie_id in self.movie_cache:
-            return self.movie_cache[movie_id]
+        movie_data = self.movie_cache.get(movie_id)
+        if movie_data is not None:
+            return movie_data
         
         try:
             if FIREBASE_ENABLED:
                 print(f"[INFO] Fetching movie metadata from database for ID: {movie_id}")
                 url = f"{FIREBASE_REST_API_BASE}/movies/{movie_id}"
-                response = requests.get(url)
+                response = requests.get(url, timeout=MOVIE_FETCH_TIMEOUT_SECONDS)
                 
                 if response.status_code == 200:
                     data = response.json()
                     # Convert Firestore REST API format to our format
-                    fields = data.get('fields', {})
-                    
-                    # Helper function to extract values from Firestore format
-                    def get_field_value(field_data, default=None):
-                        if not field_data:
-                            return default
-                        if 'stringValue' in field_data:
-                            return field_data['stringValue']
-                        elif 'integerValue' in field_data:
-                            return int(field_data['integerValue'])
-                        elif 'doubleValue' in field_data:
-                            return float(field_data['doubleValue'])
-                        elif 'booleanValue' in field_data:
-                            return field_data['booleanValue']
-                        elif 'arrayValue' in field_data:
-                            return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
-                        elif 'mapValue' in field_data:
-                            return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
-                        return default
-                    
-                    # Extract movie data
-                    movie_data = {
-                        'id': get_field_value(fields.get('id'), movie_id),
-                        'title': get_field_value(fields.get('title'), 'Unknown'),
-                        'overview': get_field_value(fields.get('overview'), ''),
-                        'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
-                        'imageUrl': get_field_value(fields.get('imageUrl')),
-                        'backdrop_path': get_field_value(fields.get('backdropPath')),
-                        'genres': get_field_value(fields.get('genres'), []),
-                        'genre_ids': get_field_value(fields.get('genreIds'), []),
-                        'keywords': [],  # Not stored in database
-                        'cast': [actor.get('name', '') for actor in get_field_value(fields.get('cast'), [])[:5]] if get_field_value(fields.get('cast')) else [],
-                        'director': '',  # Not stored in database
-                        'release_date': get_field_value(fields.get('releaseDate'), ''),
-                        'vote_average': get_field_value(fields.get('voteAverage'), 0),
-                        'popularity': 0,  # Not stored in database
-                        'runtime': get_field_value(fields.get('runtime'), 0),
-                        'original_language': get_field_value(fields.get('originalLanguage'), ''),
-                        'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
-                        'categories': get_field_value(fields.get('categories'), []),
-                        'cinemaBrands': get_field_value(fields.get('cinemaBrands'), [])
-                    }
+                    movie_data = self.enrichment.apply(decode_movie_document(data, movie_id))
                     
                     print(f"[SUCCESS] Successfully fetched movie from database: {movie_data['title']}")
-                    self.movie_cache[movie_id] = movie_data
+                    self.movie_cache.set(movie_id, movie_data)
                     return movie_data
                 else:
                     print(f"[ERROR] Movie not found in database: {movie_id} (Status: {response.status_code})")
@@ -198,6 +237,10 @@ class MovieRecommendationEngine:
             return None
     
     def fetch_popular_movies(self, page=1):
+        """Fetch movies, sharing one in-flight collection read between concurrent callers"""
+        return self.single_flight.do(('fetch_popular_movies', page), self._fetch_popular_movies, page)
+    
+    def _fetch_popular_movies(self, page=1):
         """Fetch movies from database using REST API"""
         try:
             if FIREBASE_ENABLED:
@@ -207,48 +250,7 @@ class MovieRecommendationEngine:
                 
                 if response.status_code == 200:
                     data = response.json()
-                    movies = []
-                    
-                    # Helper function to extract values from Firestore format
-                    def get_field_value(field_data, default=None):
-                        if not field_data:
-                            return default
-                        if 'stringValue' in field_data:
-                            return field_data['stringValue']
-                        elif 'integerValue' in field_data:
-                            return int(field_data['integerValue'])
-                        elif 'doubleValue' in field_data:
-                            return float(field_data['doubleValue'])
-                        elif 'booleanValue' in field_data:
-                            return field_data['booleanValue']
-                        elif 'arrayValue' in field_data:
-                            return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
-                        elif 'mapValue' in field_data:
-                            return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
-                        return default
-                    
-                    # Process each movie document
-                    for doc in data.get('documents', []):
-                        fields = doc.get('fields', {})
-                        movie = {
-                            'id': get_field_value(fields.get('id')),
-                            'title': get_field_value(fields.get('title'), 'Unknown'),
-                            'overview': get_field_value(fields.get('overview'), ''),
-                            'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
-                            'imageUrl': get_field_value(fields.get('imageUrl')),
-                            'backdrop_path': get_field_value(fields.get('backdropPath')),
-                            'genres': get_field_value(fields.get('genres'), []),
-                            'genre_ids': get_field_value(fields.get('genreIds'), []),
-                            'release_date': get_field_value(fields.get('releaseDate'), ''),
-                            'vote_average': get_field_value(fields.get('voteAverage'), 0),
-                            'popularity': 0,  # Not stored in database
-                            'runtime': get_field_value(fields.get('runtime'), 0),
-                            'original_language': get_field_value(fields.get('originalLanguage'), ''),
-                            'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
-                            'categories': get_field_value(fields.get('categories'), []),
-                            'cinemaBrands': get_field_value(fields.get('cinemaBrands'), [])
-                        }
-                        movies.append(movie)
+                    movies = [decode_movie_document(doc) for doc in data.get('documents', [])]
                     
                     print(f"[SUCCESS] Fetched {len(movies)} movies from database")
                     return movies
@@ -263,6 +265,133 @@ class MovieRecommendationEngine:
             print("Using mock data for recommendations")
             return self._get_mock_movies()
     
+    def load_catalog_snapshot(self):
+        """Boot from the on-disk catalog snapshot, then reconcile with Firestore in the background"""
+        started = time.time()
+        try:
+            catalog = MovieCatalog.load_snapshot(CATALOG_SNAPSHOT_PATH, text_features=self.text_features)
+        except Exception as e:
+            print(f"[WARNING] Could not load catalog snapshot from {CATALOG_SNAPSHOT_PATH}: {e}")
+            return False
+        if catalog is None:
+            return False
+        
+        self.catalog = catalog
+        self.catalog_refreshed_at = time.time()
+        print(f"[SUCCESS] Loaded catalog snapshot with {len(catalog)} movies in {(time.time() - started) * 1000:.1f}ms")
+        threading.Thread(target=self.refresh_catalog, daemon=True).start()
+        return True
+    
+    def refresh_catalog(self):
+        """Refresh the catalog; concurrent callers that find it stale share one rebuild"""
+        return self.single_flight.do(('refresh_catalog', None), self._refresh_catalog)
+    
+    def _refresh_catalog(self):
+        """Re-read the movies collection and swap in a rebuilt catalog if anything changed"""
+        movies = self.fetch_popular_movies()
+        self.catalog_refreshed_at = time.time()
+        
+        # fetch_popular_movies falls back to mock data on errors; never let that replace or persist over a real catalog
+        is_mock = movies == self._get_mock_movies()
+        # Firestore has no keywords, director or TMDB popularity; overlay what tmdb_enrichment.py found
+        self.enrichment.reload()
+        movies = [self.enrichment.apply(movie) for movie in movies]
+        if movies == self.catalog.movies or (is_mock and len(self.catalog)):
+            return False
+        
+        catalog = MovieCatalog(self.text_features)
+        catalog.load(movies)
+        catalog.set_numeric('popularity', self.booking_velocity.catalog_column(catalog))
+        self.catalog = catalog
+        print(f"[INFO] Rebuilt catalog indexes and text features for {len(catalog)} movies")
+        
+        if FIREBASE_ENABLED and not is_mock:
+            try:
+                catalog.save_snapshot(CATALOG_SNAPSHOT_PATH)
+                print(f"[SUCCESS] Saved catalog snapshot to {CATALOG_SNAPSHOT_PATH}")
+            except OSError as e:
+                print(f"[WARNING] Could not save catalog snapshot: {e}")
+        return True
+    
+    def get_catalog(self):
+        """Current catalog, refreshed from Firestore when empty or (in reload mode) older than CATALOG_REFRESH_SECONDS"""
+        stale = CATALOG_SYNC_MODE != 'incremental' and time.time() - self.catalog_refreshed_at > CATALOG_REFRESH_SECONDS
+        if not len(self.catalog) or stale:
+            self.refresh_catalog()
+        return self.catalog
+    
+    def sync_catalog_changes(self):
+        """Patch movies written or deleted since the last poll into the catalog; returns the number of changes"""
+        if self.change_feed is None:
+            self.change_feed = CatalogChangeFeed(since=self.get_catalog().latest_update())
+        # A new enrichment file changes most rows' text features, so it is picked up with a full rebuild
+        if self.enrichment.reload():
+            self.refresh_catalog()
+        
+        catalog = self.catalog
+        changes = [(kind, self.enrichment.apply(payload) if kind == 'upsert' else payload) for kind, payload in self.change_feed.poll()]
+        # The first poll re-reads documents stamped exactly at the cursor; skip rows that are already current
+        changes = [(kind, payload) for kind, payload in changes
+                   if not (kind == 'upsert' and catalog.get(payload.get('id')) == payload)]
+        if not changes:
+            return 0
+        
+        self.catalog = catalog.apply_changes(changes)
+        self.update_popularity()
+        for kind, payload in changes:
+            movie_id = payload if kind == 'delete' else payload.get('id')
+            # Cache keys are str(movie_id); deleting also drops the shared-tier copy for the other workers
+            self.movie_cache.delete(movie_id)
+        print(f"[INFO] Applied {len(changes)} catalog changes incrementally ({len(self.catalog)} movies)")
+        
+        try:
+            self.catalog.save_snapshot(CATALOG_SNAPSHOT_PATH)
+        except OSError as e:
+            print(f"[WARNING] Could not save catalog snapshot: {e}")
+        return len(changes)
+    
+    def _catalog_sync_loop(self):
+        """Background poller for CATALOG_SYNC_MODE=incremental"""
+        while True:
+            time.sleep(CATALOG_SYNC_SECONDS)
+            try:
+                self.sync_catalog_changes()
+            except Exception as e:
+                print(f"[ERROR] Catalog change feed poll failed: {e}")
+    
+    def update_popularity(self):
+        """Refresh the catalog's popularity column from the booking velocity scores"""
+        catalog = self.catalog
+        catalog.set_numeric('popularity', self.booking_velocity.catalog_column(catalog))
+    
+    def _popularity_loop(self):
+        """Background poller reading new bookings into the booking velocity scores"""
+        while True:
+            try:
+                counted = self.booking_velocity.poll()
+                self.update_popularity()
+                if counted:
+                    print(f"[INFO] Counted {counted} new bookings into booking velocity")
+            except Exception as e:
+                print(f"[ERROR] Booking velocity poll failed: {e}")
+            time.sleep(POPULARITY_POLL_SECONDS)
+    
+    def movie_popularity(self, movie):
+        """Booking velocity of a movie from the catalog column, or the movie's own popularity if it is not in the catalog"""
+        catalog = self.catalog
+        row = catalog.row_by_id.get(str(movie.get('id')))
+        if row is None:
+            return movie.get('popularity', 0) or 0
+        return float(catalog.numeric['popularity'][row])
+    
+    def get_candidate_movies(self, candidate_filter=None):
+        """Narrow the catalog to bookable candidates (e.g. now playing at GSC) before any scoring"""
+        catalog = self.get_catalog()
+        candidates = catalog.candidates(candidate_filter)
+        if candidate_filter:
+            print(f"[INFO] Candidate filter {candidate_filter} kept {len(candidates)}/{len(catalog)} movies")
+        return candidates
+    
     def _get_mock_movies(self):
         """Get mock movies for testing when Firebase is not available"""
         return [
@@ -408,65 +537,35 @@ class MovieRecommendationEngine:
             return []
     
     def create_user_profile(self, user_id, booking_history):
-        """Create user profile based on booking history"""
+        """Create a recency-weighted user profile from booking history, ignoring cancelled bookings"""
         if not booking_history:
             return None
         
-        user_movies = []
-        for booking in booking_history:
-            movie_data = self.fetch_movie_metadata(booking['movieId'])
+        weights = movie_weights(booking_history, half_life_days=PROFILE_HALF_LIFE_DAYS)
+        catalog = self.get_catalog()
+        catalog_weights = {movie_id: weight for movie_id, weight in weights.items() if movie_id in catalog.row_by_id}
+        
+        # Movies missing from the catalog are looked up one by one
+        other_movies = []
+        for movie_id, weight in weights.items():
+            if movie_id in catalog_weights:
+                continue
+            movie_data = self.fetch_movie_metadata(movie_id)
             if movie_data:
-                user_movies.append(movie_data)
+                other_movies.append((movie_data, weight))
         
         # If no movies found from database, try to create profile from mock data
-        if not user_movies and not FIREBASE_ENABLED:
+        if not catalog_weights and not other_movies and not FIREBASE_ENABLED:
             print("Creating user profile from mock data based on booking history")
-            mock_movies = self._get_mock_movies()
-            for booking in booking_history:
-                # Find matching movie in mock data
-                for movie in mock_movies:
-                    if str(movie['id']) == str(booking['movieId']):
-                        user_movies.append(movie)
-                        break
+            mock_movies = {str(movie['id']): movie for movie in self._get_mock_movies()}
+            other_movies = [(mock_movies[movie_id], weight) for movie_id, weight in weights.items() if movie_id in mock_movies]
         
-        if not user_movies:
+        user_profile = build_user_profile(catalog, catalog_weights, other_movies)
+        if not user_profile:
             print("No movies found for user profile creation")
             return None
         
-        # Aggregate user preferences
-        user_profile = {
-            'preferred_genres': {},
-            'preferred_actors': {},
-            'preferred_directors': {},
-            'avg_rating_preference': 0,
-            'avg_runtime_preference': 0,
-            'total_bookings': len(user_movies)
-        }
-        
-        # Calculate preferences
-        for movie in user_movies:
-            # Genre preferences
-            for genre in movie.get('genres', []):
-                user_profile['preferred_genres'][genre] = user_profile['preferred_genres'].get(genre, 0) + 1
-            
-            # Actor preferences
-            for actor in movie.get('cast', []):
-                user_profile['preferred_actors'][actor] = user_profile['preferred_actors'].get(actor, 0) + 1
-            
-            # Director preferences
-            if movie.get('director'):
-                user_profile['preferred_directors'][movie['director']] = user_profile['preferred_directors'].get(movie['director'], 0) + 1
-            
-            # Rating and runtime preferences
-            user_profile['avg_rating_preference'] += movie.get('vote_average', 0)
-            user_profile['avg_runtime_preference'] += movie.get('runtime', 0)
-        
-        # Calculate averages
-        if len(user_movies) > 0:
-            user_profile['avg_rating_preference'] /= len(user_movies)
-            user_profile['avg_runtime_preference'] /= len(user_movies)
-        
-        print(f"Created user profile with {len(user_movies)} movies")
+        print(f"Created user profile with {user_profile['total_bookings']} movies (weight {user_profile['total_weight']:.2f})")
         return user_profile
     
     def get_watched_movie_ids(self, booking_history):
@@ -483,26 +582,29 @@ class MovieRecommendationEngine:
         """Calculate similarity between movies with optional user profile weighting"""
         similarities = []
         
-        # Create content vectors
-        all_movies = [target_movie] + candidate_movies
-        movie_texts = []
-        
-        for movie in all_movies:
-            text_features = [
-                movie['overview'],
-                ' '.join(movie['genres']),
-                ' '.join(movie['keywords']),
-                ' '.join(movie['cast']),
-                movie['director']
-            ]
-            movie_texts.append(' '.join(text_features))
         
-        # Calculate TF-IDF similarity
-        tfidf = TfidfVectorizer(stop_words='english', max_features=5000)
-        tfidf_matrix = tfidf.fit_transform(movie_texts)
-        content_similarities = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:]).flatten()
+        # Content similarity from the catalog's feature rows; movies outside the catalog are transformed
+        # with its fitted vocabularies, and only an empty catalog needs a throwaway fit
+        catalog = self.catalog
+        if catalog.feature_matrix is not None:
+            target_vector = catalog.text_vector(target_movie)
+            candidate_rows = [catalog.row_by_id.get(str(movie['id'])) for movie in candidate_movies]
+            if None in candidate_rows:
+                candidate_matrix = catalog.text_features.transform(candidate_movies)
+            else:
+                candidate_matrix = catalog.feature_matrix[candidate_rows]
+        else:
+            pipeline = self.text_features.clone()
+            matrix = pipeline.fit_transform([target_movie] + candidate_movies)
+            target_vector, candidate_matrix = (matrix[0], matrix[1:]) if matrix is not None else (None, None)
+        if target_vector is None or candidate_matrix is None:
+            content_similarities = np.zeros(len(candidate_movies))
+        else:
+            # Feature rows are L2-normalised, so the dot product is the cosine similarity
+            content_similarities = (candidate_matrix @ target_vector.T).toarray().ravel()
         
         # If user profile exists, add preference-based scoring
+        weights = SIMILARITY_WEIGHTS
         for i, movie in enumerate(candidate_movies):
             content_score = content_similarities[i]
             preference_score = 0
@@ -510,24 +612,25 @@ class MovieRecommendationEngine:
             if user_profile:
                 # Genre preference scoring
                 genre_score = sum(user_profile['preferred_genres'].get(genre, 0) for genre in movie['genres'])
-                genre_score = min(genre_score / user_profile['total_bookings'], 1.0)
+                genre_score = min(genre_score / user_profile['total_weight'], 1.0)
                 
                 # Actor preference scoring
                 actor_score = sum(user_profile['preferred_actors'].get(actor, 0) for actor in movie['cast'])
-                actor_score = min(actor_score / user_profile['total_bookings'], 1.0)
+                actor_score = min(actor_score / user_profile['total_weight'], 1.0)
                 
                 # Director preference scoring
-                director_score = user_profile['preferred_directors'].get(movie['director'], 0) / user_profile['total_bookings']
+                director_score = user_profile['preferred_directors'].get(movie['director'], 0) / user_profile['total_weight']
                 
                 # Rating preference (prefer movies close to user's average rating preference)
                 rating_diff = abs(movie['vote_average'] - user_profile['avg_rating_preference'])
                 rating_score = max(0, 1 - rating_diff / 10)  # Normalize to 0-1
                 
                 # Combine preference scores
-                preference_score = (genre_score * 0.4 + actor_score * 0.3 + director_score * 0.2 + rating_score * 0.1)
+                preference_score = (genre_score * weights['genre'] + actor_score * weights['actor']
+                                    + director_score * weights['director'] + rating_score * weights['rating'])
             
             # Combine content and preference scores
-            final_score = content_score * 0.6 + preference_score * 0.4 if user_profile else content_score
+            final_score = content_score * weights['content'] + preference_score * weights['preference'] if user_profile else content_score
             similarities.append(final_score)
         
         return similarities
@@ -555,100 +658,94 @@ class MovieRecommendationEngine:
         else:
             return f"{percentage}% match - Based on general popularity"
     
-    def hybrid_sort_recommendations(self, recommendations, user_profile=None):
-        """Sort recommendations by similarity first, then popularity as tiebreaker"""
-        def sort_key(movie):
-            # Primary: similarity score (higher is better)
-            similarity_score = movie.get('similarity_score', 0) or movie.get('preference_score', 0)
-            
-            # Secondary: popularity score (higher is better)
-            popularity_score = movie.get('popularity', 0)
-            
-            # Tertiary: vote average (higher is better)
-            vote_average = movie.get('vote_average', 0)
-            
-            # Return tuple for sorting: (similarity, popularity, vote_average)
-            # Use negative values for descending order
-            return (-similarity_score, -popularity_score, -vote_average)
+    def rank_recommendations(self, scored, score_field, decorate, limit=10):
+        """
+        Top `limit` of (movie, score) pairs over shared, undecorated movie dicts: argpartition to the best RERANK_POOL, hybrid sort, then re-rank
+        Only the pool is copied into result dicts, and only the final `limit` get decorate(movie, score)'s explanations
+        """
+        if not scored:
+            return []
+        scores = np.fromiter((score for _, score in scored), dtype=np.float64, count=len(scored))
+        popularity = np.fromiter((self.movie_popularity(movie) for movie, _ in scored), dtype=np.float64, count=len(scored))
+        pool = top_k_indices(self.ranking_scores(scores, popularity), max(RERANK_POOL, limit))
+        
+        # Hybrid sort: score nudged by booking velocity first, then popularity, then vote average
+        ranking = self.ranking_scores(scores[pool], popularity[pool])
+        order = sorted(range(len(pool)), key=lambda i: (-ranking[i], -popularity[pool[i]], -scored[pool[i]][0].get('vote_average', 0)))
         
-        return sorted(recommendations, key=sort_key)
+        pool_movies = []
+        for i in order:
+            # Copy so concurrent requests never decorate the shared cached dict
+            movie = dict(scored[pool[i]][0])
+            movie[score_field] = float(scores[pool[i]])
+            movie['popularity'] = float(popularity[pool[i]])
+            pool_movies.append(movie)
+        return [decorate(movie, movie[score_field]) for movie in self.reranker.rerank(pool_movies, limit, self.catalog)]
+    
+    def ranking_scores(self, scores, popularity):
+        """Similarity or preference scores plus POPULARITY_WEIGHT times each movie's booking velocity relative to the highest"""
+        max_popularity = popularity.max() if len(popularity) else 0
+        if max_popularity > 0:
+            return scores + POPULARITY_WEIGHT * popularity / max_popularity
+        return scores
+    
     def get_most_booked_movies(self, limit=10):
-        """Get the most booked movies from user booking history"""
-        try:
-            print(f"[INFO] Fetching most booked movies from user booking data")
-            
-            if not FIREBASE_ENABLED:
-                print("[INFO] Firebase not enabled, cannot fetch booking data")
-                return []
-            
-            # Fetch all user bookings from Firestore
-            url = f"{FIREBASE_REST_API_BASE}/bookings"
-            response = requests.get(url)
-            
-            if response.status_code != 200:
-                print(f"[ERROR] Failed to fetch bookings from Firestore: {response.status_code}")
-                return []
-            
-            data = response.json()
-            documents = data.get('documents', [])
-            print(f"[INFO] Fetched {len(documents)} booking records")
-            
-            # Helper function to extract values from Firestore format
-            def get_field_value(field_data, default=None):
-                if not field_data:
-                    return default
-                if 'stringValue' in field_data:
-                    return field_data['stringValue']
-                elif 'integerValue' in field_data:
-                    return int(field_data['integerValue'])
-                elif 'doubleValue' in field_data:
-                    return float(field_data['doubleValue'])
-                elif 'booleanValue' in field_data:
-                    return field_data['booleanValue']
-                elif 'arrayValue' in field_data:
-                    return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
-                elif 'mapValue' in field_data:
-                    return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
-                return default
-            
-            # Count movie bookings
-            movie_booking_counts = {}
-            for doc in documents:
-                fields = doc.get('fields', {})
-                movie_id = get_field_value(fields.get('movieId'))
-                movie_title = get_field_value(fields.get('movieTitle'))
-                
-                if movie_id and movie_title:
-                    if movie_id not in movie_booking_counts:
-                        movie_booking_counts[movie_id] = {
-                            'count': 0,
-                            'title': movie_title,
-                            'movie_id': movie_id
-                        }
-                    movie_booking_counts[movie_id]['count'] += 1
-            
-            # Sort by booking count
-            sorted_movies = sorted(movie_booking_counts.values(), key=lambda x: x['count'], reverse=True)
-            print(f"[INFO] Found {len(sorted_movies)} unique movies in booking history")
-            
-            # Get detailed movie data for top booked movies
-            most_booked_movies = []
-            for movie_data in sorted_movies[:limit]:
-                movie_details = self.fetch_movie_by_id(movie_data['movie_id'])
-                if movie_details:
-                    movie_details['booking_count'] = movie_data['count']
-                    movie_details['confidence_percentage'] = 75  # High confidence for popular movies
-                    movie_details['recommendation_reason'] = f"75% match - Popular choice (booked {movie_data['count']} times by other users)"
-                    movie_details['genre_match_explanation'] = f"Most booked movie among users"
-                    most_booked_movies.append(movie_details)
-            
-            print(f"[SUCCESS] Retrieved {len(most_booked_movies)} most booked movies")
-            return most_booked_movies
-            
-        except Exception as e:
-            print(f"[ERROR] Error fetching most booked movies: {str(e)}")
+        """Movies with the highest booking velocity, read from the catalog's popularity column; when nothing
+        was booked recently (every decayed score pruned) they are ranked by all-time booking counts instead"""
+        catalog = self.get_catalog()
+        popularity = np.where(catalog.live, catalog.numeric['popularity'], 0)
+        if self.booking_velocity.last_error:
+            # Not a quiet catalog: the bookings could not be read at all
+            print(f"[ERROR] Booking counts unavailable, most booked movies may be missing: {self.booking_velocity.last_error}")
+        if not popularity.any():
+            popularity = np.where(catalog.live, self.booking_velocity.count_column(catalog), 0)
+        rows = sorted((row for row in top_k_indices(popularity, limit) if popularity[row] > 0), key=lambda row: -popularity[row])
+        
+        most_booked_movies = []
+        for row in rows:
+            # Callers decorate these dicts, so each gets its own copies
+            movie_details = dict(catalog.movies[row])
+            booking_count = self.booking_velocity.counts.get(str(movie_details['id']), 0)
+            movie_details['popularity'] = float(popularity[row])
+            movie_details['booking_count'] = booking_count
+            movie_details['confidence_percentage'] = 75  # High confidence for popular movies
+            movie_details['recommendation_reason'] = f"75% match - Popular choice (booked {booking_count} times by other users)"
+            movie_details['genre_match_explanation'] = f"Most booked movie among users"
+            most_booked_movies.append(movie_details)
+        
+        print(f"[SUCCESS] Retrieved {len(most_booked_movies)} most booked movies")
+        return most_booked_movies
+    
+    def get_popular_fallback(self, exclude_ids=(), genres=None, limit=10):
+        """Degraded-mode recommendations: the current catalog by booking velocity (TMDB popularity, then rating, if nothing is booked yet), no Firestore reads"""
+        catalog = self.catalog
+        if not len(catalog):
             return []
-
+        scores = catalog.numeric['popularity']
+        if not scores[catalog.live].any():
+            scores = catalog.numeric['tmdb_popularity']
+        if not scores[catalog.live].any():
+            scores = catalog.numeric['vote_average']
+        scores = np.where(catalog.live, scores, -np.inf)
+        wanted_genres = set(genres or ())
+        
+        fallback = []
+        for row in np.argsort(-scores, kind='stable'):
+            if len(fallback) >= limit or scores[row] == -np.inf:
+                break
+            movie = catalog.movies[row]
+            if str(movie['id']) in exclude_ids:
+                continue
+            if wanted_genres and not wanted_genres.intersection(movie.get('genres') or []):
+                continue
+            movie = dict(movie)
+            movie['popularity'] = float(catalog.numeric['popularity'][row])
+            movie['confidence_percentage'] = 50
+            movie['recommendation_reason'] = "Popular right now"
+            movie['match_explanation'] = "Shown while personalised recommendations are unavailable"
+            fallback.append(movie)
+        return fallback
+    
     def fetch_movie_by_id(self, movie_id):
         """Fetch detailed movie data by ID"""
         try:
@@ -662,46 +759,7 @@ class MovieRecommendationEngine:
                 print(f"[ERROR] Movie {movie_id} not found in database")
                 return None
             
-            doc = response.json()
-            fields = doc.get('fields', {})
-            
-            # Helper function to extract values from Firestore format
-            def get_field_value(field_data, default=None):
-                if not field_data:
-                    return default
-                if 'stringValue' in field_data:
-                    return field_data['stringValue']
-                elif 'integerValue' in field_data:
-                    return int(field_data['integerValue'])
-                elif 'doubleValue' in field_data:
-                    return float(field_data['doubleValue'])
-                elif 'booleanValue' in field_data:
-                    return field_data['booleanValue']
-                elif 'arrayValue' in field_data:
-                    return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
-                elif 'mapValue' in field_data:
-                    return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
-                return default
-            
-            return {
-                'id': get_field_value(fields.get('id')),
-                'title': get_field_value(fields.get('title'), 'Unknown'),
-                'overview': get_field_value(fields.get('overview'), ''),
-                'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
-                'imageUrl': get_field_value(fields.get('imageUrl')),
-                'backdrop_path': get_field_value(fields.get('backdropPath')),
-                'genres': get_field_value(fields.get('genres'), []),
-                'genre_ids': get_field_value(fields.get('genreIds'), []),
-                'release_date': get_field_value(fields.get('releaseDate'), ''),
-                'vote_average': get_field_value(fields.get('voteAverage'), 0),
-                'popularity': 0,
-                'runtime': get_field_value(fields.get('runtime'), 0),
-                'original_language': get_field_value(fields.get('originalLanguage'), ''),
-                'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
-                'categories': get_field_value(fields.get('categories'), []),
-                'cinemaBrands': get_field_value(fields.get('cinemaBrands'), []),
-                'cast': [actor.get('name', '') for actor in get_field_value(fields.get('cast'), [])[:5]] if get_field_value(fields.get('cast')) else []
-            }
+            return decode_movie_document(response.json())
             
         except Exception as e:
             print(f"[ERROR] Error fetching movie by ID {movie_id}: {str(e)}")
@@ -720,103 +778,51 @@ class MovieRecommendationEngine:
                 if response.status_code == 200:
                     data = response.json()
                     
-                    # Helper function to extract values from Firestore format
-                    def get_field_value(field_data, default=None):
-                        if not field_data:
-                            return default
-                        if 'stringValue' in field_data:
-                            return field_data['stringValue']
-                        elif 'integerValue' in field_data:
-                            return int(field_data['integerValue'])
-                        elif 'doubleValue' in field_data:
-                            return float(field_data['doubleValue'])
-                        elif 'booleanValue' in field_data:
-                            return field_data['booleanValue']
-                        elif 'arrayValue' in field_data:
-                            return [get_field_value(item) for item in field_data['arrayValue'].get('values', [])]
-                        elif 'mapValue' in field_data:
-                            return {k: get_field_value(v) for k, v in field_data['mapValue'].get('fields', {}).items()}
-                        return default
+                    documents = data.get('documents', [])
                     
-                    # Process each movie document
-                    for doc in data.get('documents', []):
+                    # Score each movie document as a lightweight (confidence, vote average, index) tuple;
+                    # only the final top 10 are decoded and explained
+                    matches = []
+                    seen_ids = set()
+                    for index, doc in enumerate(documents):
                         fields = doc.get('fields', {})
-                        movie_genres = get_field_value(fields.get('genres'), [])
                         
                         # Use fuzzy genre matching
-                        genre_score, matched_genres, genre_explanation = self.calculate_genre_match_score(preferred_genres, movie_genres)
+                        score = genre_score(preferred_genres, get_field_value(fields.get('genres'), []), self.genre_similarity)
                         
-                        # Only include movies with some genre match (score > 0)
-                        if genre_score > 0:
-                            # Convert to recommendation format
-                            movie = {
-                                'id': get_field_value(fields.get('id')),
-                                'title': get_field_value(fields.get('title'), 'Unknown'),
-                                'overview': get_field_value(fields.get('overview'), ''),
-                                'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
-                                'imageUrl': get_field_value(fields.get('imageUrl')),
-                                'backdrop_path': get_field_value(fields.get('backdropPath')),
-                                'genres': movie_genres,
-                                'genre_ids': get_field_value(fields.get('genreIds'), []),
-                                'release_date': get_field_value(fields.get('releaseDate'), ''),
-                                'vote_average': get_field_value(fields.get('voteAverage'), 0),
-                                'popularity': 0,
-                                'runtime': get_field_value(fields.get('runtime'), 0),
-                                'original_language': get_field_value(fields.get('originalLanguage'), ''),
-                                'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
-                                'categories': get_field_value(fields.get('categories'), []),
-                                'cinemaBrands': get_field_value(fields.get('cinemaBrands'), []),
-                                'cast': [actor.get('name', '') for actor in get_field_value(fields.get('cast'), [])[:5]] if get_field_value(fields.get('cast')) else []
-                            }
-                            
-                            # Calculate confidence score using fuzzy genre matching
-                            base_genre_score = genre_score * 0.8  # Genre match worth up to 80%
-                            actor_match_score = 0.2 if preferred_actors and any(actor in movie['cast'] for actor in preferred_actors) else 0.0
-                            confidence_score = base_genre_score + actor_match_score
-                            
-                            movie['confidence_percentage'] = self.normalize_similarity_score(confidence_score)
-                            movie['genre_match_explanation'] = genre_explanation
-                            
-                            # Create detailed recommendation reason
-                            if preferred_actors and any(actor in movie['cast'] for actor in preferred_actors):
-                                matched_actors = set(movie['cast']) & set(preferred_actors)
-                                movie['recommendation_reason'] = f"{movie['confidence_percentage']}% match - {', '.join(matched_genres)} movie featuring {', '.join(matched_actors)}"
-                            else:
-                                movie['recommendation_reason'] = f"{movie['confidence_percentage']}% match - {', '.join(matched_genres)} movie based on your preferences"
-                            
-                            # Add debug info
-                            movie['debug_info'] = {
-                                'genre_score': genre_score,
-                                'actor_score': actor_match_score,
-                                'matched_genres': matched_genres,
-                                'genre_explanation': genre_explanation
-                            }
-                            
-                            recommendations.append(movie)
+                        # Only include movies with some genre match (score > 0), each movie once
+                        movie_id = get_field_value(fields.get('id'))
+                        if score > 0 and movie_id not in seen_ids:
+                            seen_ids.add(movie_id)
+                            # Genre match worth up to 80%, a preferred actor another 20%
+                            cast = cast_names(fields) if preferred_actors else []
+                            actor_match = any(actor in cast for actor in preferred_actors or [])
+                            confidence_percentage = self.normalize_similarity_score(genre_confidence(score, actor_match))
+                            matches.append((confidence_percentage, get_field_value(fields.get('voteAverage'), 0), index))
                     
-                    print(f"[SUCCESS] Found {len(recommendations)} genre-based recommendations from database")
+                    print(f"[SUCCESS] Found {len(matches)} genre-based recommendations from database")
                     
                     # Debug: Show confidence scores of found recommendations
-                    if recommendations:
-                        confidence_scores = [r.get('confidence_percentage', 0) for r in recommendations]
+                    if matches:
+                        confidence_scores = [match[0] for match in matches]
                         print(f"[DEBUG] Confidence scores: {confidence_scores}")
                     
                     # Check if we have good quality recommendations or need fallback
-                    high_confidence_recommendations = [r for r in recommendations if r.get('confidence_percentage', 0) >= 60]
-                    print(f"[DEBUG] High confidence recommendations: {len(high_confidence_recommendations)}/{len(recommendations)}")
+                    high_confidence_count = sum(1 for match in matches if match[0] >= GENRE_CONFIDENCE_THRESHOLD)
+                    print(f"[DEBUG] High confidence recommendations: {high_confidence_count}/{len(matches)}")
                     
                     # If no recommendations found OR all recommendations have low confidence, use fallback
-                    if len(recommendations) == 0 or len(high_confidence_recommendations) == 0:
-                        if len(recommendations) == 0:
+                    if len(matches) == 0 or high_confidence_count == 0:
+                        if len(matches) == 0:
                             print(f"[INFO] No genre matches found for {preferred_genres}, trying most booked movies as fallback")
                         else:
-                            print(f"[INFO] Only low-confidence matches found for {preferred_genres} (best: {max([r.get('confidence_percentage', 0) for r in recommendations])}%), trying most booked movies as fallback")
+                            print(f"[INFO] Only low-confidence matches found for {preferred_genres} (best: {max(match[0] for match in matches)}%), trying most booked movies as fallback")
                         
                         # Try to get most booked movies first
                         most_booked = self.get_most_booked_movies(10)
                         
                         if most_booked:
-                            if len(recommendations) == 0:
+                            if len(matches) == 0:
                                 print(f"[SUCCESS] Using {len(most_booked)} most booked movies as recommendations")
                                 for movie in most_booked:
                                     movie['recommendation_reason'] = f"75% match - Popular choice among users (booked {movie['booking_count']} times, no exact match for {', '.join(preferred_genres)})"
@@ -824,43 +830,37 @@ class MovieRecommendationEngine:
                                 recommendations.extend(most_booked)
                             else:
                                 print(f"[SUCCESS] Replacing low-confidence recommendations with {len(most_booked)} most booked movies")
-                                # Clear low-confidence recommendations and use most booked instead
-                                recommendations.clear()
+                                # Use most booked instead of the low-confidence matches
                                 for movie in most_booked:
                                     movie['recommendation_reason'] = f"75% match - Popular choice among users (booked {movie['booking_count']} times, low match for {', '.join(preferred_genres)})"
                                     movie['genre_match_explanation'] = f"Low confidence matches for {preferred_genres}, showing most booked movies by other users instead"
                                 recommendations.extend(most_booked)
                         else:
                             print("[INFO] No booking data available, falling back to general popular movies")
-                            # Fallback to general popular movies if no booking data
-                            for doc in data.get('documents', [])[:10]:  # Limit to top 10
-                                fields = doc.get('fields', {})
-                                movie = {
-                                    'id': get_field_value(fields.get('id')),
-                                    'title': get_field_value(fields.get('title'), 'Unknown'),
-                                    'overview': get_field_value(fields.get('overview'), ''),
-                                    'poster_path': get_field_value(fields.get('poster_path')) or get_field_value(fields.get('backdrop_path')),
-                                    'imageUrl': get_field_value(fields.get('imageUrl')),
-                                    'backdrop_path': get_field_value(fields.get('backdropPath')),
-                                    'genres': get_field_value(fields.get('genres'), []),
-                                    'genre_ids': get_field_value(fields.get('genreIds'), []),
-                                    'release_date': get_field_value(fields.get('releaseDate'), ''),
-                                    'vote_average': get_field_value(fields.get('voteAverage'), 0),
-                                    'popularity': 0,
-                                    'runtime': get_field_value(fields.get('runtime'), 0),
-                                    'original_language': get_field_value(fields.get('originalLanguage'), ''),
-                                    'isFromTMDB': get_field_value(fields.get('isFromTMDB'), False),
-                                    'categories': get_field_value(fields.get('categories'), []),
-                                    'cinemaBrands': get_field_value(fields.get('cinemaBrands'), []),
-                                    'cast': [actor.get('name', '') for actor in get_field_value(fields.get('cast'), [])[:5]] if get_field_value(fields.get('cast')) else []
-                                }
+                            # Keep the low-confidence matches (best first), as there is nothing better to replace them with,
+                            # then fill up to 10 with general popular movies
+                            kept = heapq.nlargest(10, matches, key=lambda match: (match[0], match[1]))
+                            for _, _, index in kept:
+                                recommendations.append(self.decorate_genre_match(decode_movie_document(documents[index]), preferred_genres, preferred_actors))
+
+                            kept_indexes = {index for _, _, index in kept}
+                            for index, doc in enumerate(documents[:10]):
+                                if len(recommendations) >= 10:
+                                    break
+                                if index in kept_indexes:
+                                    continue
+                                movie = decode_movie_document(doc)
                                 
                                 movie['confidence_percentage'] = 50  # Neutral confidence for popular movies
                                 movie['recommendation_reason'] = f"50% match - Popular movie (no exact genre match for {', '.join(preferred_genres)})"
                                 movie['genre_match_explanation'] = f"No matches found for {preferred_genres}, showing popular movies"
-                            recommendations.append(movie)
+                                recommendations.append(movie)
                     
                         print(f"[INFO] Added {len(recommendations)} fallback recommendations")
+                    else:
+                        # Sorted by confidence, then vote average; decode and explain only these
+                        for _, _, index in heapq.nlargest(10, matches, key=lambda match: (match[0], match[1])):
+                            recommendations.append(self.decorate_genre_match(decode_movie_document(documents[index]), preferred_genres, preferred_actors))
                         
                 else:
                     print(f"[ERROR] Failed to fetch movies from database: {response.status_code}")
@@ -907,120 +907,358 @@ class MovieRecommendationEngine:
         # Sort by confidence percentage first, then vote average
         return sorted(unique_recommendations, key=lambda x: (x.get('confidence_percentage', 0), x.get('vote_average', 0)), reverse=True)[:10]
 
-# Initialize recommendation engine
-rec_engine = MovieRecommendationEngine()
-
-@app.route("/recommend", methods=["POST"])
-def recommend():
-    """Main recommendation endpoint"""
-    data = request.json
-    user_id = data.get('user_id')
-    movie_id = data.get('movie_id')  # Optional: for similar movie recommendations
+    def decorate_genre_match(self, movie, preferred_genres, preferred_actors=None):
+        """Attach a genre-based recommendation's confidence, reason and debug info to a decoded movie dict"""
+        score, matched_genres, genre_explanation = self.calculate_genre_match_score(preferred_genres, movie['genres'])
+        matched_actors = set(movie['cast']) & set(preferred_actors or [])
+        actor_match_score = ACTOR_CONFIDENCE_BONUS if matched_actors else 0.0
+        
+        movie['confidence_percentage'] = self.normalize_similarity_score(genre_confidence(score, bool(matched_actors)))
+        movie['genre_match_explanation'] = genre_explanation
+        
+        # Create detailed recommendation reason
+        if matched_actors:
+            movie['recommendation_reason'] = f"{movie['confidence_percentage']}% match - {', '.join(matched_genres)} movie featuring {', '.join(matched_actors)}"
+        else:
+            movie['recommendation_reason'] = f"{movie['confidence_percentage']}% match - {', '.join(matched_genres)} movie based on your preferences"
+        
+        # Add debug info
+        movie['debug_info'] = {
+            'genre_score': score,
+            'actor_score': actor_match_score,
+            'matched_genres': matched_genres,
+            'genre_explanation': genre_explanation
+        }
+        return movie
     
-    if not user_id:
-        return jsonify({"error": "user_id is required"}), 400
+    def score_similar_candidates(self, target_movie, candidate_ids, user_profile=None, deadline=None):
+        """Fetch and score candidates chunk by chunk until done or the deadline (epoch seconds) passes; returns ((movie, score) pairs, partial)"""
+        scored = []
+        attempted = 0
+        for start in range(0, len(candidate_ids), SIMILAR_SCORING_CHUNK):
+            candidate_movies = []
+            for candidate_id in candidate_ids[start:start + SIMILAR_SCORING_CHUNK]:
+                if deadline is not None and time.time() >= deadline:
+                    break
+                attempted += 1
+                movie_data = self.fetch_movie_metadata(candidate_id)
+                if movie_data:
+                    candidate_movies.append(movie_data)
+            
+            # Calculate similarities; decorating waits until the final top-K is known
+            similarities = self.calculate_movie_similarity(target_movie, candidate_movies, user_profile) if candidate_movies else []
+            scored.extend(zip(candidate_movies, similarities))
+            
+            if attempted < len(candidate_ids) and deadline is not None and time.time() >= deadline:
+                print(f"[WARNING] Similar-movie budget spent after {attempted}/{len(candidate_ids)} candidates, returning partial results")
+                return scored, True
+        return scored, False
     
-    try:
-        # Get user booking history (from Flutter or Firebase)
-        flutter_booking_history = data.get('booking_history')
-        booking_history = rec_engine.get_user_booking_history(user_id, flutter_booking_history)
+    def decorate_similar(self, movie, similarity_score, target_movie, user_profile=None):
+        """Attach the similarity score and its explanations to a (copied) movie dict"""
+        similarity_score = float(similarity_score)
+        movie['similarity_score'] = similarity_score
+        movie['confidence_percentage'] = self.normalize_similarity_score(similarity_score)
+        movie['recommendation_reason'] = self.get_confidence_explanation(similarity_score, user_profile)
+        movie['match_explanation'] = f"Similar to {target_movie['title']} based on your viewing history"
+        return movie
+    
+    def decorate_preference(self, movie, total_score, user_profile):
+        """Attach the preference score and its explanations to a (copied) movie dict"""
+        movie['preference_score'] = float(total_score)
+        movie['confidence_percentage'] = self.normalize_similarity_score(total_score)
+        movie['recommendation_reason'] = self.get_confidence_explanation(total_score, user_profile)
+        movie['match_explanation'] = f"Matches your interests in {', '.join(movie['genres'][:2])}"
+        return movie
+    
+    def score_sharded(self, user_profile, exclude_ids, candidate_filter=None, target_movie=None):
+        """Scatter-gather scoring over the catalog shards: the merged top RERANK_POOL as (movie, score) pairs, like the local paths"""
+        catalog = self.get_catalog()
+        target_vector = catalog.text_vector(target_movie) if target_movie else None
+        query = make_query('similar' if target_movie else 'personal', RERANK_POOL, target_vector, user_profile, exclude_ids,
+                           candidate_filter, SIMILARITY_WEIGHTS)
         
+        scored = []
+        for movie_id, score in self.sharded_scorer.top_k(catalog, query):
+            movie = catalog.get(movie_id)
+            if movie is not None:
+                scored.append((movie, score))
+        return scored
+    
+    def recommend_for_user(self, user_id, booking_history, movie_id=None, candidate_filter=None, deadline=None):
+        """
+        Build the recommendation payload for one user from their processed booking history
+        deadline (epoch seconds) bounds the similar-movie branch: past it, the best candidates scored so far come back with partial set
+        """
         if not booking_history:
             # New user - need preferences
-            return jsonify({
+            return {
                 "type": "new_user",
                 "message": "No booking history found. Please provide preferences.",
-                "available_genres": list(rec_engine.genre_mapping.values())
-            })
+                "available_genres": list(self.genre_mapping.values())
+            }
+        if not counted_bookings(booking_history):
+            # Every booking was cancelled or refunded, so there is nothing to build a profile from
+            return {
+                "type": "new_user",
+                "message": "No active bookings found. Please provide preferences.",
+                "available_genres": list(self.genre_mapping.values())
+            }
         
         # Existing user with booking history
-        user_profile = rec_engine.create_user_profile(user_id, booking_history)
-        watched_movie_ids = rec_engine.get_watched_movie_ids(booking_history)
+        user_profile = self.create_user_profile(user_id, booking_history)
+        watched_movie_ids = self.get_watched_movie_ids(booking_history)
         
         if movie_id:
             # Get similar movies to the specified movie
-            target_movie = rec_engine.fetch_movie_metadata(movie_id)
+            target_movie = self.fetch_movie_metadata(movie_id)
             if not target_movie:
-                return jsonify({"error": "Movie not found"}), 404
-            
-            # Get candidate movies (popular movies)
-            popular_movies = rec_engine.fetch_popular_movies()
-            candidate_movies = []
-            for movie in popular_movies:
-                if movie['id'] != int(movie_id) and str(movie['id']) not in watched_movie_ids:
-                    movie_data = rec_engine.fetch_movie_metadata(movie['id'])
-                    if movie_data:
-                        candidate_movies.append(movie_data)
-            
-            # Calculate similarities
-            similarities = rec_engine.calculate_movie_similarity(target_movie, candidate_movies, user_profile)
-            
-            # Create recommendations with scores and confidence
-            recommendations = []
-            for i, movie in enumerate(candidate_movies):
-                similarity_score = float(similarities[i])
-                movie['similarity_score'] = similarity_score
-                movie['confidence_percentage'] = rec_engine.normalize_similarity_score(similarity_score)
-                movie['recommendation_reason'] = rec_engine.get_confidence_explanation(similarity_score, user_profile)
-                movie['match_explanation'] = f"Similar to {target_movie['title']} based on your viewing history"
-                recommendations.append(movie)
+                raise LookupError("Movie not found")
+        
+            scored = None
+            partial = False
+            if self.sharded_scorer:
+                try:
+                    scored = self.score_sharded(user_profile, watched_movie_ids | {str(movie_id)}, candidate_filter, target_movie)
+                except Exception as e:
+                    print(f"[WARNING] Sharded scoring failed, scoring locally: {e}")
             
-            # Hybrid sort: similarity first, then popularity
-            recommendations = rec_engine.hybrid_sort_recommendations(recommendations, user_profile)
+            if scored is None:
+                # Get candidate movies (popular movies narrowed by the request filter)
+                popular_movies = self.get_candidate_movies(candidate_filter)
+                candidate_ids = [movie['id'] for movie in popular_movies
+                                 if movie['id'] != int(movie_id) and str(movie['id']) not in watched_movie_ids]
+                scored, partial = self.score_similar_candidates(target_movie, candidate_ids, user_profile, deadline)
             
-            return jsonify({
+            # Hybrid sort of the best candidates (similarity first, then popularity), diversified; only the final ones are decorated
+            recommendations = self.rank_recommendations(
+                scored, 'similarity_score', lambda movie, score: self.decorate_similar(movie, score, target_movie, user_profile))
+        
+            return {
                 "type": "similar_movies",
-                "recommendations": recommendations[:10],
+                "recommendations": recommendations,
                 "user_profile": user_profile,
+                "excluded_watched": len(watched_movie_ids),
+                "partial": partial
+            }
+        
+        elif user_profile is None:
+            # None of the booked movies could be found, so there are no preferences to score by
+            return {
+                "type": "popular",
+                "recommendations": self.get_popular_fallback(exclude_ids=watched_movie_ids),
                 "excluded_watched": len(watched_movie_ids)
-            })
+            }
         
         else:
             # General recommendations based on user profile
-            # Get popular movies and score them based on user preferences
-            popular_movies = rec_engine.fetch_popular_movies()
-            recommendations = []
+            scored = None
+            if self.sharded_scorer:
+                try:
+                    scored = self.score_sharded(user_profile, watched_movie_ids, candidate_filter)
+                except Exception as e:
+                    print(f"[WARNING] Sharded scoring failed, scoring locally: {e}")
             
-            for movie in popular_movies:
-                # Skip watched movies
-                if str(movie['id']) in watched_movie_ids:
-                    continue
-                    
-                movie_data = rec_engine.fetch_movie_metadata(movie['id'])
-                if movie_data:
-                    # Calculate preference score
-                    genre_score = sum(user_profile['preferred_genres'].get(genre, 0) for genre in movie_data['genres'])
-                    actor_score = sum(user_profile['preferred_actors'].get(actor, 0) for actor in movie_data['cast'])
-                    
-                    total_score = (genre_score + actor_score) / user_profile['total_bookings']
-                    movie_data['preference_score'] = float(total_score)
-                    movie_data['confidence_percentage'] = rec_engine.normalize_similarity_score(total_score)
-                    movie_data['recommendation_reason'] = rec_engine.get_confidence_explanation(total_score, user_profile)
-                    movie_data['match_explanation'] = f"Matches your interests in {', '.join(movie_data['genres'][:2])}"
+            if scored is None:
+                # Get candidate movies and score them based on user preferences
+                popular_movies = self.get_candidate_movies(candidate_filter)
+                scored = []
+                
+                for movie in popular_movies:
+                    # Skip watched movies
+                    if str(movie['id']) in watched_movie_ids:
+                        continue
                     
-                    recommendations.append(movie_data)
-            
-            # Hybrid sort: preference score first, then popularity
-            recommendations = rec_engine.hybrid_sort_recommendations(recommendations, user_profile)
+                    movie_data = self.fetch_movie_metadata(movie['id'])
+                    if movie_data:
+                        # Calculate preference score
+                        genre_score = sum(user_profile['preferred_genres'].get(genre, 0) for genre in movie_data['genres'])
+                        actor_score = sum(user_profile['preferred_actors'].get(actor, 0) for actor in movie_data['cast'])
+                        
+                        scored.append((movie_data, (genre_score + actor_score) / user_profile['total_weight']))
             
+            # Hybrid sort of the best candidates (preference score first, then popularity), diversified; only the final ones are decorated
+            final_recommendations = self.rank_recommendations(
+                scored, 'preference_score', lambda movie, score: self.decorate_preference(movie, score, user_profile))
+        
             # Debug: Check if poster_path exists in final recommendations
-            final_recommendations = recommendations[:10]
             for i, rec in enumerate(final_recommendations):
                 if rec.get('poster_path'):
                     print(f"[SUCCESS] Final rec {i+1}: {rec['title']} HAS poster: {rec['poster_path']} (Confidence: {rec.get('confidence_percentage', 0)}%)")
                 else:
                     print(f"[ERROR] Final rec {i+1}: {rec['title']} NO poster! (Confidence: {rec.get('confidence_percentage', 0)}%)")
-            
-            return jsonify({
+        
+            return {
                 "type": "personalized",
                 "recommendations": final_recommendations,
                 "user_profile": user_profile,
                 "excluded_watched": len(watched_movie_ids)
-            })
+            }
+
+# Initialize recommendation engine
+rec_engine = MovieRecommendationEngine()
+analytics = AnalyticsService(refresh_seconds=ANALYTICS_REFRESH_SECONDS, single_flight=rec_engine.single_flight,
+                             min_refresh_seconds=ANALYTICS_MIN_REFRESH_SECONDS, credentials=firestore_credentials)
+admission = AdmissionController(ADMISSION_MAX_CONCURRENT, ADMISSION_MAX_QUEUE)
+recent_results = RecentResults(DEGRADED_CACHE_SIZE)
+history_cache = RecentResults(HISTORY_CACHE_SIZE)
+sampling_profiler = SamplingProfiler()
+request_profiler = RequestProfiler()
+memory_profiler = MemoryProfiler()
+traffic_recorder = TrafficRecorder(TRAFFIC_CAPTURE_PATH, TRAFFIC_CAPTURE_RATE, TRAFFIC_CAPTURE_MAX_BYTES,
+                                   salt=TRAFFIC_CAPTURE_SALT) if TRAFFIC_CAPTURE_PATH else None
+seat_service = SeatAvailabilityService(SEAT_ROWS, SEAT_COLUMNS, SEAT_HOLD_TTL_SECONDS, SEAT_REFRESH_SECONDS,
+                                       persist=FIREBASE_ENABLED, credentials=firestore_credentials,
+                                       max_holds_per_user=SEAT_MAX_HOLDS_PER_USER)
+id_tokens = IdTokenVerifier(FIREBASE_WEB_API_KEY) if FIREBASE_WEB_API_KEY else None
+admins = AdminDirectory(firestore_credentials) if firestore_credentials is not None else None
+if FIREBASE_ENABLED:
+    if seat_service.credentials is None:
+        print("[WARNING] No Firestore service credentials (FIRESTORE_ACCESS_TOKEN or FIRESTORE_TOKEN_SOURCE), seat confirmations are disabled")
+    threading.Thread(target=seat_service.run_flush_loop, args=(SEAT_FLUSH_SECONDS,), daemon=True).start()
+if id_tokens is None:
+    print("[WARNING] FIREBASE_WEB_API_KEY is not set, seat holds are disabled")
+
+def admin_required(view):
+    """Admit a signed-in admin (Firebase ID token of a user in admins/) or a server sending X-Admin-Token"""
+    @functools.wraps(view)
+    def guarded(*args, **kwargs):
+        token = request.headers.get('X-Admin-Token')
+        if token is not None:
+            if not ADMIN_TOKEN or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+                return jsonify({"error": "Invalid admin token"}), 403
+            return view(*args, **kwargs)
+        
+        authorization = request.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            return jsonify({"error": "Admin sign-in required"}), 401
+        if id_tokens is None or admins is None:
+            return jsonify({"error": "Admin sign-in is not configured (FIREBASE_WEB_API_KEY and service credentials)"}), 503
+        try:
+            if not admins.is_admin(id_tokens.user_id(authorization[len('Bearer '):])):
+                return jsonify({"error": "Admin access required"}), 403
+        except PermissionError as e:
+            return jsonify({"error": str(e)}), 401
+        except Exception as e:
+            print(f"[ERROR] Could not verify admin sign-in: {e}")
+            return jsonify({"error": "Could not verify sign-in"}), 503
+        return view(*args, **kwargs)
+    return guarded
+
+def profile_download(content, name, extension, mimetype='text/plain'):
+    """Profile output as a timestamped file download"""
+    response = Response(content, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{name}-{int(time.time())}.{extension}"'
+    return response
+
+def resolve_booking_history(user_id, data):
+    """
+    Processed booking history from whichever form the client sent, plus its history_hash
+    Returns (None, None) when no history was sent; raises LookupError for an unknown history_hash
+    """
+    if data.get('booking_history_compact') is not None:
+        booking_history = expand_compact_history(data['booking_history_compact'])
+    elif data.get('booking_history') is not None:
+        booking_history = rec_engine.get_user_booking_history(user_id, data['booking_history'])
+    elif data.get('history_hash'):
+        cached = history_cache.get((str(user_id), str(data['history_hash'])))
+        if not cached:
+            raise LookupError("Unknown history_hash, resend booking_history_compact")
+        return cached[0], str(data['history_hash'])
+    else:
+        return None, None
+    
+    key = history_hash(booking_history)
+    history_cache.put((str(user_id), key), booking_history)
+    return booking_history, key
+
+def degraded_response(reason, cache_key, fallback, body=None):
+    """Last good payload for this request if there is one, otherwise fallback(); flagged degraded either way"""
+    cached = recent_results.get(cache_key)
+    if cached:
+        payload, stored_at = cached
+        payload = {**payload, "cached_at": stored_at}
+    else:
+        payload = fallback()
+    print(f"[WARNING] Serving degraded response for {cache_key[0]} ({reason})")
+    return json_response({**payload, "degraded": True, "degraded_reason": reason}, request, body)
+
+@app.route("/recommend", methods=["POST"])
+def recommend():
+    """Main recommendation endpoint"""
+    try:
+        data = read_request_body(request)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    user_id = data.get('user_id')
+    movie_id = data.get('movie_id')  # Optional: for similar movie recommendations
+    
+    if not user_id:
+        return jsonify({"error": "user_id is required"}), 400
     
+    try:
+        candidate_filter = parse_candidate_filter(data.get('filters'))
+        # Booking history from Flutter: full, compact tuples, or the hash of one already sent
+        client_history, client_history_hash = resolve_booking_history(user_id, data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e), "history_required": True}), 409
+    
+    if traffic_recorder:
+        traffic_recorder.record('/recommend', data, request.args, client_history if data.get('history_hash') else None)
+    
+    # The similar-movie budget runs from arrival, so time spent queueing for admission counts against it
+    deadline = time.time() + SIMILAR_BUDGET_SECONDS
+    cache_key = ('recommend', str(user_id), str(movie_id or ''), json.dumps(data.get('filters'), sort_keys=True))
+    
+    def build_payload():
+        # Without a client history, fall back to Firebase / mock data
+        booking_history = client_history if client_history is not None else rec_engine.get_user_booking_history(user_id)
+        payload = rec_engine.recommend_for_user(user_id, booking_history, movie_id, candidate_filter, deadline)
+        if client_history_hash:
+            payload["history_hash"] = client_history_hash
+        # A partial result should not displace a complete one as the degraded-mode fallback
+        if not payload.get('partial'):
+            recent_results.put(cache_key, payload)
+        return payload
+    
+    def popular_payload():
+        watched_ids = {str(booking.get('movieId', '')) for booking in client_history or []}
+        return {
+            "type": "popular",
+            "recommendations": rec_engine.get_popular_fallback(exclude_ids=watched_ids),
+            "excluded_watched": len(watched_ids)
+        }
+    
+    try:
+        payload, shed_reason = admission.run('recommend', RECOMMEND_DEADLINE_SECONDS, request_profiler.wrap(build_payload))
+        if shed_reason:
+            return degraded_response(shed_reason, cache_key, popular_payload, data)
+        return json_response(payload, request, data)
+    
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/recommend/export", methods=["GET"])
+@admin_required
+def export_recommendations():
+    """Stream recommendations for every user with bookings as NDJSON (one compact line per user); admin only"""
+    if not FIREBASE_ENABLED:
+        return jsonify({"error": "Firebase not available, cannot read user bookings"}), 503
+    
+    try:
+        workers = int(request.args.get('workers', DEFAULT_EXPORT_WORKERS))
+        limit = int(request.args['limit']) if 'limit' in request.args else None
+        candidate_filter = parse_candidate_filter(json.loads(request.args['filters'])) if 'filters' in request.args else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    lines = iter_ndjson_export(rec_engine, workers=workers, limit=limit, candidate_filter=candidate_filter)
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson')
+
 @app.route("/recommend/new-user", methods=["POST"])
 def recommend_new_user():
     """Recommendations for new users based on preferences"""
@@ -1032,17 +1270,37 @@ def recommend_new_user():
     if not preferred_genres:
         return jsonify({"error": "At least one preferred genre is required"}), 400
     
-    try:
+    if traffic_recorder:
+        traffic_recorder.record('/recommend/new-user', data, request.args)
+    
+    user_preferences = {
+        "genres": preferred_genres,
+        "actors": preferred_actors
+    }
+    cache_key = ('recommend_new_user', json.dumps(sorted(preferred_genres)), json.dumps(sorted(preferred_actors or [])))
+    
+    def build_payload():
         recommendations = rec_engine.get_genre_based_recommendations(preferred_genres, preferred_actors)
-        
-        return jsonify({
+        payload = {
             "type": "new_user_preferences",
             "recommendations": recommendations[:10],
-            "user_preferences": {
-                "genres": preferred_genres,
-                "actors": preferred_actors
-            }
-        })
+            "user_preferences": user_preferences
+        }
+        recent_results.put(cache_key, payload)
+        return payload
+    
+    def popular_payload():
+        return {
+            "type": "new_user_preferences",
+            "recommendations": rec_engine.get_popular_fallback(genres=preferred_genres),
+            "user_preferences": user_preferences
+        }
+    
+    try:
+        payload, shed_reason = admission.run('recommend_new_user', NEW_USER_DEADLINE_SECONDS, request_profiler.wrap(build_payload))
+        if shed_reason:
+            return degraded_response(shed_reason, cache_key, popular_payload)
+        return json_response(payload, request)
     
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1054,6 +1312,201 @@ def get_genres():
         "genres": list(rec_engine.genre_mapping.values())
     })
 
+def requested_showtime(data):
+    """
+    Showtime id from showtime_id, or from movie_id, date, time and cinema as the app names seat documents
+    Raises ValueError for a missing id, or one that is not a single document id (e.g. contains '/')
+    """
+    if data.get('showtime_id'):
+        doc_id = str(data['showtime_id'])
+    else:
+        missing = [key for key in ('movie_id', 'date', 'time', 'cinema') if not data.get(key)]
+        if missing:
+            raise ValueError(f"Missing {', '.join(missing)} (or showtime_id)")
+        doc_id = showtime_id(data['movie_id'], data['date'], data['time'], data['cinema'])
+    seat_document_path(doc_id)
+    return doc_id
+
+@app.route("/seats", methods=["GET"])
+def get_seat_availability():
+    """Booked and held seats for a showtime, served from the in-memory seat map"""
+    try:
+        return jsonify(seat_service.availability(requested_showtime(request.args)))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] Error loading seats: {e}")
+        return jsonify({"error": str(e)}), 503
+
+@app.route("/seats/<action>", methods=["POST"])
+def update_seats(action):
+    """
+    Seat holds for a checkout: hold {seats, ttl?} -> hold_id, then confirm or release {hold_id}
+    Requires the user's Firebase ID token as Authorization: Bearer <token>; holds belong to that user
+    Seats already booked or held by someone else are answered with 409 and the conflicting seats,
+    a user over SEAT_MAX_HOLDS_PER_USER with 429, and a confirm that cannot be saved with 503
+    """
+    if action not in ('hold', 'confirm', 'release'):
+        return jsonify({"error": "Unknown seat action"}), 404
+    if id_tokens is None:
+        return jsonify({"error": "Seat holds are not configured (FIREBASE_WEB_API_KEY)"}), 503
+    
+    authorization = request.headers.get('Authorization', '')
+    if not authorization.startswith('Bearer '):
+        return jsonify({"error": "Sign-in required (Authorization: Bearer <Firebase ID token>)"}), 401
+    try:
+        user_id = id_tokens.user_id(authorization[len('Bearer '):])
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 401
+    except Exception as e:
+        print(f"[ERROR] Could not verify ID token: {e}")
+        return jsonify({"error": "Could not verify sign-in"}), 503
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        doc_id = requested_showtime(data)
+        if action == 'hold':
+            return jsonify(seat_service.hold(doc_id, data.get('seats') or [], data.get('ttl'), owner=user_id))
+        if not data.get('hold_id'):
+            return jsonify({"error": "hold_id is required"}), 400
+        if action == 'release':
+            return jsonify({"released": seat_service.release(doc_id, data['hold_id'], owner=user_id)})
+        return jsonify(seat_service.confirm(doc_id, data['hold_id'], owner=user_id))
+    except SeatConflict as e:
+        return jsonify({"error": str(e), "seats": e.seats}), 409
+    except HoldLimitExceeded as e:
+        return jsonify({"error": str(e)}), 429
+    except SeatPersistenceError as e:
+        print(f"[ERROR] Seat confirmation refused: {e}")
+        return jsonify({"error": str(e)}), 503
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 410
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[ERROR] Error updating seats: {e}")
+        return jsonify({"error": str(e)}), 503
+
+@app.route("/analytics", methods=["GET"])
+@admin_required
+def get_analytics():
+    """Admin analytics report for a trailing period (7d, 30d or 1y), served from pre-aggregated rollups;
+    refresh=1 rebuilds them unless they are younger than ANALYTICS_MIN_REFRESH_SECONDS"""
+    if not FIREBASE_ENABLED:
+        return jsonify({"error": "Firebase not available, cannot read bookings and orders"}), 503
+    
+    period = request.args.get('period', '7d')
+    if period not in ANALYTICS_PERIODS:
+        return jsonify({"error": f"period must be one of {', '.join(ANALYTICS_PERIODS)}"}), 400
+    
+    try:
+        refresh = request.args.get('refresh', '').lower() in ('1', 'true')
+        return jsonify(analytics.report(period, force=refresh))
+    except Exception as e:
+        print(f"[ERROR] Error building analytics report: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/metrics", methods=["GET"])
+def get_metrics():
+    """Operational counters for the recommendation engine"""
+    return jsonify({
+        "catalog": {
+            "movies": len(rec_engine.catalog),
+            "refreshed_at": rec_engine.catalog_refreshed_at,
+            "sync_mode": CATALOG_SYNC_MODE,
+            "change_feed": rec_engine.change_feed.stats if rec_engine.change_feed else None
+        },
+        "popularity": {
+            **rec_engine.booking_velocity.stats,
+            "tracked_movies": len(rec_engine.booking_velocity.scores),
+            "last_error": rec_engine.booking_velocity.last_error
+        },
+        "analytics": {
+            "documents": analytics.rollups.documents if analytics.rollups else 0,
+            "built_at": analytics.rollups.built_at if analytics.rollups else None
+        },
+        "admission": {
+            **admission.snapshot(),
+            "degraded_cache": len(recent_results)
+        },
+        "traffic_capture": traffic_recorder.stats if traffic_recorder else None,
+        "movie_cache": rec_engine.movie_cache.snapshot(),
+        "seats": seat_service.snapshot(),
+        "sharding": rec_engine.sharded_scorer.snapshot() if rec_engine.sharded_scorer else None,
+        "single_flight": rec_engine.single_flight.snapshot()
+    })
+
+@app.route("/admin/profile", methods=["GET"])
+@admin_required
+def get_profile_status():
+    """State of the CPU sampler, the request profiler and memory tracing"""
+    return jsonify({
+        "cpu": sampling_profiler.status(),
+        "requests": request_profiler.status(),
+        "memory": memory_profiler.status()
+    })
+
+@app.route("/admin/profile/cpu", methods=["GET"])
+@admin_required
+def get_cpu_profile():
+    """Sample every thread's stack for ?seconds= (default 10) and download the collapsed stacks"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval_ms', 5)) / 1000
+        stacks = sampling_profiler.run(seconds, interval)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return profile_download(stacks, 'cpu', 'collapsed')
+
+@app.route("/admin/profile/requests", methods=["POST", "GET"])
+@admin_required
+def request_profile():
+    """POST ?count=N profiles the next N recommendation requests; GET downloads them (?format=collapsed|text|prof)"""
+    if request.method == "POST":
+        try:
+            count = int(request.args.get('count', 20))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        request_profiler.arm(count)
+        print(f"[INFO] Profiling the next {count} recommendation requests")
+        return jsonify(request_profiler.status())
+    
+    fmt = request.args.get('format', 'collapsed')
+    if fmt not in ('collapsed', 'text', 'prof'):
+        return jsonify({"error": "format must be one of collapsed, text, prof"}), 400
+    output = request_profiler.export(fmt, sort=request.args.get('sort', 'cumulative'))
+    if output is None:
+        return jsonify({"error": "No requests have been profiled yet", **request_profiler.status()}), 404
+    if fmt == 'prof':
+        return profile_download(output, 'requests', 'prof', 'application/octet-stream')
+    return profile_download(output, 'requests', 'txt' if fmt == 'text' else fmt)
+
+@app.route("/admin/profile/memory", methods=["POST", "GET", "DELETE"])
+@admin_required
+def memory_profile():
+    """POST starts tracemalloc (?frames=), GET reports (?format=top|collapsed, ?diff=1 against the start), DELETE stops it"""
+    if request.method == "POST":
+        memory_profiler.start(int(request.args.get('frames', 25)))
+        print("[INFO] Memory tracing started")
+        return jsonify(memory_profiler.status())
+    if request.method == "DELETE":
+        memory_profiler.stop()
+        print("[INFO] Memory tracing stopped")
+        return jsonify(memory_profiler.status())
+    
+    try:
+        if request.args.get('format') == 'collapsed':
+            return profile_download(memory_profiler.export(), 'memory', 'collapsed')
+        diff = request.args.get('diff', '').lower() in ('1', 'true')
+        return jsonify({
+            **memory_profiler.status(),
+            "top": memory_profiler.top(int(request.args.get('limit', 30)), diff=diff)
+        })
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=3000, debug=True, threaded=True)
+    app.run(host="0.0.0.0", port=int(os.getenv('PORT', '3000')), debug=True, threaded=True)
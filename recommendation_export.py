@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Streaming NDJSON export of recommendations for every user with bookings
+
+Used by the email/push pipelines, either from the command line:
+
+    python recommendation_export.py --output recommendations.ndjson --workers 8
+
+or over HTTP via GET /recommend/export on the recommendation engine, which
+requires the X-Admin-Token header (see ADMIN_TOKEN). Either way bookings are
+read with the service credentials from firebase_auth.py.
+"""
+
+import argparse
+import json
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby, islice
+
+from firebase_auth import ServiceToken, service_headers
+from firestore_rest import decode_fields, document_path, iter_collection_group
+
+DEFAULT_EXPORT_WORKERS = 4
+
+
+def iter_user_booking_histories(page_size=300, credentials=None):
+    """
+    Yield (user_id, bookings) for each user, streaming the bookings collection group page by page
+    Only admins may read every user's bookings, so the read carries service credentials (credentials,
+    or else the ServiceToken configured in the environment)
+    """
+    headers = service_headers(credentials or ServiceToken.from_env())
+
+    def owner(item):
+        return item[0]
+
+    def with_owner(documents):
+        for doc in documents:
+            path = document_path(doc)
+            # users/{uid}/bookings/{bookingId}
+            if len(path) == 4 and path[0] == 'users':
+                yield path[1], doc
+
+    # Documents arrive ordered by path, so each user's bookings are contiguous
+    for user_id, items in groupby(with_owner(iter_collection_group('bookings', page_size, headers=headers)), key=owner):
+        bookings = []
+        for _, doc in items:
+            booking = decode_fields(doc)
+            # Mirror the Flutter client, which never sends cancelled bookings
+            if booking.get('status') != 'cancelled':
+                bookings.append(booking)
+        if bookings:
+            yield user_id, bookings
+
+
+def compact_recommendations(user_id, payload):
+    """Reduce a recommendation payload to user id, type and (movie id, score) pairs"""
+    return {
+        'user_id': user_id,
+        'type': payload.get('type'),
+        'recommendations': [
+            {
+                'id': movie.get('id'),
+                'score': round(float(movie.get('similarity_score', 0) or movie.get('preference_score', 0)), 4)
+            }
+            for movie in payload.get('recommendations', [])
+        ]
+    }
+
+
+def score_user(engine, user_id, bookings, candidate_filter=None):
+    """Score one user; failures become an error line instead of aborting the export"""
+    try:
+        booking_history = engine.get_user_booking_history(user_id, bookings)
+        payload = engine.recommend_for_user(user_id, booking_history, candidate_filter=candidate_filter)
+        return compact_recommendations(user_id, payload)
+    except Exception as e:
+        return {'user_id': user_id, 'error': str(e)}
+
+
+def iter_export_records(engine, workers=DEFAULT_EXPORT_WORKERS, limit=None, candidate_filter=None, users=None):
+    """Score users on a worker pool, keeping at most 2 * workers users in flight, and yield records in order"""
+    users = users if users is not None else iter_user_booking_histories()
+    if limit is not None:
+        users = islice(users, limit)
+
+    max_in_flight = max(1, workers) * 2
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        in_flight = deque()
+        for user_id, bookings in users:
+            in_flight.append(executor.submit(score_user, engine, user_id, bookings, candidate_filter))
+            if len(in_flight) >= max_in_flight:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+
+
+def iter_ndjson_export(engine, workers=DEFAULT_EXPORT_WORKERS, limit=None, candidate_filter=None, users=None):
+    """Yield one NDJSON line per user"""
+    for record in iter_export_records(engine, workers, limit, candidate_filter, users):
+        yield json.dumps(record, separators=(',', ':')) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export recommendations for all users as NDJSON")
+    parser.add_argument('--output', '-o', default='recommendations.ndjson', help="Output file, or '-' for stdout")
+    parser.add_argument('--workers', type=int, default=DEFAULT_EXPORT_WORKERS, help="Parallel scoring workers")
+    parser.add_argument('--limit', type=int, default=None, help="Only export the first N users")
+    parser.add_argument('--filters', default=None, help='Candidate filter as JSON, e.g. \'{"categories": "now_playing"}\'')
+    args = parser.parse_args()
+
+    # Imported here so that importing this module never triggers the engine's startup checks
+    from movie_catalog import parse_candidate_filter
+    from recommendation_engine import FIREBASE_ENABLED, rec_engine
+
+    if not FIREBASE_ENABLED:
+        print("[ERROR] Firebase not available, cannot read user bookings", file=sys.stderr)
+        sys.exit(1)
+
+    candidate_filter = parse_candidate_filter(json.loads(args.filters)) if args.filters else None
+
+    output = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    exported = 0
+    try:
+        for line in iter_ndjson_export(rec_engine, args.workers, args.limit, candidate_filter):
+            output.write(line)
+            exported += 1
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(f"[SUCCESS] Exported recommendations for {exported} users", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Deterministic replay of captured recommendation traffic
+
+Replays NDJSON captures written by traffic_capture.py (rotated files included)
+in capture order, at a fixed concurrency and request rate, and records each
+response's status, latency and recommended movie ids:
+
+    python replay_traffic.py replay traffic.ndjson* --target http://127.0.0.1:3000 \
+        --concurrency 8 --rate 50 --output results-v1.ndjson
+
+Replays are usually run against a build backed by the Firestore stand-in,
+which --stub-seed starts in-process; --launch-engine also starts
+recommendation_engine.py pointed at it:
+
+    python replay_traffic.py replay traffic.ndjson --stub-seed fixtures.json --launch-engine --output results-v2.ndjson
+
+Two result files (e.g. from two versions) are compared with:
+
+    python replay_traffic.py diff results-v1.ndjson results-v2.ndjson
+"""
+
+import argparse
+import glob
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+DEFAULT_TARGET = 'http://127.0.0.1:3000'
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def load_captures(patterns, limit=None):
+    """Captured requests from the given files/globs (rotated backups included), in capture order"""
+    captures = []
+    for path in sorted({path for pattern in patterns for path in glob.glob(pattern)}):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    captures.append(json.loads(line))
+    # Stable sort, so requests captured in the same instant keep their file order
+    captures.sort(key=lambda capture: capture.get('ts', 0))
+    return captures[:limit] if limit else captures
+
+
+def movie_ids(payload):
+    return [movie.get('id') for movie in payload.get('recommendations', [])] if isinstance(payload, dict) else []
+
+
+def replay(captures, target, concurrency=4, rate=0.0, timeout=30):
+    """Send every capture (the i-th no earlier than i / rate seconds in) and return one result per capture, in order"""
+    local = threading.local()
+    start = time.perf_counter()
+
+    def send(index, capture):
+        if rate > 0:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        session = getattr(local, 'session', None) or requests.Session()
+        local.session = session
+        sent = time.perf_counter()
+        try:
+            response = session.post(f"{target}{capture['endpoint']}", params=capture.get('args') or None,
+                                    json=capture['body'], timeout=timeout)
+            latency = time.perf_counter() - sent
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = None
+            return {
+                'index': index,
+                'endpoint': capture['endpoint'],
+                'status': response.status_code,
+                'latency_ms': round(latency * 1000, 2),
+                'type': payload.get('type') if isinstance(payload, dict) else None,
+                'degraded': bool(payload.get('degraded')) if isinstance(payload, dict) else False,
+                'partial': bool(payload.get('partial')) if isinstance(payload, dict) else False,
+                'movie_ids': movie_ids(payload),
+            }
+        except requests.RequestException as e:
+            return {'index': index, 'endpoint': capture['endpoint'], 'status': None,
+                    'latency_ms': round((time.perf_counter() - sent) * 1000, 2), 'error': str(e), 'movie_ids': []}
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(send, index, capture) for index, capture in enumerate(captures)]
+        results = [future.result() for future in futures]
+    return results, time.perf_counter() - start
+
+
+def latency_summary(results):
+    """Request counts, error counts and latency percentiles, per endpoint and overall"""
+    groups = {'all': results}
+    for result in results:
+        groups.setdefault(result['endpoint'], []).append(result)
+    summary = {}
+    for name, group in groups.items():
+        latencies = np.array([r['latency_ms'] for r in group if r.get('status') == 200])
+        summary[name] = {
+            'requests': len(group),
+            'errors': sum(1 for r in group if r.get('status') != 200),
+            'degraded': sum(1 for r in group if r.get('degraded')),
+            'partial': sum(1 for r in group if r.get('partial')),
+            **({f'p{p}_ms': round(float(np.percentile(latencies, p)), 2) for p in LATENCY_PERCENTILES} if len(latencies) else {}),
+            'max_ms': round(float(latencies.max()), 2) if len(latencies) else None,
+        }
+    return summary
+
+
+def diff_results(before, after, top_k=10):
+    """Compare two replays of the same capture request by request"""
+    after_by_index = {r['index']: r for r in after}
+    compared = identical = status_changed = 0
+    overlaps = []
+    changed = []
+    for old in before:
+        new = after_by_index.get(old['index'])
+        if new is None:
+            continue
+        compared += 1
+        if old.get('status') != new.get('status'):
+            status_changed += 1
+        old_ids, new_ids = old['movie_ids'][:top_k], new['movie_ids'][:top_k]
+        if old_ids == new_ids:
+            identical += 1
+            continue
+        overlap = len(set(old_ids) & set(new_ids)) / max(len(old_ids), len(new_ids), 1)
+        overlaps.append(overlap)
+        changed.append({'index': old['index'], 'endpoint': old['endpoint'], 'overlap': round(overlap, 3),
+                        'before': old_ids, 'after': new_ids})
+    return {
+        'compared': compared,
+        'identical': identical,
+        'status_changed': status_changed,
+        'mean_overlap_of_changed': round(float(np.mean(overlaps)), 3) if overlaps else None,
+        'changed': changed,
+    }
+
+
+def start_stub(seed_path, port):
+    """Firestore stand-in seeded from a fixture file; returns its documents base URL"""
+    from firestore_stub_server import FirestoreStub, start_stub_server
+    store = FirestoreStub()
+    with open(seed_path, encoding='utf-8') as f:
+        store.seed(json.load(f))
+    _, base_url = start_stub_server(store, port=port)
+    print(f"[INFO] Firestore stand-in with {len(store.documents)} documents at {base_url}")
+    return base_url
+
+
+def launch_engine(base_url, port, wait_seconds=120):
+    """Start recommendation_engine.py against the stand-in and wait until it answers; returns the process"""
+    env = dict(os.environ, FIRESTORE_REST_API_BASE=base_url, PORT=str(port))
+    engine = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recommendation_engine.py')
+    # Own process group, so stop_engine also reaches the Flask reloader's child process
+    process = subprocess.Popen([sys.executable, engine], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    deadline = time.time() + wait_seconds
+    while time.time() < deadline:
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/genres", timeout=2).status_code == 200:
+                return process
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.5)
+    stop_engine(process)
+    raise RuntimeError("Recommendation engine did not start")
+
+
+def stop_engine(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+    process.wait()
+
+
+def write_ndjson(path, rows):
+    with open(path, 'w', encoding='utf-8') as f:
+        for row in rows:
+            f.write(json.dumps(row, separators=(',', ':')) + '\n')
+
+
+def read_ndjson(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured recommendation traffic and compare replays")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    replay_parser = commands.add_parser('replay', help="Send captured requests to a server")
+    replay_parser.add_argument('captures', nargs='+', help="Capture files or globs (e.g. 'traffic.ndjson*')")
+    replay_parser.add_argument('--target', default=DEFAULT_TARGET)
+    replay_parser.add_argument('--concurrency', type=int, default=4)
+    replay_parser.add_argument('--rate', type=float, default=0.0, help="Requests per second (0 = as fast as possible)")
+    replay_parser.add_argument('--limit', type=int, help="Replay only the first N captured requests")
+    replay_parser.add_argument('--timeout', type=float, default=30)
+    replay_parser.add_argument('--output', help="Write per-request results as NDJSON (input for 'diff')")
+    replay_parser.add_argument('--stub-seed', help="Start a Firestore stand-in seeded from this fixture")
+    replay_parser.add_argument('--stub-port', type=int, default=8085)
+    replay_parser.add_argument('--launch-engine', action='store_true', help="Start recommendation_engine.py against the stand-in")
+    replay_parser.add_argument('--engine-port', type=int, default=3100)
+
+    diff_parser = commands.add_parser('diff', help="Compare the results of two replays")
+    diff_parser.add_argument('before')
+    diff_parser.add_argument('after')
+    diff_parser.add_argument('--top-k', type=int, default=10)
+    diff_parser.add_argument('--show', type=int, default=10, help="How many changed requests to print")
+
+    args = parser.parse_args()
+
+    if args.command == 'diff':
+        report = diff_results(read_ndjson(args.before), read_ndjson(args.after), args.top_k)
+        changed = report.pop('changed')
+        print(json.dumps(report, indent=2))
+        for item in changed[:args.show]:
+            print(f"[INFO] #{item['index']} {item['endpoint']} overlap {item['overlap']}: {item['before']} -> {item['after']}")
+        return
+
+    captures = load_captures(args.captures, args.limit)
+    if not captures:
+        print("[ERROR] No captured requests found")
+        sys.exit(1)
+
+    engine = None
+    target = args.target
+    if args.stub_seed:
+        base_url = start_stub(args.stub_seed, args.stub_port)
+        if args.launch_engine:
+            engine = launch_engine(base_url, args.engine_port)
+            target = f"http://127.0.0.1:{args.engine_port}"
+    try:
+        print(f"[INFO] Replaying {len(captures)} requests against {target} (concurrency {args.concurrency}, rate {args.rate or 'unlimited'})")
+        results, elapsed = replay(captures, target, args.concurrency, args.rate, args.timeout)
+    finally:
+        if engine:
+            stop_engine(engine)
+
+    summary = latency_summary(results)
+    print(json.dumps({'elapsed_seconds': round(elapsed, 2), 'throughput_rps': round(len(results) / elapsed, 2), 'latency': summary}, indent=2))
+    if args.output:
+        write_ndjson(args.output, results)
+        print(f"[SUCCESS] Wrote {len(results)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
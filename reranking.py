@@ -0,0 +1,100 @@
+"""
+Re-ranking stages applied after scoring
+
+Only the top-K candidates (found with argpartition, not a full sort) reach
+a re-ranker, so diversification costs O(K^2) on a small pool regardless of
+catalog size.
+"""
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_RERANK_POOL = 50
+DEFAULT_MMR_LAMBDA = 0.7
+DEFAULT_GENRE_CAP = 3
+
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, in no particular order"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if k >= len(scores):
+        return np.arange(len(scores))
+    return np.argpartition(-scores, k - 1)[:k]
+
+
+def similarity_matrix(catalog, movies):
+    """Pairwise content similarity of the pool from the catalog's feature rows; zero for movies outside the catalog"""
+    size = len(movies)
+    if catalog.feature_matrix is None or not size:
+        return np.zeros((size, size), dtype=np.float32)
+    rows = [catalog.row_by_id.get(str(movie.get('id'))) for movie in movies]
+    known = np.array([row is not None for row in rows], dtype=np.float32)
+    # One fancy-indexed slice of the feature matrix, with rows of unknown movies zeroed out
+    features = sparse.diags(known) @ catalog.feature_matrix[[row if row is not None else 0 for row in rows]]
+    return (features @ features.T).toarray()
+
+
+def _score(movie):
+    return float(movie.get('similarity_score', 0) or movie.get('preference_score', 0))
+
+
+class ScoreOrderReranker:
+    """Keeps the scoring order"""
+
+    def rerank(self, movies, limit, catalog=None):
+        return movies[:limit]
+
+
+class MMRReranker:
+    """Maximal marginal relevance with a per-genre cap
+
+    Each pick maximises lambda * relevance - (1 - lambda) * (highest similarity to anything already picked).
+    A movie is passed over while any of its genres already fills genre_cap slots; if the caps leave
+    slots empty, the remaining movies fill them in MMR order.
+    """
+
+    def __init__(self, mmr_lambda=DEFAULT_MMR_LAMBDA, genre_cap=DEFAULT_GENRE_CAP):
+        self.mmr_lambda = mmr_lambda
+        self.genre_cap = genre_cap
+
+    def rerank(self, movies, limit, catalog=None):
+        if len(movies) <= 1 or catalog is None:
+            return movies[:limit]
+
+        relevance = np.array([_score(movie) for movie in movies], dtype=np.float64)
+        similarity = similarity_matrix(catalog, movies)
+        max_similarity = np.zeros(len(movies))
+        available = np.ones(len(movies), dtype=bool)
+        genre_counts = {}
+        selected = []
+
+        for relax_caps in (False, True):
+            while len(selected) < limit and available.any():
+                mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * max_similarity
+                mmr[~available] = -np.inf
+                if not relax_caps and self.genre_cap:
+                    for i in np.flatnonzero(available):
+                        if any(genre_counts.get(genre, 0) >= self.genre_cap for genre in movies[i].get('genres') or []):
+                            mmr[i] = -np.inf
+                best = int(np.argmax(mmr))
+                if mmr[best] == -np.inf:
+                    break
+                selected.append(best)
+                available[best] = False
+                max_similarity = np.maximum(max_similarity, similarity[best])
+                for genre in movies[best].get('genres') or []:
+                    genre_counts[genre] = genre_counts.get(genre, 0) + 1
+
+        return [movies[i] for i in selected]
+
+
+RERANKERS = {
+    'score': ScoreOrderReranker,
+    'mmr': MMRReranker,
+}
+
+
+def make_reranker(name, **options):
+    if name not in RERANKERS:
+        raise ValueError(f"Unknown re-ranker '{name}', expected one of {sorted(RERANKERS)}")
+    return RERANKERS[name](**options)
@@ -0,0 +1,133 @@
+"""
+Response shaping for the recommendation endpoints
+
+Payloads are trimmed before they are encoded:
+- fields=id,title,poster_path keeps only those keys in every recommended movie
+  (id is always kept)
+- internal bookkeeping fields (updated_at, used by the catalog change feed)
+  are always dropped
+- debug data (per-movie debug_info, the full user_profile counters) is dropped
+  unless debug=1; by default the profile keeps its top PROFILE_TOP_N entries
+  per preference
+- JSON is encoded compactly, with orjson when it is installed
+- bodies above MIN_COMPRESS_BYTES are compressed with br (when the brotli
+  package is installed) or gzip, whichever the client accepts
+
+orjson and brotli are optional; without them the stdlib json/gzip paths are used.
+"""
+
+import gzip
+import json
+
+from flask import Response
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DEBUG_MOVIE_FIELDS = ('debug_info',)
+# Kept on movie dicts for the catalog and change feed, never sent to clients
+INTERNAL_MOVIE_FIELDS = ('updated_at',)
+PROFILE_TOP_N = 5
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def parse_fields(raw):
+    """Parse a fields= projection ('id,title' or a list) into a set of keys, or None for every field"""
+    if not raw:
+        return None
+    if isinstance(raw, str):
+        raw = raw.split(',')
+    fields = {str(field).strip() for field in raw if str(field).strip()}
+    return fields | {'id'} if fields else None
+
+
+def compact_profile(profile, top_n=PROFILE_TOP_N):
+    """User profile with each preferred_* counter cut to its top_n entries"""
+    compact = {}
+    for key, value in profile.items():
+        if key.startswith('preferred_') and isinstance(value, dict):
+            value = dict(sorted(value.items(), key=lambda item: -item[1])[:top_n])
+        compact[key] = value
+    return compact
+
+
+def shape_movie(movie, fields=None, debug=False):
+    if fields is not None:
+        return {key: value for key, value in movie.items() if key in fields and key not in INTERNAL_MOVIE_FIELDS}
+    hidden = INTERNAL_MOVIE_FIELDS if debug else INTERNAL_MOVIE_FIELDS + DEBUG_MOVIE_FIELDS
+    return {key: value for key, value in movie.items() if key not in hidden}
+
+
+def shape_payload(payload, fields=None, debug=False):
+    """Copy of a recommendation payload with the projection and debug trimming applied"""
+    shaped = dict(payload)
+    if isinstance(shaped.get('recommendations'), list):
+        shaped['recommendations'] = [shape_movie(movie, fields, debug) for movie in shaped['recommendations']]
+    if shaped.get('user_profile') and not debug:
+        shaped['user_profile'] = compact_profile(shaped['user_profile'])
+    return shaped
+
+
+def encode_json(payload):
+    """Compact UTF-8 JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def negotiate_encoding(accept_encoding):
+    """Best supported content coding from an Accept-Encoding header ('br', 'gzip' or None)"""
+    offered = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            offered[coding.lower()] = quality
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if offered.get(coding, offered.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+
+def json_response(payload, request, body=None, status=200):
+    """Shaped, encoded and (if the client accepts it) compressed JSON response for a Flask request
+
+    body is the already-decoded request body (e.g. from msgpack); by default the JSON body is read
+    """
+    if body is None and request.method == 'POST':
+        body = request.get_json(silent=True)
+    body_args = body if isinstance(body, dict) else {}
+    fields = parse_fields(request.args.get('fields') or body_args.get('fields'))
+    debug = str(request.args.get('debug') or body_args.get('debug') or '').lower() in ('1', 'true')
+
+    encoded = encode_json(shape_payload(payload, fields, debug))
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if len(encoded) >= MIN_COMPRESS_BYTES else None
+    response = Response(compress(encoded, encoding), status=status, mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,458 @@
+"""
+In-memory seat availability with atomic, TTL-bounded seat holds
+
+Each showtime is the seats/{movieId}_{date}_{time}_{cinema} document the
+app's SeatService reads and writes ({bookedSeats: [...], bookingTimes:
+{seat: ISO time}}). It is loaded from Firestore once and kept as integer
+bitmaps over the rows x columns grid (seat 'A1' is bit 0, 'A2' bit 1, row B
+starts at bit columns). Booked and held seats each have a bitmap, so an
+availability query is one OR, and a hold is granted only if none of its
+bits are set. That check happens under the showtime's lock, so two checkouts
+can never hold or confirm the same seat.
+
+Holds belong to the user who placed them, who alone may confirm or release
+them, and each user may have only so many active holds at once. Holds lapse
+after their TTL unless confirmed. Confirmed seats are written back in
+batches, one :commit per flush interval, as appendMissingElements on
+bookedSeats plus per-seat bookingTimes paths, so seats the app books
+directly are never overwritten. Write-back needs service credentials (see
+firebase_auth.py); without them, or while Firestore rejects them, confirm
+refuses with SeatPersistenceError rather than booking seats that would never
+be saved. Showtimes are re-read every refresh interval to pick up seats
+booked or released elsewhere.
+"""
+
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import requests
+
+from firestore_rest import FIREBASE_REST_API_BASE, commit_writes, decode_fields, document_name
+
+DEFAULT_ROWS = 8
+DEFAULT_COLUMNS = 10
+DEFAULT_HOLD_TTL = 300
+DEFAULT_REFRESH_SECONDS = 30
+DEFAULT_MAX_HOLDS_PER_USER = 3
+# SeatService treats a booked seat as free again this long after its booking time
+BOOKED_SEAT_LIFETIME = 2 * 3600
+# Firestore accepts at most 500 writes per commit
+MAX_COMMIT_WRITES = 500
+
+
+class SeatConflict(Exception):
+    """Some requested seats are already booked or held"""
+
+    def __init__(self, seats):
+        super().__init__(f"Seats not available: {', '.join(seats)}")
+        self.seats = seats
+
+
+class HoldLimitExceeded(Exception):
+    """The user already has the maximum number of active holds"""
+
+
+class SeatPersistenceError(Exception):
+    """Confirmed seats cannot be written back to Firestore right now"""
+
+
+def showtime_id(movie_id, date, showtime, cinema):
+    """Document id SeatService uses for a showtime"""
+    return f"{movie_id}_{date}_{showtime}_{cinema}"
+
+
+def seat_document_path(doc_id):
+    """
+    Path of a showtime's seats document, shared by reads and writes
+    Raises ValueError for ids that are not a single Firestore document id, e.g. containing '/',
+    which would otherwise reach into subcollections of seats/ with the service credentials
+    """
+    doc_id = str(doc_id or '')
+    if not doc_id.strip() or '/' in doc_id or doc_id in ('.', '..') or (doc_id.startswith('__') and doc_id.endswith('__')):
+        raise ValueError(f"Invalid showtime id: {doc_id!r}")
+    return f"seats/{doc_id}"
+
+
+def iter_bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def booking_epoch(value, default):
+    """Epoch seconds of a bookingTimes entry (the app writes local ISO times without a zone)"""
+    try:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return default
+
+
+class ShowtimeSeats:
+    """Seat state of one showtime; every field is guarded by lock"""
+
+    def __init__(self, doc_id):
+        self.doc_id = doc_id
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.loaded_at = 0.0
+        self.booked = 0
+        self.held = 0
+        # bit -> epoch at which the booking stops counting (see BOOKED_SEAT_LIFETIME)
+        self.booked_until = {}
+        # hold id -> (mask, expires_at, owner)
+        self.holds = {}
+        # Confirmed here but not written back yet: bit -> booking time
+        self.pending = {}
+        # Written back but possibly missing from a read that started before the commit: bit -> (booking time, committed at)
+        self.committed = {}
+        self.next_expiry = 0.0
+
+    def expire(self, now):
+        """Drop lapsed holds and bookings; a no-op until the earliest deadline passes"""
+        if now < self.next_expiry:
+            return
+        self.holds = {hold_id: hold for hold_id, hold in self.holds.items() if hold[1] > now}
+        self.booked_until = {bit: until for bit, until in self.booked_until.items() if until > now}
+        self.held = 0
+        for mask, *_ in self.holds.values():
+            self.held |= mask
+        self.booked = 0
+        for bit in self.booked_until:
+            self.booked |= 1 << bit
+        deadlines = [hold[1] for hold in self.holds.values()] + list(self.booked_until.values())
+        self.next_expiry = min(deadlines, default=float('inf'))
+
+
+class SeatAvailabilityService:
+    """Bitmap seat maps per showtime, seat holds, and batched Firestore write-back of confirmed seats"""
+
+    def __init__(self, rows=DEFAULT_ROWS, columns=DEFAULT_COLUMNS, hold_ttl=DEFAULT_HOLD_TTL,
+                 refresh_seconds=DEFAULT_REFRESH_SECONDS, persist=True, base_url=None, credentials=None,
+                 max_holds_per_user=DEFAULT_MAX_HOLDS_PER_USER):
+        self.rows = rows
+        self.columns = columns
+        self.hold_ttl = hold_ttl
+        self.refresh_seconds = refresh_seconds
+        # Without persistence (no database) seats live in memory only
+        self.persist = persist
+        self.base_url = base_url or FIREBASE_REST_API_BASE
+        # Supplies the Authorization header for write-back (firebase_auth.ServiceToken)
+        self.credentials = credentials
+        self.max_holds_per_user = max_holds_per_user
+        self.session = requests.Session()
+        self._lock = threading.Lock()
+        self.showtimes = {}
+        self.dirty = set()
+        # owner -> {hold id: expires_at}
+        self.user_holds = {}
+        # Set while Firestore rejects the write-back credentials; confirm refuses until a commit succeeds
+        self.write_back_error = None
+        self.last_flush_error = None
+        self.stats = {'holds': 0, 'conflicts': 0, 'confirmed': 0, 'released': 0, 'loads': 0,
+                      'flushes': 0, 'writes': 0, 'flush_failures': 0, 'hold_limit_rejections': 0}
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def seat_bit(self, label):
+        """Bit index of a seat label like 'C7'; raises ValueError outside the grid"""
+        label = str(label).strip().upper()
+        try:
+            row, column = ord(label[0]) - 65, int(label[1:]) - 1
+        except (IndexError, ValueError):
+            raise ValueError(f"Invalid seat: {label!r}")
+        if not (0 <= row < self.rows and 0 <= column < self.columns):
+            raise ValueError(f"Seat {label} is outside the {self.rows}x{self.columns} layout")
+        return row * self.columns + column
+
+    def seat_label(self, bit):
+        return f"{chr(65 + bit // self.columns)}{bit % self.columns + 1}"
+
+    def seat_mask(self, seats):
+        """Bitmap of a list of seat labels; raises ValueError for an empty, invalid or repeated list"""
+        if not seats:
+            raise ValueError("No seats given")
+        mask = 0
+        for seat in seats:
+            bit = 1 << self.seat_bit(seat)
+            if mask & bit:
+                raise ValueError(f"Seat {seat} is listed twice")
+            mask |= bit
+        return mask
+
+    def labels(self, mask):
+        return [self.seat_label(bit) for bit in iter_bits(mask)]
+
+    def _fetch(self, doc_id):
+        """(bookedSeats, bookingTimes) as stored in Firestore; empty for a showtime nobody has booked"""
+        response = self.session.get(f"{self.base_url}/{quote(seat_document_path(doc_id), safe='/')}", timeout=10)
+        if response.status_code == 404:
+            return [], {}
+        response.raise_for_status()
+        data = decode_fields(response.json())
+        return data.get('bookedSeats') or [], data.get('bookingTimes') or {}
+
+    def _load(self, state):
+        """Re-read the showtime and merge it with seats confirmed here that the read may not include yet"""
+        started = time.time()
+        booked_seats, booking_times = self._fetch(state.doc_id)
+        self._count('loads')
+        booked_until = {}
+        for seat in booked_seats:
+            try:
+                bit = self.seat_bit(seat)
+            except ValueError:
+                continue
+            booked_until[bit] = booking_epoch(booking_times.get(seat), started) + BOOKED_SEAT_LIFETIME
+        with state.lock:
+            state.committed = {bit: entry for bit, entry in state.committed.items() if entry[1] >= started}
+            for bit, booked_at in list(state.pending.items()) + [(bit, entry[0]) for bit, entry in state.committed.items()]:
+                booked_until.setdefault(bit, booking_epoch(booked_at, started) + BOOKED_SEAT_LIFETIME)
+            state.booked_until = booked_until
+            state.next_expiry = 0.0
+            state.loaded_at = started
+
+    def _showtime(self, doc_id):
+        """Seat state for a showtime, loading it on first use and refreshing it when stale"""
+        seat_document_path(doc_id)
+        with self._lock:
+            state = self.showtimes.get(doc_id)
+            if state is None:
+                state = self.showtimes[doc_id] = ShowtimeSeats(doc_id)
+        if not self.persist:
+            return state
+        if not state.loaded_at:
+            # First use: everyone waits for the one load
+            with state.refresh_lock:
+                if not state.loaded_at:
+                    self._load(state)
+        elif time.time() - state.loaded_at > self.refresh_seconds and state.refresh_lock.acquire(blocking=False):
+            # Stale: one caller refreshes, the others keep answering from memory
+            try:
+                self._load(state)
+            except Exception as e:
+                print(f"[WARNING] Could not refresh seats for {doc_id}: {e}")
+            finally:
+                state.refresh_lock.release()
+        return state
+
+    def availability(self, doc_id):
+        """Booked and held seats of a showtime"""
+        state = self._showtime(doc_id)
+        with state.lock:
+            state.expire(time.time())
+            booked, held = state.booked, state.held
+        return {
+            'showtime_id': doc_id,
+            'rows': self.rows,
+            'columns': self.columns,
+            'booked': self.labels(booked),
+            'held': self.labels(held & ~booked),
+            'available': self.rows * self.columns - bin(booked | held).count('1'),
+            # Hex bitmap of unavailable seats (bit row * columns + column) for clients that decode it directly
+            'unavailable_bitmap': format(booked | held, 'x'),
+        }
+
+    def _reserve_hold(self, owner, hold_id, expires_at):
+        """Count a new hold against its owner's cap; raises HoldLimitExceeded when the owner is at the cap"""
+        if owner is None:
+            return
+        with self._lock:
+            now = time.time()
+            active = {other: until for other, until in self.user_holds.get(owner, {}).items() if until > now}
+            if len(active) >= self.max_holds_per_user:
+                self.stats['hold_limit_rejections'] += 1
+                raise HoldLimitExceeded(f"At most {self.max_holds_per_user} seat holds per user; "
+                                        f"confirm or release one first")
+            active[hold_id] = expires_at
+            self.user_holds[owner] = active
+
+    def _forget_hold(self, owner, hold_id):
+        if owner is None:
+            return
+        with self._lock:
+            active = self.user_holds.get(owner, {})
+            active.pop(hold_id, None)
+            if not active:
+                self.user_holds.pop(owner, None)
+
+    def _take_hold(self, state, hold_id, owner):
+        """Remove and return a hold placed by owner; caller holds state.lock"""
+        hold = state.holds.get(hold_id)
+        if hold is None or (owner is not None and hold[2] != owner):
+            return None
+        return state.holds.pop(hold_id)
+
+    def hold(self, doc_id, seats, ttl=None, owner=None):
+        """
+        Hold seats for ttl seconds on behalf of owner (a user id)
+        Raises ValueError for a non-positive ttl, HoldLimitExceeded when the owner already has
+        max_holds_per_user active holds, and SeatConflict naming any seat already booked or held
+        """
+        mask = self.seat_mask(seats)
+        if ttl is not None:
+            try:
+                ttl = float(ttl)
+            except (TypeError, ValueError):
+                raise ValueError("ttl must be a positive number of seconds")
+            if ttl <= 0:
+                raise ValueError("ttl must be a positive number of seconds")
+        ttl = min(ttl or self.hold_ttl, self.hold_ttl)
+        state = self._showtime(doc_id)
+        hold_id = secrets.token_urlsafe(12)
+        self._reserve_hold(owner, hold_id, time.time() + ttl)
+        with state.lock:
+            now = time.time()
+            state.expire(now)
+            taken = mask & (state.booked | state.held)
+            if not taken:
+                expires_at = now + ttl
+                state.holds[hold_id] = (mask, expires_at, owner)
+                state.held |= mask
+                state.next_expiry = min(state.next_expiry, expires_at)
+        if taken:
+            self._forget_hold(owner, hold_id)
+            self._count('conflicts')
+            raise SeatConflict(self.labels(taken))
+        self._count('holds')
+        return {'hold_id': hold_id, 'showtime_id': doc_id, 'seats': self.labels(mask), 'expires_at': expires_at}
+
+    def release(self, doc_id, hold_id, owner=None):
+        """Give up a hold; False if it no longer exists or belongs to someone else"""
+        state = self._showtime(doc_id)
+        with state.lock:
+            hold = self._take_hold(state, hold_id, owner)
+            if hold is not None:
+                state.held &= ~hold[0]
+        if hold is None:
+            return False
+        self._forget_hold(hold[2], hold_id)
+        self._count('released')
+        return True
+
+    def confirm(self, doc_id, hold_id, owner=None):
+        """
+        Turn a hold into booked seats, queued for write-back
+        Raises SeatPersistenceError (keeping the hold) when confirmed seats cannot be written back,
+        LookupError for an unknown, lapsed or someone else's hold, and SeatConflict if the app booked
+        a held seat directly meanwhile
+        """
+        if self.persist and self.credentials is None:
+            raise SeatPersistenceError("Seat bookings cannot be saved: no Firestore service credentials configured")
+        if self.persist and self.write_back_error:
+            raise SeatPersistenceError(f"Seat bookings cannot be saved right now: {self.write_back_error}")
+        state = self._showtime(doc_id)
+        with state.lock:
+            now = time.time()
+            state.expire(now)
+            hold = self._take_hold(state, hold_id, owner)
+            if hold is None:
+                raise LookupError("Hold not found or expired")
+            mask = hold[0]
+            state.held &= ~mask
+            taken = mask & state.booked
+            if not taken:
+                booked_at = datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z')
+                for bit in iter_bits(mask):
+                    state.pending[bit] = booked_at
+                    state.booked_until[bit] = now + BOOKED_SEAT_LIFETIME
+                state.booked |= mask
+                state.next_expiry = min(state.next_expiry, now + BOOKED_SEAT_LIFETIME)
+        self._forget_hold(hold[2], hold_id)
+        if taken:
+            self._count('conflicts')
+            raise SeatConflict(self.labels(taken))
+        with self._lock:
+            self.stats['confirmed'] += 1
+            if self.persist:
+                self.dirty.add(doc_id)
+        return {'showtime_id': doc_id, 'seats': self.labels(mask), 'booked_at': booked_at}
+
+    def _write(self, doc_id, pending):
+        """One :commit write adding the pending seats without touching the rest of the document"""
+        seats = {self.seat_label(bit): booked_at for bit, booked_at in sorted(pending.items())}
+        return {
+            'update': {
+                'name': document_name(seat_document_path(doc_id)),
+                'fields': {'bookingTimes': {'mapValue': {'fields': {seat: {'stringValue': booked_at} for seat, booked_at in seats.items()}}}},
+            },
+            'updateMask': {'fieldPaths': [f"bookingTimes.{seat}" for seat in seats]},
+            'updateTransforms': [{'fieldPath': 'bookedSeats', 'appendMissingElements': {'values': [{'stringValue': seat} for seat in seats]}}],
+        }
+
+    def flush(self):
+        """Write every showtime's confirmed seats back in batched commits; returns the number of showtimes written"""
+        with self._lock:
+            dirty, self.dirty = self.dirty, set()
+        batch = []
+        for doc_id in sorted(dirty):
+            state = self.showtimes[doc_id]
+            with state.lock:
+                pending, state.pending = state.pending, {}
+            if pending:
+                batch.append((state, pending))
+
+        written = 0
+        for start in range(0, len(batch), MAX_COMMIT_WRITES):
+            chunk = batch[start:start + MAX_COMMIT_WRITES]
+            try:
+                headers = self.credentials.headers() if self.credentials is not None else None
+                commit_writes([self._write(state.doc_id, pending) for state, pending in chunk], self.session,
+                              self.base_url, headers=headers)
+            except Exception as e:
+                status = getattr(getattr(e, 'response', None), 'status_code', None)
+                if status in (401, 403):
+                    # Retrying cannot help until the credentials are fixed; stop accepting new bookings meanwhile
+                    self.write_back_error = f"Firestore rejected the write-back credentials ({status})"
+                    print(f"[ERROR] Seat write-back denied ({status}); confirmations are refused until it succeeds, "
+                          f"{len(chunk)} showtimes kept for retry: {e}")
+                else:
+                    print(f"[ERROR] Seat write-back of {len(chunk)} showtimes failed, will retry: {e}")
+                self.last_flush_error = str(e)
+                self._count('flush_failures')
+                for state, pending in chunk:
+                    with state.lock:
+                        state.pending = {**pending, **state.pending}
+                with self._lock:
+                    self.dirty.update(state.doc_id for state, _ in chunk)
+                continue
+            self.write_back_error = None
+            committed_at = time.time()
+            for state, pending in chunk:
+                with state.lock:
+                    state.committed.update({bit: (booked_at, committed_at) for bit, booked_at in pending.items()})
+            written += len(chunk)
+        if written:
+            with self._lock:
+                self.stats['flushes'] += 1
+                self.stats['writes'] += written
+        return written
+
+    def run_flush_loop(self, interval):
+        """Background write-back; run on a daemon thread"""
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"[ERROR] Seat write-back loop error: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            dirty = len(self.dirty)
+            showtimes = list(self.showtimes.values())
+        return {
+            **stats,
+            'showtimes': len(showtimes),
+            'active_holds': sum(len(state.holds) for state in showtimes),
+            'pending_showtimes': dirty,
+            'write_back': 'disabled' if not self.persist else 'no credentials' if self.credentials is None
+                          else 'denied' if self.write_back_error else 'ok',
+            'last_flush_error': self.last_flush_error,
+        }
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Scatter-gather scoring over a sharded catalog
+
+The catalog is partitioned by a stable hash of the movie id (see
+MovieCatalog.shard). A coordinator sends every shard the same JSON query
+(target feature row and/or user profile weights, exclusions, candidate
+filter, k); each shard scores its rows with sparse products and returns its
+local top-k, and the coordinator merges them into the global top-k.
+
+Shards run either as single-process executors next to the engine
+(SCORING_SHARD_MODE=process, refreshed from the engine's catalog whenever it
+changes) or as separate nodes (SCORING_SHARD_MODE=http), each serving one
+shard of a catalog snapshot:
+
+    python sharded_scoring.py --shard 0 --shards 2 --port 7001 --snapshot catalog_snapshot
+    python sharded_scoring.py --shard 1 --shards 2 --port 7002 --snapshot catalog_snapshot
+    SCORING_SHARD_MODE=http SCORING_SHARD_URLS=http://127.0.0.1:7001,http://127.0.0.1:7002 python recommendation_engine.py
+"""
+
+import argparse
+import heapq
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import requests
+from scipy import sparse
+
+from movie_catalog import MovieCatalog
+from reranking import top_k_indices
+
+DEFAULT_SHARD_TIMEOUT = 5.0
+QUERY_MODES = ('similar', 'personal')
+PROFILE_FIELDS = ('preferred_genres', 'preferred_actors', 'preferred_directors', 'total_weight', 'avg_rating_preference')
+PROFILE_KINDS = {'genre': 'preferred_genres', 'actor': 'preferred_actors', 'director': 'preferred_directors'}
+# Blend used by calculate_movie_similarity: content vs preference, and within preference
+DEFAULT_SIMILARITY_WEIGHTS = {'content': 0.6, 'preference': 0.4, 'genre': 0.4, 'actor': 0.3, 'director': 0.2, 'rating': 0.1}
+PREFERENCE_COMPONENTS = ('genre', 'actor', 'director', 'rating')
+
+
+def parse_similarity_weights(raw):
+    """Parse 'content=0.6,preference=0.4,genre=0.4' over DEFAULT_SIMILARITY_WEIGHTS"""
+    weights = dict(DEFAULT_SIMILARITY_WEIGHTS)
+    if not raw:
+        return weights
+    for item in raw.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in DEFAULT_SIMILARITY_WEIGHTS:
+            raise ValueError(f"Unknown similarity weight: {name}")
+        weights[name] = float(weight)
+    return weights
+
+
+def make_query(mode, k, target_vector=None, user_profile=None, exclude_ids=(), criteria=None, weights=None):
+    """JSON-ready scoring query; target_vector is a 1 x features sparse row"""
+    if mode not in QUERY_MODES:
+        raise ValueError(f"Query mode must be one of {QUERY_MODES}")
+    target = None
+    if target_vector is not None:
+        row = sparse.csr_matrix(target_vector)
+        target = {'indices': row.indices.tolist(), 'data': row.data.tolist(), 'width': row.shape[1]}
+    return {
+        'mode': mode,
+        'k': k,
+        'target': target,
+        'profile': {field: user_profile[field] for field in PROFILE_FIELDS} if user_profile else None,
+        'exclude': sorted(str(movie_id) for movie_id in exclude_ids),
+        'criteria': criteria,
+        'weights': weights,
+    }
+
+
+def _attribute_scores(catalog, weights, kind):
+    """Per-row sum of the profile weights of one attribute kind, as one sparse product"""
+    vector = np.zeros(len(catalog.attribute_names), dtype=np.float32)
+    for value, weight in weights.items():
+        column = catalog.attribute_columns.get((kind, value))
+        if column is not None:
+            vector[column] = weight
+    return np.asarray(catalog.attribute_matrix @ vector).ravel()
+
+
+def score_components(catalog, query):
+    """
+    Per-row score components of a query, before weighting
+    'similar': 'content' plus, with a profile, the PREFERENCE_COMPONENTS; 'personal': 'preference'
+    """
+    size = len(catalog.movies)
+    profile = query.get('profile')
+    if query['mode'] != 'similar':
+        if not profile:
+            raise ValueError("A 'personal' query needs a user profile")
+        total = profile['total_weight']
+        return {'preference': (_attribute_scores(catalog, profile['preferred_genres'], 'genre')
+                               + _attribute_scores(catalog, profile['preferred_actors'], 'actor')) / total}
+
+    components = {'content': np.zeros(size, dtype=np.float64)}
+    target = query.get('target')
+    if target and catalog.feature_matrix is not None:
+        if target['width'] != catalog.feature_matrix.shape[1]:
+            raise ValueError("Query feature width does not match this shard's vocabulary")
+        vector = sparse.csr_matrix((target['data'], target['indices'], [0, len(target['indices'])]), shape=(1, target['width']), dtype=np.float32)
+        components['content'] = (catalog.feature_matrix @ vector.T).toarray().ravel().astype(np.float64)
+    if profile:
+        total = profile['total_weight']
+        components['genre'] = np.minimum(_attribute_scores(catalog, profile['preferred_genres'], 'genre') / total, 1.0)
+        components['actor'] = np.minimum(_attribute_scores(catalog, profile['preferred_actors'], 'actor') / total, 1.0)
+        components['director'] = _attribute_scores(catalog, profile['preferred_directors'], 'director') / total
+        components['rating'] = np.maximum(0, 1 - np.abs(catalog.numeric['vote_average'] - profile['avg_rating_preference']) / 10)
+    return components
+
+
+def combine_components(components, weights=None):
+    """Scores from score_components, blended like MovieRecommendationEngine.calculate_movie_similarity"""
+    if 'content' not in components:
+        return components['preference']
+    weights = weights or DEFAULT_SIMILARITY_WEIGHTS
+    if 'genre' not in components:
+        return components['content']
+    preference = sum(components[name] * weights[name] for name in PREFERENCE_COMPONENTS)
+    return components['content'] * weights['content'] + preference * weights['preference']
+
+
+def query_rows(catalog, query):
+    """Rows a query may return: its candidate filter minus the excluded movies"""
+    mask = catalog.candidate_mask(query.get('criteria'))
+    for movie_id in query.get('exclude', []):
+        row = catalog.row_by_id.get(movie_id)
+        if row is not None:
+            mask[row] = False
+    return np.flatnonzero(mask)
+
+
+def score_catalog(catalog, query):
+    """
+    Local top-k [movie id, score] pairs for a query, best first
+    Scores match MovieRecommendationEngine.calculate_movie_similarity ('similar') and the personalised preference score ('personal')
+    """
+    if not len(catalog.movies):
+        return []
+    scores = combine_components(score_components(catalog, query), query.get('weights'))
+    rows = query_rows(catalog, query)
+    if not len(rows):
+        return []
+    best = rows[top_k_indices(scores[rows], query['k'])]
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return [[str(catalog.movies[row].get('id')), float(scores[row])] for row in best]
+
+
+def merge_top_k(shard_results, k):
+    """Global top-k from the shards' local top-k lists"""
+    return heapq.nlargest(k, (pair for result in shard_results for pair in result), key=lambda pair: pair[1])
+
+
+# Worker-process side of ProcessShards: each single-process executor holds one shard
+_shard_catalog = None
+
+
+def _load_shard(catalog):
+    global _shard_catalog
+    _shard_catalog = catalog
+    return len(catalog.movies)
+
+
+def _score_loaded_shard(query):
+    return score_catalog(_shard_catalog, query)
+
+
+class ProcessShards:
+    """One single-process executor per shard, reloaded from the coordinator's catalog whenever it changes"""
+
+    def __init__(self, count):
+        # fork, so workers never re-import the engine module; they are started here, before the
+        # engine starts its background threads
+        context = multiprocessing.get_context('fork')
+        self.executors = [ProcessPoolExecutor(max_workers=1, mp_context=context) for _ in range(count)]
+        self.pids = [executor.submit(os.getpid).result() for executor in self.executors]
+        self.lock = threading.Lock()
+        self.catalog = None
+        self.sizes = [0] * count
+
+    def sync(self, catalog):
+        """Push a new catalog's shards to the workers (once per catalog version)"""
+        if catalog is self.catalog:
+            return
+        with self.lock:
+            if catalog is self.catalog:
+                return
+            count = len(self.executors)
+            futures = [executor.submit(_load_shard, catalog.shard(i, count)) for i, executor in enumerate(self.executors)]
+            self.sizes = [future.result() for future in futures]
+            self.catalog = catalog
+
+    def submit(self, query):
+        return [executor.submit(_score_loaded_shard, query) for executor in self.executors]
+
+    def describe(self):
+        return {'mode': 'process', 'shards': len(self.executors), 'pids': self.pids, 'movies': self.sizes}
+
+
+class HttpShards:
+    """Shard nodes serving POST /score; each node keeps its own shard of the catalog snapshot"""
+
+    def __init__(self, urls, timeout=DEFAULT_SHARD_TIMEOUT):
+        self.urls = [url.rstrip('/') for url in urls]
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.pool = ThreadPoolExecutor(max_workers=max(len(self.urls), 1), thread_name_prefix='shard-client')
+
+    def sync(self, catalog):
+        pass
+
+    def _post(self, url, query):
+        response = self.session.post(f"{url}/score", json=query, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['results']
+
+    def submit(self, query):
+        return [self.pool.submit(self._post, url, query) for url in self.urls]
+
+    def describe(self):
+        return {'mode': 'http', 'shards': len(self.urls), 'urls': self.urls}
+
+
+class ShardedScorer:
+    """Coordinator: fan one query out to every shard and merge their local top-k"""
+
+    def __init__(self, shards, timeout=DEFAULT_SHARD_TIMEOUT):
+        self.shards = shards
+        self.timeout = timeout
+        self.stats = {'queries': 0, 'failures': 0, 'last_ms': None}
+
+    def top_k(self, catalog, query):
+        """Merged [movie id, score] pairs, best first; raises if any shard fails, so callers can score locally instead"""
+        started = time.perf_counter()
+        self.stats['queries'] += 1
+        try:
+            self.shards.sync(catalog)
+            results = [future.result(timeout=self.timeout) for future in self.shards.submit(query)]
+        except Exception:
+            self.stats['failures'] += 1
+            raise
+        self.stats['last_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return merge_top_k(results, query['k'])
+
+    def snapshot(self):
+        return {**self.shards.describe(), **self.stats}
+
+
+def make_handler(node):
+    class ShardHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != '/health':
+                return self._send(404, {'error': 'Not found'})
+            return self._send(200, node.describe())
+
+        def do_POST(self):
+            if self.path != '/score':
+                return self._send(404, {'error': 'Not found'})
+            try:
+                query = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                return self._send(200, {'results': score_catalog(node.current(), query)})
+            except ValueError as e:
+                return self._send(409, {'error': str(e)})
+
+    return ShardHandler
+
+
+class ShardNode:
+    """One shard of a catalog snapshot, reloaded when the snapshot's manifest changes"""
+
+    def __init__(self, snapshot_path, index, count):
+        self.snapshot_path = snapshot_path
+        self.index = index
+        self.count = count
+        self.lock = threading.Lock()
+        self.catalog = MovieCatalog()
+        self.loaded_mtime = None
+
+    def current(self):
+        manifest = os.path.join(self.snapshot_path, 'manifest.json')
+        mtime = os.path.getmtime(manifest) if os.path.exists(manifest) else None
+        if mtime != self.loaded_mtime:
+            with self.lock:
+                if mtime != self.loaded_mtime:
+                    catalog = MovieCatalog.load_snapshot(self.snapshot_path)
+                    if catalog is not None:
+                        self.catalog = catalog.shard(self.index, self.count)
+                        print(f"[INFO] Shard {self.index}/{self.count} loaded {len(self.catalog.movies)} movies")
+                    self.loaded_mtime = mtime
+        return self.catalog
+
+    def describe(self):
+        return {'shard': self.index, 'shards': self.count, 'movies': len(self.current().movies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve one shard of the catalog snapshot for scatter-gather scoring")
+    parser.add_argument('--shard', type=int, required=True, help="Shard index, 0-based")
+    parser.add_argument('--shards', type=int, required=True, help="Total number of shards")
+    parser.add_argument('--snapshot', default=os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=7001)
+    args = parser.parse_args()
+
+    node = ShardNode(args.snapshot, args.shard, args.shards)
+    node.current()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(node))
+    print(f"[SUCCESS] Shard {args.shard}/{args.shards} listening on http://{args.host}:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
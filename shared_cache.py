@@ -0,0 +1,311 @@
+"""
+Two-tier cache for data every worker process reads (movie metadata)
+
+- LocalCache: in-process LRU with per-key expiry, checked first
+- a shared second tier, reachable by every worker on the host or cluster:
+  - RedisCache: any Redis-protocol server (Redis, Valkey, KeyDB, ...),
+    spoken over a plain socket so no client library is needed
+  - FileCache: one file per key in a directory; point it at /dev/shm for a
+    shared-memory cache on a single host
+
+Values are stored compactly (msgpack when installed, else compact JSON) with
+a one-byte codec tag, so workers with and without msgpack share entries, and
+behind their absolute expiry, so a copy pulled into a worker's local tier
+expires when the shared entry does.
+Shared-tier failures count as misses: the cache never fails a request.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_LOCAL_SIZE = 5000
+DEFAULT_SOCKET_TIMEOUT = 0.5
+CACHE_BACKENDS = ('memory', 'redis', 'file')
+
+
+def encode_value(value):
+    """Tagged compact bytes: b'm' + msgpack, or b'j' + JSON"""
+    if msgpack is not None:
+        return b'm' + msgpack.packb(value, use_bin_type=True)
+    return b'j' + json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def decode_value(data):
+    if data[:1] == b'm':
+        if msgpack is None:
+            raise ValueError("Entry was written with msgpack, which is not installed here")
+        return msgpack.unpackb(data[1:], raw=False)
+    return json.loads(data[1:].decode('utf-8'))
+
+
+class LocalCache:
+    """Bounded in-process LRU; each entry expires at its own deadline"""
+
+    def __init__(self, max_entries=DEFAULT_LOCAL_SIZE):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """(value, seconds left) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            remaining = expires_at - time.monotonic()
+            if remaining <= 0:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, remaining
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisCache:
+    """GET / SET PX / DEL against a Redis-protocol server (redis://host:port/db), one connection per thread"""
+
+    def __init__(self, url, timeout=DEFAULT_SOCKET_TIMEOUT):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or '127.0.0.1'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.strip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def describe(self):
+        return f"redis://{self.host}:{self.port}/{self.db}"
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        if self.password:
+            self._call(b'AUTH', self.password)
+        if self.db:
+            self._call(b'SELECT', str(self.db))
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError("Connection closed by cache server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b'-':
+            raise RuntimeError(rest.decode('utf-8', 'replace'))
+        if kind in (b'+', b':'):
+            return rest
+        if kind == b'$':
+            length = int(rest)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        raise ConnectionError(f"Unexpected reply from cache server: {line[:20]!r}")
+
+    def _call(self, *parts):
+        request = [b'*%d\r\n' % len(parts)]
+        for part in parts:
+            if not isinstance(part, bytes):
+                part = str(part).encode('utf-8')
+            request.append(b'$%d\r\n%s\r\n' % (len(part), part))
+        self._local.sock.sendall(b''.join(request))
+        return self._read_reply()
+
+    def command(self, *parts):
+        """Run one command, reconnecting once if the pooled connection went away"""
+        for attempt in (0, 1):
+            if getattr(self._local, 'sock', None) is None:
+                self._connect()
+            try:
+                return self._call(*parts)
+            except (OSError, ConnectionError):
+                self.close()
+                if attempt:
+                    raise
+
+    def close(self):
+        sock = getattr(self._local, 'sock', None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def get(self, key):
+        return self.command(b'GET', key)
+
+    def set(self, key, data, ttl):
+        self.command(b'SET', key, data, b'PX', max(int(ttl * 1000), 1))
+
+    def delete(self, key):
+        self.command(b'DEL', key)
+
+
+class FileCache:
+    """One file per key (8-byte expiry header + value), written atomically; shared by every process on the host"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def describe(self):
+        return f"file://{self.directory}"
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        expires_at = int.from_bytes(data[:8], 'big') / 1000
+        if expires_at <= time.time():
+            self.delete(key)
+            return None
+        return data[8:]
+
+    def set(self, key, data, ttl):
+        expires_at = int((time.time() + ttl) * 1000).to_bytes(8, 'big')
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(expires_at + data)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+class TieredCache:
+    """Local LRU in front of an optional shared tier; entries found in the shared tier are copied locally for the rest of their TTL"""
+
+    def __init__(self, shared=None, ttl=DEFAULT_TTL_SECONDS, local_size=DEFAULT_LOCAL_SIZE, namespace='cache'):
+        self.local = LocalCache(local_size)
+        self.shared = shared
+        self.ttl = ttl
+        self.namespace = namespace
+        self._stats_lock = threading.Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'sets': 0, 'shared_errors': 0}
+        self.last_error = None
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _shared_failed(self, e):
+        self._count('shared_errors')
+        if str(e) != self.last_error:
+            print(f"[WARNING] Shared cache {self.shared.describe()} unavailable: {e}")
+        self.last_error = str(e)
+
+    def _shared_key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def get(self, key):
+        """Cached value or None"""
+        key = str(key)
+        entry = self.local.get(key)
+        if entry is not None:
+            self._count('local_hits')
+            return entry[0]
+        if self.shared is not None:
+            try:
+                data = self.shared.get(self._shared_key(key))
+                remaining = int.from_bytes(data[:8], 'big') / 1000 - time.time() if data else 0
+                if remaining > 0:
+                    value = decode_value(data[8:])
+                    self.local.set(key, value, remaining)
+                    self._count('shared_hits')
+                    return value
+            except Exception as e:
+                self._shared_failed(e)
+        self._count('misses')
+        return None
+
+    def set(self, key, value, ttl=None):
+        key = str(key)
+        ttl = ttl or self.ttl
+        self.local.set(key, value, ttl)
+        self._count('sets')
+        if self.shared is not None:
+            try:
+                expires_at = int((time.time() + ttl) * 1000).to_bytes(8, 'big')
+                self.shared.set(self._shared_key(key), expires_at + encode_value(value), ttl)
+            except Exception as e:
+                self._shared_failed(e)
+
+    def delete(self, key):
+        key = str(key)
+        self.local.delete(key)
+        if self.shared is not None:
+            try:
+                self.shared.delete(self._shared_key(key))
+            except Exception as e:
+                self._shared_failed(e)
+
+    def snapshot(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            'backend': self.shared.describe() if self.shared is not None else 'memory',
+            'ttl_seconds': self.ttl,
+            'local_entries': len(self.local),
+            **stats,
+        }
+
+
+def make_cache(backend='memory', url=None, directory=None, ttl=DEFAULT_TTL_SECONDS, local_size=DEFAULT_LOCAL_SIZE, namespace='cache'):
+    """TieredCache with the named shared tier ('memory' = in-process only)"""
+    if backend not in CACHE_BACKENDS:
+        raise ValueError(f"Cache backend must be one of {CACHE_BACKENDS}")
+    shared = None
+    if backend == 'redis':
+        shared = RedisCache(url or 'redis://127.0.0.1:6379/0')
+    elif backend == 'file':
+        default_root = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        shared = FileCache(directory or os.path.join(default_root, f'{namespace}-cache'))
+    return TieredCache(shared, ttl, local_size, namespace)
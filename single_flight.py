@@ -0,0 +1,60 @@
+"""
+Request coalescing: concurrent callers asking for the same resource share one in-flight fetch
+"""
+
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run fn once per key at a time; callers arriving while it runs wait for and share its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.stats = {}
+
+    def do(self, key, fn, *args, **kwargs):
+        """Call fn(*args, **kwargs) or join an identical in-flight call. key is (resource, argument)"""
+        resource = key[0] if isinstance(key, tuple) else key
+        with self._lock:
+            stats = self.stats.setdefault(resource, {'calls': 0, 'executions': 0, 'coalesced': 0})
+            stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                stats['coalesced'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                stats['executions'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def snapshot(self):
+        """Copy of per-resource counters for the metrics endpoint"""
+        with self._lock:
+            stats = {resource: dict(counts) for resource, counts in self.stats.items()}
+            in_flight = len(self._calls)
+        return {'in_flight': in_flight, 'resources': stats}
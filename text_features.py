@@ -0,0 +1,178 @@
+"""
+Field-weighted text features for content similarity
+
+Each movie field gets its own vectorizer (overview as stop-worded prose,
+genres/cast/keywords/director as whole-value tokens), each field's rows are
+L2-normalised and scaled by the field weight, and the stacked row is
+normalised again so a dot product between two rows is a weighted cosine
+similarity. Matrices are float32 CSR.
+
+'tfidf' mode fits one vocabulary per field once per catalog version and keeps
+it (and the idf weights) for transforming new rows and for snapshots;
+'hashing' mode needs no fitting at all, so an unbounded vocabulary never
+forces a refit.
+"""
+
+import json
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+TEXT_FEATURE_MODES = ('tfidf', 'hashing')
+
+# field -> weight; keywords and director are empty until the catalog is enriched, and
+# fields with no vocabulary simply contribute nothing
+DEFAULT_FIELD_WEIGHTS = {
+    'overview': 1.0,
+    'genres': 0.6,
+    'cast': 0.4,
+    'keywords': 0.4,
+    'director': 0.3,
+}
+PROSE_FIELDS = ('overview',)
+
+DEFAULT_MAX_FEATURES = 5000
+DEFAULT_HASH_FEATURES = 2 ** 18
+
+STATE_FILE = 'text_features.json'
+
+
+def parse_field_weights(raw):
+    """Parse 'overview=1,genres=0.6,cast=0.4' into a weights dict"""
+    if not raw:
+        return dict(DEFAULT_FIELD_WEIGHTS)
+    weights = {}
+    for item in raw.split(','):
+        field, _, weight = item.partition('=')
+        field = field.strip()
+        if field not in DEFAULT_FIELD_WEIGHTS:
+            raise ValueError(f"Unknown text feature field: {field}")
+        weights[field] = float(weight)
+    return weights
+
+
+def value_tokens(values):
+    """Analyzer for list fields: each genre / cast member / keyword is one token"""
+    return [value.strip().lower() for value in values if value and value.strip()]
+
+
+def field_value(movie, field):
+    value = movie.get(field)
+    if field in PROSE_FIELDS:
+        return value or ''
+    if isinstance(value, str):
+        return [value]
+    return value or []
+
+
+class TextFeaturePipeline:
+    """Per-field vectorizers combined into one weighted, row-normalised float32 CSR matrix"""
+
+    def __init__(self, weights=None, mode='tfidf', max_features=DEFAULT_MAX_FEATURES, hash_features=DEFAULT_HASH_FEATURES):
+        if mode not in TEXT_FEATURE_MODES:
+            raise ValueError(f"Text feature mode must be one of {TEXT_FEATURE_MODES}")
+        self.weights = {field: weight for field, weight in (weights or DEFAULT_FIELD_WEIGHTS).items() if weight > 0}
+        self.mode = mode
+        self.max_features = max_features
+        self.hash_features = hash_features
+        # field -> fitted vectorizer, or None when the field had no vocabulary at fit time
+        self.vectorizers = {}
+        self.fitted = mode == 'hashing'
+        if self.fitted:
+            self.vectorizers = {field: self._hashing_vectorizer(field) for field in self.weights}
+
+    def config(self):
+        return {
+            'mode': self.mode,
+            'weights': self.weights,
+            'max_features': self.max_features,
+            'hash_features': self.hash_features,
+        }
+
+    def clone(self):
+        """Unfitted pipeline with the same configuration"""
+        return TextFeaturePipeline(self.weights, self.mode, self.max_features, self.hash_features)
+
+    def _hashing_vectorizer(self, field):
+        options = dict(n_features=self.hash_features, alternate_sign=False, norm='l2', dtype=np.float32)
+        if field in PROSE_FIELDS:
+            return HashingVectorizer(stop_words='english', **options)
+        return HashingVectorizer(analyzer=value_tokens, **options)
+
+    def _tfidf_vectorizer(self, field, vocabulary=None):
+        if field in PROSE_FIELDS:
+            return TfidfVectorizer(stop_words='english', max_features=self.max_features, vocabulary=vocabulary, dtype=np.float32)
+        return TfidfVectorizer(analyzer=value_tokens, vocabulary=vocabulary, dtype=np.float32)
+
+    def _width(self, field):
+        vectorizer = self.vectorizers.get(field)
+        if vectorizer is None:
+            return 0
+        if self.mode == 'hashing':
+            return self.hash_features
+        return len(vectorizer.vocabulary_)
+
+    def fit_transform(self, movies):
+        """Fit every field's vocabulary on the catalog and return its feature matrix"""
+        if self.mode == 'tfidf':
+            self.vectorizers = {}
+            for field in self.weights:
+                vectorizer = self._tfidf_vectorizer(field)
+                try:
+                    vectorizer.fit([field_value(movie, field) for movie in movies])
+                    self.vectorizers[field] = vectorizer
+                except ValueError:
+                    # Empty vocabulary: every value was empty or stop words only
+                    self.vectorizers[field] = None
+            self.fitted = True
+        return self.transform(movies)
+
+    def transform(self, movies):
+        """Feature rows for movies using the fitted vocabularies; None if no field has any vocabulary"""
+        blocks = []
+        for field, weight in self.weights.items():
+            vectorizer = self.vectorizers.get(field)
+            if vectorizer is None:
+                continue
+            block = vectorizer.transform([field_value(movie, field) for movie in movies])
+            blocks.append(block.astype(np.float32) * np.float32(weight))
+        if not blocks:
+            return None
+        matrix = sparse.hstack(blocks, format='csr', dtype=np.float32)
+        return normalize(matrix, norm='l2', copy=False).astype(np.float32)
+
+    def save(self, path):
+        """Write the configuration and fitted vocabularies / idf weights into a snapshot directory"""
+        fields = {}
+        for field, vectorizer in self.vectorizers.items():
+            if vectorizer is None or self.mode == 'hashing':
+                fields[field] = None
+                continue
+            fields[field] = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+            np.save(os.path.join(path, f'idf_{field}.npy'), vectorizer.idf_.astype(np.float32))
+        with open(os.path.join(path, STATE_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'config': self.config(), 'fields': fields}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path):
+        """Restore a fitted pipeline saved with save(), or None if the directory has none"""
+        state_path = os.path.join(path, STATE_FILE)
+        if not os.path.exists(state_path):
+            return None
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+        config = state['config']
+        pipeline = cls(config['weights'], config['mode'], config['max_features'], config['hash_features'])
+        if pipeline.mode == 'tfidf':
+            for field, vocabulary in state['fields'].items():
+                if vocabulary is None:
+                    pipeline.vectorizers[field] = None
+                    continue
+                vectorizer = pipeline._tfidf_vectorizer(field, vocabulary)
+                vectorizer.idf_ = np.load(os.path.join(path, f'idf_{field}.npy'))
+                pipeline.vectorizers[field] = vectorizer
+            pipeline.fitted = True
+        return pipeline
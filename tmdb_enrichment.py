@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Offline TMDB enrichment of the catalog: keywords, director and TMDB popularity
+
+Firestore movie documents carry none of these, so the engine's keywords and
+director text features and director preferences stay empty until the catalog
+is enriched. This worker fetches /movie/{id} with credits and keywords
+appended (one request per movie; movies not imported from TMDB are first
+matched by a title/year search) on a thread pool, paced by a shared token
+bucket, with every response cached on disk:
+
+    python tmdb_enrichment.py --workers 8 --rate 20
+    python tmdb_enrichment.py --base-url http://127.0.0.1:8090/3 --limit 100    # against tmdb_stub_server.py
+
+Results go to the enrichment file (TMDB_ENRICHMENT_PATH), which doubles as
+the checkpoint: it is saved every --checkpoint-every movies, and a re-run
+skips movies already in it, so an interrupted run resumes where it stopped.
+At the end the catalog snapshot is rebuilt with the enriched fields. The
+engine also overlays the enrichment file on movies it reads from Firestore,
+so later catalog rebuilds keep the fields.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from firestore_rest import decode_movie_document, document_path, iter_collection
+from movie_catalog import MovieCatalog
+
+DEFAULT_BASE_URL = 'https://api.themoviedb.org/3'
+DEFAULT_ENRICHMENT_PATH = 'tmdb_enrichment.json'
+DEFAULT_CACHE_DIR = 'tmdb_cache'
+# TMDB allows roughly 50 requests per second per IP; stay well under it
+DEFAULT_RATE = 20.0
+DEFAULT_CACHE_TTL = 7 * 24 * 3600
+MAX_KEYWORDS = 20
+MAX_RETRIES = 5
+ENRICHED_FIELDS = ('keywords', 'director', 'tmdb_popularity')
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, at most burst banked"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.capacity = float(burst or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """TMDB JSON responses on disk, one file per request, valid for ttl seconds"""
+
+    def __init__(self, directory, ttl=DEFAULT_CACHE_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], f"{digest}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{threading.get_ident()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+
+class TMDBClient:
+    """GET against the TMDB v3 API through the token bucket and response cache, retrying 429s and 5xx"""
+
+    def __init__(self, api_key, base_url=DEFAULT_BASE_URL, bucket=None, cache=None, timeout=10):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.bucket = bucket or TokenBucket(DEFAULT_RATE)
+        self.cache = cache
+        self.timeout = timeout
+        self._local = threading.local()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'throttled': 0, 'errors': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def get(self, path, **params):
+        """Decoded JSON response, or None for a 404"""
+        # The API key is left out of the cache key so cached responses survive key rotation
+        key = f"{path}?{json.dumps(params, sort_keys=True)}"
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self._count('cache_hits')
+                return cached
+
+        for attempt in range(MAX_RETRIES):
+            self.bucket.acquire()
+            self._count('requests')
+            try:
+                response = self._session().get(f"{self.base_url}{path}", params={**params, 'api_key': self.api_key},
+                                               timeout=self.timeout)
+            except requests.RequestException as e:
+                error = e
+                time.sleep(2 ** attempt * 0.5)
+                continue
+            if response.status_code == 404:
+                return None
+            if response.status_code == 429 or response.status_code >= 500:
+                self._count('throttled' if response.status_code == 429 else 'errors')
+                error = f"HTTP {response.status_code}"
+                time.sleep(float(response.headers.get('Retry-After') or 2 ** attempt * 0.5))
+                continue
+            response.raise_for_status()
+            data = response.json()
+            if self.cache is not None:
+                self.cache.put(key, data)
+            return data
+        raise RuntimeError(f"TMDB request {path} failed after {MAX_RETRIES} attempts: {error}")
+
+
+def enrichment_fields(details):
+    """The catalog fields taken from a /movie/{id}?append_to_response=credits,keywords response"""
+    crew = (details.get('credits') or {}).get('crew') or []
+    directors = [member.get('name') for member in crew if member.get('job') == 'Director' and member.get('name')]
+    keywords = (details.get('keywords') or {}).get('keywords') or []
+    return {
+        'tmdb_id': details.get('id'),
+        'keywords': [keyword['name'] for keyword in keywords[:MAX_KEYWORDS] if keyword.get('name')],
+        'director': directors[0] if directors else '',
+        'tmdb_popularity': float(details.get('popularity') or 0),
+    }
+
+
+def tmdb_id_for(client, movie):
+    """TMDB id of a catalog movie: its own id when imported from TMDB, else the best title/year search match"""
+    if movie.get('isFromTMDB') and str(movie.get('id', '')).isdigit():
+        return int(movie['id'])
+    params = {'query': movie.get('title') or ''}
+    year = (movie.get('release_date') or '')[:4]
+    if year.isdigit():
+        params['year'] = year
+    results = (client.get('/search/movie', **params) or {}).get('results') or []
+    return results[0]['id'] if results else None
+
+
+def enrich_movie(client, movie):
+    """Enriched fields for one movie, or None if TMDB has no match"""
+    tmdb_id = tmdb_id_for(client, movie)
+    if tmdb_id is None:
+        return None
+    details = client.get(f"/movie/{tmdb_id}", append_to_response='credits,keywords')
+    if details is None:
+        return None
+    return {**enrichment_fields(details), 'enriched_at': time.time()}
+
+
+class EnrichmentStore:
+    """The enrichment file ({movie id: fields}), overlaid on movie dicts and reloaded when the file changes"""
+
+    def __init__(self, path=DEFAULT_ENRICHMENT_PATH):
+        self.path = path
+        self.movies = {}
+        self.loaded_mtime = None
+        self.lock = threading.Lock()
+
+    def reload(self):
+        """Re-read the file if it changed; returns True when the contents were replaced"""
+        mtime = os.path.getmtime(self.path) if self.path and os.path.exists(self.path) else None
+        if mtime == self.loaded_mtime:
+            return False
+        movies = {}
+        if mtime is not None:
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    movies = json.load(f).get('movies', {})
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Could not read TMDB enrichment from {self.path}: {e}")
+                return False
+        with self.lock:
+            self.movies = movies
+            self.loaded_mtime = mtime
+        return True
+
+    def apply(self, movie):
+        """The movie with its enriched fields (a copy), or the movie itself if it has none"""
+        fields = self.movies.get(str(movie.get('id')))
+        if not fields:
+            return movie
+        return {**movie, **{field: fields[field] for field in ENRICHED_FIELDS if field in fields}}
+
+    def update(self, movie_id, fields):
+        with self.lock:
+            self.movies[str(movie_id)] = fields
+
+    def save(self):
+        """Write the file atomically"""
+        with self.lock:
+            data = {'updated_at': time.time(), 'movies': dict(self.movies)}
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+        self.loaded_mtime = os.path.getmtime(self.path)
+
+
+def enrich_catalog(movies, client, store, workers=8, refresh=False, checkpoint_every=50):
+    """Enrich every movie not yet in the store; returns counts of enriched, unmatched, failed and skipped movies"""
+    todo = [movie for movie in movies if refresh or str(movie.get('id')) not in store.movies]
+    counts = {'enriched': 0, 'unmatched': 0, 'failed': 0, 'skipped': len(movies) - len(todo)}
+    print(f"[INFO] Enriching {len(todo)} movies ({counts['skipped']} already enriched)")
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(enrich_movie, client, movie): movie for movie in todo}
+        for done, future in enumerate(as_completed(futures), 1):
+            movie = futures[future]
+            try:
+                fields = future.result()
+            except Exception as e:
+                counts['failed'] += 1
+                print(f"[ERROR] Could not enrich movie {movie.get('id')}: {e}")
+                continue
+            if fields is None:
+                counts['unmatched'] += 1
+                # Recorded too, so a resumed run does not search for it again
+                fields = {'tmdb_id': None, 'enriched_at': time.time()}
+            else:
+                counts['enriched'] += 1
+            store.update(movie.get('id'), fields)
+            if done % checkpoint_every == 0:
+                store.save()
+                print(f"[INFO] Checkpoint: {done}/{len(todo)} movies processed")
+    store.save()
+    return counts
+
+
+def rebuild_snapshot(snapshot_path, store):
+    """Rebuild the catalog snapshot with the enriched fields, keeping its text feature configuration and booking velocity"""
+    catalog = MovieCatalog.load_snapshot(snapshot_path, mmap=False)
+    if catalog is None:
+        print(f"[WARNING] No catalog snapshot at {snapshot_path}; the engine picks the enrichment up on its next catalog build")
+        return False
+    live_rows = np.flatnonzero(catalog.live)
+    enriched = MovieCatalog(catalog.text_features.clone())
+    enriched.load([store.apply(catalog.movies[row]) for row in live_rows])
+    enriched.set_numeric('popularity', np.asarray(catalog.numeric['popularity'])[live_rows])
+    enriched.save_snapshot(snapshot_path)
+    print(f"[SUCCESS] Rebuilt catalog snapshot {snapshot_path} with enriched fields for {len(enriched)} movies")
+    return True
+
+
+def load_movies(snapshot_path, from_firestore=False):
+    """Catalog movies from the snapshot, or from Firestore when there is none (or when asked)"""
+    if not from_firestore:
+        catalog = MovieCatalog.load_snapshot(snapshot_path)
+        if catalog is not None:
+            return [catalog.movies[row] for row in np.flatnonzero(catalog.live)]
+    return [decode_movie_document(doc, fallback_id=document_path(doc)[-1]) for doc in iter_collection('movies')]
+
+
+def main():
+    load_dotenv('movie_api.env')
+    parser = argparse.ArgumentParser(description="Enrich catalog movies with TMDB keywords, director and popularity")
+    parser.add_argument('--snapshot', default=os.getenv('CATALOG_SNAPSHOT_PATH', 'catalog_snapshot'))
+    parser.add_argument('--output', default=os.getenv('TMDB_ENRICHMENT_PATH', DEFAULT_ENRICHMENT_PATH),
+                        help="Enrichment file, also the resume checkpoint")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL, help="Seconds a cached TMDB response stays valid")
+    parser.add_argument('--base-url', default=os.getenv('TMDB_BASE_URL', DEFAULT_BASE_URL))
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help="TMDB requests per second")
+    parser.add_argument('--burst', type=float, help="Requests allowed back to back (default: one second's worth)")
+    parser.add_argument('--limit', type=int, help="Enrich at most this many movies")
+    parser.add_argument('--refresh', action='store_true', help="Re-enrich movies already in the enrichment file")
+    parser.add_argument('--checkpoint-every', type=int, default=50)
+    parser.add_argument('--from-firestore', action='store_true', help="Read movies from Firestore instead of the snapshot")
+    parser.add_argument('--no-snapshot', action='store_true', help="Only write the enrichment file")
+    args = parser.parse_args()
+
+    api_key = os.getenv('TMDB_API_KEY')
+    if not api_key:
+        print("[ERROR] TMDB_API_KEY not found in environment variables or movie_api.env")
+        sys.exit(1)
+
+    movies = load_movies(args.snapshot, args.from_firestore)
+    if args.limit:
+        movies = movies[:args.limit]
+    store = EnrichmentStore(args.output)
+    store.reload()
+    client = TMDBClient(api_key, args.base_url, TokenBucket(args.rate, args.burst), ResponseCache(args.cache_dir, args.cache_ttl))
+
+    started = time.time()
+    counts = enrich_catalog(movies, client, store, args.workers, args.refresh, args.checkpoint_every)
+    elapsed = time.time() - started
+    print(json.dumps({**counts, **client.stats, 'elapsed_seconds': round(elapsed, 2)}, indent=2))
+    print(f"[SUCCESS] Wrote enrichment for {len(store.movies)} movies to {args.output}")
+
+    if not args.no_snapshot:
+        rebuild_snapshot(args.snapshot, store)
+
+
+if __name__ == "__main__":
+    main()
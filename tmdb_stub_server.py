@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the TMDB v3 endpoints tmdb_enrichment.py uses
+
+Serves /3/movie/{id} (with append_to_response=credits,keywords) and
+/3/search/movie. Movies come from a seed file, or are generated
+deterministically from the id with --synthetic. Requests beyond --rate per
+second get 429 with Retry-After, like the real API, so the client's
+throttling and retries can be exercised:
+
+    python tmdb_stub_server.py --port 8090 --synthetic --rate 40
+    TMDB_API_KEY=test python tmdb_enrichment.py --base-url http://127.0.0.1:8090/3
+
+The seed file maps TMDB ids to {"title", "release_date", "popularity",
+"director", "keywords": [...]}.
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = '/3'
+SYNTHETIC_KEYWORDS = ['heist', 'time travel', 'revenge', 'friendship', 'dystopia', 'based on novel', 'space',
+                      'coming of age', 'survival', 'detective', 'artificial intelligence', 'family']
+
+
+class TMDBStub:
+    """Movies by TMDB id plus request counters and a per-second request limit"""
+
+    def __init__(self, movies=None, synthetic=False, rate_limit=0):
+        self.movies = {int(movie_id): movie for movie_id, movie in (movies or {}).items()}
+        self.synthetic = synthetic
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.window = (0, 0)
+        self.stats = {'requests': 0, 'throttled': 0}
+
+    def movie(self, movie_id):
+        if movie_id in self.movies:
+            return self.movies[movie_id]
+        if not self.synthetic:
+            return None
+        rng = random.Random(movie_id)
+        return {
+            'title': f"Movie {movie_id}",
+            'release_date': f"{rng.randint(1990, 2024)}-01-01",
+            'popularity': round(rng.uniform(1, 500), 3),
+            'director': f"Director {movie_id % 97}",
+            'keywords': rng.sample(SYNTHETIC_KEYWORDS, 3),
+        }
+
+    def admit(self):
+        """Count a request; False if it exceeds this second's limit"""
+        with self.lock:
+            self.stats['requests'] += 1
+            second = int(time.time())
+            count = self.window[1] + 1 if self.window[0] == second else 1
+            self.window = (second, count)
+            if self.rate_limit and count > self.rate_limit:
+                self.stats['throttled'] += 1
+                return False
+            return True
+
+    def details(self, movie_id, append):
+        movie = self.movie(movie_id)
+        if movie is None:
+            return None
+        body = {'id': movie_id, 'title': movie['title'], 'release_date': movie.get('release_date', ''),
+                'popularity': movie.get('popularity', 0)}
+        if 'credits' in append:
+            body['credits'] = {'cast': [], 'crew': [{'job': 'Director', 'name': movie['director']}] if movie.get('director') else []}
+        if 'keywords' in append:
+            body['keywords'] = {'keywords': [{'id': i, 'name': name} for i, name in enumerate(movie.get('keywords', []))]}
+        return body
+
+    def search(self, query, year=None):
+        results = [{'id': movie_id, 'title': movie['title'], 'popularity': movie.get('popularity', 0)}
+                   for movie_id, movie in self.movies.items()
+                   if movie['title'].lower() == query.lower() and (not year or movie.get('release_date', '').startswith(year))]
+        return {'page': 1, 'results': results, 'total_results': len(results)}
+
+
+def make_handler(stub):
+    class TMDBStubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            parsed = urlparse(self.path)
+            params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+            if not params.get('api_key'):
+                return self._send(401, {'status_code': 7, 'status_message': 'Invalid API key'})
+            if not stub.admit():
+                return self._send(429, {'status_code': 25, 'status_message': 'Request count over limit'}, {'Retry-After': '1'})
+
+            path = parsed.path[len(API_PREFIX):] if parsed.path.startswith(API_PREFIX) else None
+            if path == '/search/movie':
+                return self._send(200, stub.search(params.get('query', ''), params.get('year')))
+            if path and path.startswith('/movie/') and path[len('/movie/'):].isdigit():
+                append = params.get('append_to_response', '').split(',')
+                body = stub.details(int(path[len('/movie/'):]), append)
+                if body is not None:
+                    return self._send(200, body)
+            return self._send(404, {'status_code': 34, 'status_message': 'The resource you requested could not be found.'})
+
+    return TMDBStubHandler
+
+
+def start_stub_server(stub=None, host='127.0.0.1', port=0):
+    """Serve a TMDBStub on a background thread; returns (server, API base URL)"""
+    stub = stub or TMDBStub(synthetic=True)
+    server = ThreadingHTTPServer((host, port), make_handler(stub))
+    server.stub = stub
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local TMDB API stand-in")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--seed', help="JSON fixture of {tmdb id: movie}")
+    parser.add_argument('--synthetic', action='store_true', help="Answer for any id with generated data")
+    parser.add_argument('--rate', type=int, default=40, help="Requests per second before answering 429 (0 = unlimited)")
+    args = parser.parse_args()
+
+    movies = {}
+    if args.seed:
+        with open(args.seed, encoding='utf-8') as f:
+            movies = json.load(f)
+        print(f"[INFO] Seeded {len(movies)} movies from {args.seed}")
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(TMDBStub(movies, args.synthetic, args.rate)))
+    print(f"[SUCCESS] TMDB stand-in listening on http://{args.host}:{args.port}{API_PREFIX}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Sampled capture of recommendation requests for replay
+
+When TRAFFIC_CAPTURE_PATH is set, a TRAFFIC_CAPTURE_RATE fraction of
+/recommend and /recommend/new-user request bodies is appended to a rotating
+NDJSON file, one {"ts", "endpoint", "args", "body"} object per line. User IDs
+are replaced by a keyed hash, so a user's requests stay linked within a
+capture without revealing who they are. Requests that only sent a
+history_hash are recorded with the history it resolved to, so a replay
+against a fresh server does not need the original cache.
+
+replay_traffic.py drives these captures against a server.
+"""
+
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from logging.handlers import RotatingFileHandler
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+DEFAULT_BACKUPS = 5
+
+
+def anonymise_user_id(user_id, salt):
+    """Keyed hash of a user id; the same id maps to the same value for a given salt"""
+    digest = hmac.new(salt.encode('utf-8'), str(user_id).encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"anon-{digest[:16]}"
+
+
+class TrafficRecorder:
+    """Sampled, anonymised request capture to a size-rotated NDJSON file"""
+
+    def __init__(self, path, sample_rate=DEFAULT_SAMPLE_RATE, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS, salt=None):
+        self.path = path
+        self.sample_rate = sample_rate
+        # A random per-process salt unless one is configured to link users across restarts
+        self.salt = salt or os.urandom(16).hex()
+        self.stats = {'seen': 0, 'captured': 0}
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        self.logger = logging.getLogger(f'traffic_capture.{path}')
+        self.logger.handlers = [handler]
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def record(self, endpoint, body, args=None, booking_history=None):
+        """Capture one request with probability sample_rate; booking_history is the history a history_hash resolved to"""
+        self.stats['seen'] += 1
+        if random.random() >= self.sample_rate:
+            return False
+        body = dict(body)
+        if body.get('user_id'):
+            body['user_id'] = anonymise_user_id(body['user_id'], self.salt)
+        if 'history_hash' in body and booking_history is not None:
+            del body['history_hash']
+            body['booking_history_compact'] = [[b.get('movieId'), b.get('bookingDate'), b.get('status')] for b in booking_history]
+        line = {'ts': time.time(), 'endpoint': endpoint, 'args': dict(args or {}), 'body': body}
+        self.logger.info(json.dumps(line, separators=(',', ':'), ensure_ascii=False, default=str))
+        self.stats['captured'] += 1
+        return True
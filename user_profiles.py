@@ -0,0 +1,96 @@
+"""
+Recency-weighted user profiles
+
+Each booking counts with an exponentially decaying weight (a booking one
+half-life old counts half as much as one made today) and cancelled or
+refunded bookings do not count at all. The weighted attribute totals come
+from one sparse product over the catalog's movie x attribute matrix.
+"""
+
+from datetime import datetime
+
+import numpy as np
+
+from movie_catalog import movie_attributes, numeric_value
+
+DEFAULT_HALF_LIFE_DAYS = 180.0
+EXCLUDED_BOOKING_STATUSES = frozenset({'cancelled', 'canceled', 'refunded'})
+
+PROFILE_KEYS = {
+    'genre': 'preferred_genres',
+    'actor': 'preferred_actors',
+    'director': 'preferred_directors',
+}
+
+
+def booking_day(booking):
+    """Date of a booking from its normalised bookingDate, falling back to the show date; None if neither parses"""
+    for field in ('bookingDate', 'date'):
+        value = booking.get(field)
+        if isinstance(value, str) and len(value) >= 10:
+            try:
+                return datetime.strptime(value[:10], '%Y-%m-%d')
+            except ValueError:
+                continue
+    return None
+
+
+def booking_weight(booking, now, half_life_days=DEFAULT_HALF_LIFE_DAYS):
+    """0.5 ** (age / half-life); undated bookings keep full weight as before"""
+    day = booking_day(booking)
+    if day is None or half_life_days <= 0:
+        return 1.0
+    age_days = max((now - day).days, 0)
+    return 0.5 ** (age_days / half_life_days)
+
+
+def counted_bookings(booking_history):
+    """Bookings that count towards a profile (not cancelled or refunded)"""
+    return [booking for booking in booking_history
+            if str(booking.get('status') or '').lower() not in EXCLUDED_BOOKING_STATUSES]
+
+
+def movie_weights(booking_history, now=None, half_life_days=DEFAULT_HALF_LIFE_DAYS):
+    """{movie id: summed decayed weight} over bookings that still count"""
+    now = now or datetime.now()
+    weights = {}
+    for booking in counted_bookings(booking_history):
+        movie_id = str(booking.get('movieId') or '')
+        if movie_id:
+            weights[movie_id] = weights.get(movie_id, 0.0) + booking_weight(booking, now, half_life_days)
+    return weights
+
+
+def build_user_profile(catalog, weights, other_movies=None):
+    """Aggregate a profile from {movie id: weight} for catalog movies plus [(movie, weight)] for movies outside it"""
+    other_movies = other_movies or []
+    rows = np.array([catalog.row_by_id[movie_id] for movie_id in weights], dtype=np.int64)
+    row_weights = np.array(list(weights.values()), dtype=np.float32)
+
+    attributes = catalog.aggregate_attributes(rows, row_weights)
+    total_weight = float(row_weights.sum())
+    rating_total = float(row_weights @ catalog.numeric['vote_average'][rows]) if len(rows) else 0.0
+    runtime_total = float(row_weights @ catalog.numeric['runtime'][rows]) if len(rows) else 0.0
+
+    # Movies outside the catalog (e.g. mock data) are rare enough to fold in one by one
+    for movie, weight in other_movies:
+        for attribute in set(movie_attributes(movie)):
+            attributes[attribute] = attributes.get(attribute, 0.0) + weight
+        total_weight += weight
+        rating_total += weight * numeric_value(movie, 'vote_average')
+        runtime_total += weight * numeric_value(movie, 'runtime')
+
+    if total_weight <= 0:
+        return None
+
+    profile = {key: {} for key in PROFILE_KEYS.values()}
+    for (kind, value), weight in attributes.items():
+        profile[PROFILE_KEYS[kind]][value] = round(weight, 4)
+    profile.update({
+        'avg_rating_preference': rating_total / total_weight,
+        'avg_runtime_preference': runtime_total / total_weight,
+        'total_bookings': len(rows) + len(other_movies),
+        # Preference scores are normalised by the decayed weight rather than the raw booking count
+        'total_weight': total_weight,
+    })
+    return profile